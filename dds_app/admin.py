@@ -1,7 +1,15 @@
 from django.contrib import admin
 
 from .forms import CashFlowStatementForm
-from .models import CashFlowStatement, Category, Status, Subcategory, Type
+from .models import (
+    CashFlowRollup,
+    CashFlowStatement,
+    Category,
+    FilterPreset,
+    Status,
+    Subcategory,
+    Type,
+)
 
 
 @admin.register(Type)
@@ -88,3 +96,37 @@ class CashFlowStatementAdmin(admin.ModelAdmin):
                 "status",
                 "comment",
             )
+
+
+@admin.register(CashFlowRollup)
+class CashFlowRollupAdmin(admin.ModelAdmin):
+    """Админ-класс для агрегатов ДДС (только просмотр, данные считаются сами)"""
+
+    list_display = (
+        "period",
+        "period_start",
+        "type",
+        "category",
+        "subcategory",
+        "status",
+        "total",
+        "count",
+        "user",
+    )
+    list_filter = ("period", "user")
+    date_hierarchy = "period_start"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(FilterPreset)
+class FilterPresetAdmin(admin.ModelAdmin):
+    """Админ-класс для сохранённых фильтров"""
+
+    list_display = ("id", "name", "user")
+    search_fields = ("name",)
+    fields = ("name", "params", "user")
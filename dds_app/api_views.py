@@ -0,0 +1,447 @@
+import hashlib
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError
+from django.forms.models import model_to_dict
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
+
+from . import rollups
+from .bulk import DELETE, bulk_change
+from .forms import CashFlowStatementForm, get_reference_form
+from .models import CashFlowStatement
+from .pagination import InvalidCursor, KeysetPaginator
+from .reference_cache import REFERENCE_MODELS, get_references
+from .versions import STATEMENTS, bump_version
+from .views import CashFlowStatementFilterMixin, ReferenceJSONView
+
+# Поля записи в ответе API и атрибуты модели. Справочники передаются id,
+# названия клиент берёт из /api/references/<справочник>/ (там свой ETag)
+STATEMENT_FIELDS = {
+    "id": "id",
+    "custom_date": "custom_date",
+    "created_at": "created_at",
+    "type": "type_id",
+    "category": "category_id",
+    "subcategory": "subcategory_id",
+    "status": "status_id",
+    "amount": "amount",
+    "comment": "comment",
+    "archived": "archived",
+}
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API: клиент получает JSON с текстом и подробностями"""
+
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+    def response(self):
+        data = {"error": str(self)}
+        if self.errors is not None:
+            data["errors"] = self.errors
+        return json_response(data, status=self.status)
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data,
+        status=status,
+        encoder=DjangoJSONEncoder,
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
+
+
+def parse_fields(value, available):
+    """Поля из ?fields=id,amount в порядке available; без параметра - все"""
+    if not value:
+        return list(available)
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested.difference(available)
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return [name for name in available if name in requested]
+
+
+def get_reference_model(name):
+    try:
+        return REFERENCE_MODELS[name]
+    except KeyError:
+        raise ApiError(f"Неизвестный справочник «{name}»", status=404)
+
+
+def reference_fields(model):
+    """Поля справочника в API (имя → атрибут), без пользователя"""
+    return {
+        field.name: field.attname
+        for field in model._meta.fields
+        if field.name != "user"
+    }
+
+
+class ApiMixin(LoginRequiredMixin):
+    """Общая часть API: JSON-ответы, в том числе об ошибках и отсутствии входа"""
+
+    def handle_no_permission(self):
+        return json_response({"error": "Требуется вход"}, status=403)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return e.response()
+
+
+class ApiBatchMixin(ApiMixin):
+    """
+    Пакетные изменения одним запросом:
+    {"create": [...], "update": [...], "delete": [id, ...]}.
+    Сначала проверяются все элементы; если есть ошибки, не применяется ничего
+    """
+
+    # Не больше элементов во всех трёх списках вместе
+    max_records = 1000
+
+    def read_batch(self):
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise ApiError("Тело запроса - не JSON")
+        if not isinstance(data, dict) or set(data) - {"create", "update", "delete"}:
+            raise ApiError("Ожидается объект с ключами create, update и delete")
+        create = data.get("create") or []
+        update = data.get("update") or []
+        delete = data.get("delete") or []
+        if not all(isinstance(items, list) for items in (create, update, delete)):
+            raise ApiError("create, update и delete должны быть списками")
+        if len(create) + len(update) + len(delete) > self.max_records:
+            raise ApiError(f"Не больше {self.max_records} элементов в одном запросе")
+        if not all(isinstance(item, dict) for item in create + update):
+            raise ApiError("Элементы create и update должны быть объектами")
+        update_ids = [item.get("id") for item in update]
+        # bool - подкласс int: true из JSON не должен превращаться в id 1
+        if not all(type(pk) is int for pk in update_ids + delete):
+            raise ApiError("id в update и delete должны быть целыми числами")
+        if len(set(update_ids + delete)) < len(update_ids) + len(delete):
+            raise ApiError("Каждый id может встречаться в update и delete один раз")
+        return create, update, delete
+
+    def build_forms(self, operation, items, make_form, errors):
+        """Формы элементов; ошибки копятся в errors с операцией и номером элемента"""
+        forms = []
+        for index, item in enumerate(items):
+            form = make_form(item)
+            if form is None:
+                errors.append(
+                    {"op": operation, "index": index, "errors": "Запись не найдена"}
+                )
+                continue
+            unknown = set(item) - set(form.fields) - {"id"}
+            if unknown:
+                errors.append(
+                    {
+                        "op": operation,
+                        "index": index,
+                        "errors": f"Неизвестные поля: {', '.join(sorted(unknown))}",
+                    }
+                )
+            elif not form.is_valid():
+                errors.append(
+                    {
+                        "op": operation,
+                        "index": index,
+                        "errors": form.errors.get_json_data(),
+                    }
+                )
+            forms.append(form)
+        return forms
+
+    def form_data(self, instance, item):
+        """Текущие значения записи, поверх которых накладываются переданные поля"""
+        data = model_to_dict(instance)
+        data.update(item)
+        return data
+
+
+class ApiStatementListView(ApiMixin, CashFlowStatementFilterMixin, View):
+    """
+    Записи пользователя: фильтры главной таблицы в параметрах запроса, сортировка
+    ?sort=, keyset-пагинация по ?cursor= и ?limit=, выбор полей ?fields=.
+    ETag зависит от версии записей пользователя и параметров, поэтому повторный
+    запрос без изменений получает 304 без обращения к таблице записей
+    """
+
+    default_limit = 100
+    max_limit = 1000
+
+    def get_saved_filter(self):
+        # Фильтр API задаётся только параметрами запроса, сессия не используется
+        return {}
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get("limit", self.default_limit))
+        except ValueError:
+            raise ApiError("limit должен быть целым числом")
+        if not 1 <= limit <= self.max_limit:
+            raise ApiError(f"limit - от 1 до {self.max_limit}")
+        return limit
+
+    def get_etag(self):
+        params = json.dumps(sorted(self.request.GET.lists()))
+        return (
+            f'"{self.request.user.pk}-{self.get_data_version()}-'
+            f'{hashlib.md5(params.encode()).hexdigest()}"'
+        )
+
+    def get(self, request, *args, **kwargs):
+        fields = parse_fields(request.GET.get("fields"), STATEMENT_FIELDS)
+        limit = self.get_limit()
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = json_response(self.get_page(fields, limit))
+        response.headers["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_page(self, fields, limit):
+        queryset = self.get_filtered_queryset()
+        if not self.filter_form.is_valid():
+            raise ApiError(
+                "Некорректный фильтр", errors=self.filter_form.errors.get_json_data()
+            )
+        model = queryset.model
+        # Читаем только выбранные поля и поля сортировки, без JOIN со справочниками
+        columns = {
+            model._meta.get_field(STATEMENT_FIELDS[name]).name
+            for name in fields
+            if name != "archived" or hasattr(model, "archived")
+        }
+        columns.update(
+            model._meta.get_field(name.lstrip("-")).name
+            for name in self.list_ordering
+            if name.lstrip("-") not in queryset.query.annotations
+        )
+        queryset = queryset.select_related(None).only(*columns)
+
+        paginator = KeysetPaginator(queryset, limit, ordering=self.list_ordering)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidCursor as e:
+            raise ApiError(str(e))
+        return {
+            "results": [
+                {name: getattr(obj, STATEMENT_FIELDS[name], False) for name in fields}
+                for obj in page
+            ],
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+        }
+
+
+class ApiStatementBatchView(ApiBatchMixin, View):
+    """
+    Пакетное создание, изменение и удаление записей в одной транзакции. Вставка -
+    bulk_create, изменение - bulk_update, удаление - один DELETE; агрегаты
+    обновляются по старым и новым значениям сразу для всего пакета
+    """
+
+    def post(self, request, *args, **kwargs):
+        create, update, delete = self.read_batch()
+        user = request.user
+        references = get_references(user)
+        errors = []
+
+        with transaction.atomic():
+            instances = CashFlowStatement.objects.select_for_update().in_bulk(
+                [item["id"] for item in update]
+            )
+            instances = {
+                pk: obj for pk, obj in instances.items() if obj.user_id == user.pk
+            }
+            old = [rollups.statement_values(obj) for obj in instances.values()]
+
+            created = self.build_forms(
+                "create",
+                create,
+                lambda item: CashFlowStatementForm(
+                    item, user=user, references=references
+                ),
+                errors,
+            )
+            updated = self.build_forms(
+                "update",
+                update,
+                lambda item: (
+                    CashFlowStatementForm(
+                        self.form_data(instances[item["id"]], item),
+                        instance=instances[item["id"]],
+                        user=user,
+                        references=references,
+                    )
+                    if item["id"] in instances
+                    else None
+                ),
+                errors,
+            )
+            if errors:
+                raise ApiError("Пакет не применён: есть ошибки", errors=errors)
+
+            today = timezone.localdate()
+            new_objects = []
+            for form in created:
+                form.instance.user = user
+                form.instance.custom_date = form.instance.custom_date or today
+                new_objects.append(form.instance)
+            CashFlowStatement.objects.bulk_create(new_objects)
+
+            changed = [form.instance for form in updated]
+            for obj in changed:
+                obj.custom_date = obj.custom_date or today
+            CashFlowStatement.objects.bulk_update(
+                changed, CashFlowStatementForm.Meta.fields
+            )
+
+            # bulk_create и bulk_update не вызывают сигналы - агрегаты обновляем сами
+            rollups.apply_changes(
+                old, [rollups.statement_values(obj) for obj in new_objects + changed]
+            )
+            deleted = bulk_change(user, delete, DELETE) if delete else 0
+            if new_objects or changed:
+                bump_version(STATEMENTS, user.pk)
+
+        return json_response(
+            {
+                "created": [obj.pk for obj in new_objects],
+                "updated": [obj.pk for obj in changed],
+                "deleted": deleted,
+            }
+        )
+
+
+class ApiReferenceListView(ApiMixin, ReferenceJSONView):
+    """Справочник пользователя целиком из кэша справочников, с ETag по его версии"""
+
+    def get_data(self, references):
+        model = get_reference_model(self.kwargs["model"])
+        available = reference_fields(model)
+        fields = parse_fields(self.request.GET.get("fields"), available)
+        return {
+            "results": [
+                {name: getattr(obj, available[name]) for name in fields}
+                for obj in references[self.kwargs["model"]]
+            ],
+            "next": None,
+        }
+
+
+class ApiReferenceBatchView(ApiBatchMixin, View):
+    """
+    Пакетные изменения справочника в одной транзакции. Справочников немного,
+    поэтому они сохраняются по одному: сигналы сами меняют версию кэша справочников
+    """
+
+    def batch_duplicates(self, model, created, updated):
+        """
+        Элементы, повторяющие ключ уникальности другого элемента того же пакета:
+        формы сверяют ключ только с уже сохранёнными элементами справочника
+        """
+        errors = []
+        seen = set()
+        for operation, forms in (("create", created), ("update", updated)):
+            for index, form in enumerate(forms):
+                for fields in model._meta.unique_together:
+                    key = (fields,) + tuple(
+                        form.instance.serializable_value(name) for name in fields
+                    )
+                    if key in seen:
+                        form.add_error(
+                            None, form.instance.unique_error_message(model, fields)
+                        )
+                        errors.append(
+                            {
+                                "op": operation,
+                                "index": index,
+                                "errors": form.errors.get_json_data(),
+                            }
+                        )
+                        break
+                    seen.add(key)
+        return errors
+
+    def post(self, request, *args, **kwargs):
+        model = get_reference_model(self.kwargs["model"])
+        form_class = get_reference_form(self.kwargs["model"])
+        create, update, delete = self.read_batch()
+        user = request.user
+        initial = {"user": user}
+        errors = []
+
+        try:
+            with transaction.atomic():
+                instances = model.objects.filter(
+                    user=user, pk__in=[item["id"] for item in update]
+                ).in_bulk()
+                created = self.build_forms(
+                    "create",
+                    create,
+                    lambda item: form_class(item, initial=initial),
+                    errors,
+                )
+                updated = self.build_forms(
+                    "update",
+                    update,
+                    lambda item: (
+                        form_class(
+                            self.form_data(instances[item["id"]], item),
+                            instance=instances[item["id"]],
+                            initial=initial,
+                        )
+                        if item["id"] in instances
+                        else None
+                    ),
+                    errors,
+                )
+                if not errors:
+                    errors = self.batch_duplicates(model, created, updated)
+                if errors:
+                    raise ApiError("Пакет не применён: есть ошибки", errors=errors)
+
+                for form in created:
+                    form.instance.user = user
+                    form.save()
+                for form in updated:
+                    form.save()
+                deleted = 0
+                if delete:
+                    deleted = (
+                        model.objects.filter(user=user, pk__in=delete)
+                        .delete()[1]
+                        .get(model._meta.label, 0)
+                    )
+        except ProtectedError:
+            raise ApiError("Справочник используется в записях", status=409)
+        except IntegrityError:
+            # Дубли и смена родителя используемого справочника уже проверены формами;
+            # сюда попадают только изменения, сделанные параллельно с пакетом
+            raise ApiError(
+                "Справочник изменился во время применения пакета, повторите запрос",
+                status=409,
+            )
+
+        return json_response(
+            {
+                "created": [form.instance.pk for form in created],
+                "updated": [form.instance.pk for form in updated],
+                "deleted": deleted,
+            }
+        )
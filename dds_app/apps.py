@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DdsAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "dds_app"
+
+    def ready(self):
+        # Подключаем обработчики сигналов (инкрементальные агрегаты,
+        # счётчик SQL-запросов)
+        from . import metrics, signals  # noqa: F401
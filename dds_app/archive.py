@@ -0,0 +1,124 @@
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Max
+
+from .models import ArchivedCashFlowStatement, CashFlowStatement
+from .signals import mute_statement_signals
+from .versions import STATEMENTS, bump_version
+
+# Столбцы, переносимые между основной таблицей и архивом вместе с id
+FIELDS = (
+    "id",
+    "user_id",
+    "created_at",
+    "custom_date",
+    "type_id",
+    "category_id",
+    "subcategory_id",
+    "status_id",
+    "amount",
+    "comment",
+)
+# Граница архива зависит от версии записей пользователя: архивация её меняет
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _bound_key(user_id, version):
+    return f"dds:archive:{user_id}:{version}"
+
+
+def _no_archive(bound):
+    # В кэше None означает промах, поэтому пустой архив храним как False
+    return None if bound is False else bound
+
+
+def get_archive_bound(user_id, version):
+    """Последняя дата записи в архиве пользователя (None - архив пуст)"""
+    key = _bound_key(user_id, version)
+    bound = cache.get(key)
+    if bound is None:
+        bound = (
+            ArchivedCashFlowStatement.objects.filter(user_id=user_id).aggregate(
+                bound=Max("custom_date")
+            )["bound"]
+            or False
+        )
+        cache.set(key, bound, CACHE_TIMEOUT)
+    return _no_archive(bound)
+
+
+async def aget_archive_bound(user_id, version):
+    """Асинхронный вариант get_archive_bound"""
+    key = _bound_key(user_id, version)
+    bound = await cache.aget(key)
+    if bound is None:
+        result = await ArchivedCashFlowStatement.objects.filter(
+            user_id=user_id
+        ).aaggregate(bound=Max("custom_date"))
+        bound = result["bound"] or False
+        await cache.aset(key, bound, CACHE_TIMEOUT)
+    return _no_archive(bound)
+
+
+def _copy(source, target, ids, using):
+    """
+    INSERT ... SELECT по id: строки копируются в БД как есть, без передачи в Python
+    и без auto_now_add, который при bulk_create заменил бы created_at сегодняшней датой
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(name) for name in FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(target._meta.db_table)} ({columns})"
+            f" SELECT {columns} FROM {quote(source._meta.db_table)}"
+            f" WHERE {quote('id')} IN ({', '.join(['%s'] * len(ids))})",
+            ids,
+        )
+
+
+def _move(source, target, queryset, batch_size):
+    """
+    Переносим записи порциями: копия в target с теми же id и удаление из source
+    в одной транзакции. Агрегаты не меняются - они считаются по обеим таблицам,
+    поэтому обработчики удаления записей на время переноса отключены
+    """
+    moved = 0
+    users = set()
+    while True:
+        with transaction.atomic():
+            rows = list(
+                queryset.select_for_update()
+                .order_by("pk")
+                .values_list("id", "user_id")[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [pk for pk, _ in rows]
+            _copy(source, target, ids, queryset.db)
+            with mute_statement_signals():
+                source.objects.filter(pk__in=ids).delete()
+            batch_users = {user_id for _, user_id in rows}
+            for user_id in batch_users:
+                bump_version(STATEMENTS, user_id)
+            users |= batch_users
+        moved += len(rows)
+    return moved, len(users)
+
+
+def archive_statements(before, user=None, batch_size=5000):
+    """Переносим в архив записи с датой раньше before"""
+    queryset = CashFlowStatement.objects.filter(custom_date__lt=before)
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    return _move(CashFlowStatement, ArchivedCashFlowStatement, queryset, batch_size)
+
+
+def restore_statements(since=None, user=None, batch_size=5000):
+    """Возвращаем из архива записи с датой не раньше since (все, если since не задан)"""
+    queryset = ArchivedCashFlowStatement.objects.all()
+    if since is not None:
+        queryset = queryset.filter(custom_date__gte=since)
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    return _move(ArchivedCashFlowStatement, CashFlowStatement, queryset, batch_size)
@@ -0,0 +1,186 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage
+from django.http import Http404, HttpResponseBadRequest
+from django.views import View
+from django.views.generic import ListView
+
+from .archive import aget_archive_bound
+from .balances import aget_checkpoints, attach_balances, first_month, running_queryset
+from .models import CashFlowStatement
+from .pagination import (
+    CachedCountPaginator,
+    InvalidCursor,
+    KeysetPaginator,
+    PageSnapshot,
+)
+from .reference_cache import aget_reference_version, aget_references
+from .search import aprepare_search
+from .versions import STATEMENTS, aget_version
+from .views import (
+    CashFlowStatementListMixin,
+    ReferenceAutocompleteMixin,
+    ReferenceJSONMixin,
+)
+
+# Асинхронные варианты самых частых запросов для работы под ASGI: пользователь, сессия,
+# кэш и ORM вызываются через async API, поэтому запрос не занимает поток из пула.
+# Всё, что синхронные представления читают по ходу (справочники, сохранённый фильтр,
+# версия данных), загружается заранее, а запрос строится общим синхронным кодом
+# без обращений к БД
+
+
+async def aget_user(request):
+    """
+    Пользователь запроса; request.user подменяется загруженным, чтобы не ходить
+    в БД синхронно
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+class AsyncCashFlowStatementFilterListView(CashFlowStatementListMixin, ListView):
+    """Асинхронный вариант CashFlowStatementFilterListView"""
+
+    def get_saved_filter(self):
+        return self.saved_filter
+
+    def get_data_version(self):
+        return self.data_version
+
+    def get_archive_bound(self):
+        return self.archive_bound
+
+    def get_filter_presets(self):
+        return self.filter_presets
+
+    def paginate_queryset(self, queryset, page_size):
+        # Страница уже получена асинхронно в get
+        return self.paginated
+
+    async def apaginate_cached(self, queryset, page_size):
+        """Асинхронное кэширование страницы из CashFlowStatementFilterListView"""
+        timeout = settings.DDS_PAGE_CACHE_TIMEOUT
+        key = self.get_page_cache_key(page_size) if timeout else None
+        snapshot = await cache.aget(key) if key else None
+        if snapshot is None:
+            paginated = await self.apaginate_queryset(queryset, page_size)
+            snapshot = PageSnapshot(paginated[1])
+            await self.aadd_balances(snapshot.object_list)
+            if key:
+                await cache.aset(key, snapshot, timeout)
+        return snapshot.as_paginated()
+
+    async def aadd_balances(self, rows):
+        """Асинхронный вариант add_balances"""
+        month = first_month(rows)
+        if month is None:
+            return
+        user_id = self.request.user.pk
+        checkpoints = await aget_checkpoints(
+            user_id, self.data_version, self.references
+        )
+        queryset = running_queryset(
+            self.get_statement_model(month), user_id, rows, self.references
+        )
+        running = {pk: value async for pk, value in queryset}
+        attach_balances(rows, checkpoints, running)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() == "keyset":
+            paginator = KeysetPaginator(
+                queryset, page_size, ordering=self.list_ordering
+            )
+            try:
+                page = await paginator.apage(self.request.GET.get("cursor"))
+            except InvalidCursor as e:
+                raise Http404(str(e))
+            return (paginator, page, page.object_list, page.has_other_pages())
+
+        paginator = self.get_paginator(
+            queryset,
+            page_size,
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        # Число записей получаем заранее, дальше Paginator к БД не обращается
+        if isinstance(paginator, CachedCountPaginator):
+            await paginator.aprefetch_count()
+        else:
+            paginator.count = await queryset.acount()
+
+        page_number = self.request.GET.get(self.page_kwarg) or 1
+        if page_number == "last":
+            page_number = paginator.num_pages
+        try:
+            if isinstance(paginator, CachedCountPaginator):
+                page = await paginator.apage(page_number)
+            else:
+                page = paginator.page(page_number)
+                page.object_list = [obj async for obj in page.object_list.aiterator()]
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    async def get(self, request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+
+        self.references = await aget_references(user)
+        self.saved_filter = await request.session.aget("dds_filter", {})
+        self.data_version = await aget_version(STATEMENTS, user.pk)
+        self.archive_bound = await aget_archive_bound(user.pk, self.data_version)
+        self.filter_presets = [preset async for preset in user.filter_presets.all()]
+        await aprepare_search(CashFlowStatement.objects.all())
+
+        self.object_list = self.get_filtered_queryset()
+        # Сохраняем фильтры в сессию
+        filter_data = self.get_changed_filter()
+        if filter_data is not None:
+            await request.session.aset("dds_filter", filter_data)
+        self.paginated = await self.apaginate_cached(
+            self.object_list, self.get_paginate_by(self.object_list)
+        )
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncReferenceAutocomplete(ReferenceAutocompleteMixin, ReferenceJSONMixin, View):
+    """Асинхронный вариант ReferenceAutocomplete"""
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.forwarded = json.loads(request.GET.get("forward", "{}"))
+        except ValueError:
+            return HttpResponseBadRequest("Invalid JSON data")
+        if not isinstance(self.forwarded, dict):
+            return HttpResponseBadRequest("Not a JSON object")
+        self.q = request.GET.get("q", "")
+
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            raise PermissionDenied
+
+        version = await aget_reference_version(user.pk)
+        response = self.not_modified(version)
+        if response is None:
+            references = await aget_references(user)
+            version = references.version
+            response = self.render_json(references)
+        return self.patch_response(response, version)
+
+
+class AsyncSubcategoryAutocomplete(AsyncReferenceAutocomplete):
+    """Динамическая подгрузка подкатегорий"""
+
+    reference = "subcategory"
+
+
+class AsyncCategoryAutocomplete(AsyncReferenceAutocomplete):
+    """Динамическая подгрузка категорий"""
+
+    reference = "category"
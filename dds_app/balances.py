@@ -0,0 +1,131 @@
+from bisect import bisect_left
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, DecimalField, F, Q, Sum, When, Window
+from django.db.models.functions import TruncMonth
+
+from .models import CashFlowRollup, Type
+
+# Остаток после записи - сумма всех записей пользователя до неё включительно в порядке
+# (custom_date, id), приход со знаком плюс, расход - минус. Он складывается из остатка
+# на начало месяца (контрольные точки из месячных агрегатов, которые обновляются при
+# каждой записи) и накопленной суммы внутри месяца, посчитанной оконной функцией
+# только по началу месяца до записей страницы
+CACHE_TIMEOUT = 24 * 60 * 60
+# SQLite считает суммы в float, поэтому остатки округляем до копеек
+CENTS = Decimal("0.01")
+
+
+def signed_amount(field, inflow_types):
+    """Сумма со знаком по направлению типа"""
+    return Case(
+        When(type_id__in=inflow_types, then=F(field)),
+        default=-F(field),
+        output_field=DecimalField(max_digits=18, decimal_places=2),
+    )
+
+
+def inflow_types(references):
+    return [t.pk for t in references.types if t.direction == Type.INFLOW]
+
+
+class Checkpoints:
+    """Остатки пользователя на начало каждого месяца, в котором есть записи"""
+
+    def __init__(self, rows):
+        self.months = []
+        self.balances = []
+        balance = Decimal("0.00")
+        for month, net in rows:
+            self.months.append(month)
+            self.balances.append(balance)
+            balance += Decimal(net or 0).quantize(CENTS)
+        self.total = balance
+
+    def opening(self, month):
+        """Остаток на начало месяца: сумма всех более ранних месяцев"""
+        index = bisect_left(self.months, month)
+        return self.balances[index] if index < len(self.months) else self.total
+
+
+def _checkpoints_key(user_id, version, references):
+    return f"dds:balance:{user_id}:{version}:{references.version}"
+
+
+def _checkpoints_queryset(user_id, references):
+    return (
+        CashFlowRollup.objects.filter(user_id=user_id, period=CashFlowRollup.MONTH)
+        .values("period_start")
+        .annotate(net=Sum(signed_amount("total", inflow_types(references))))
+        .order_by("period_start")
+        .values_list("period_start", "net")
+    )
+
+
+def get_checkpoints(user_id, version, references):
+    """Контрольные точки из кэша; при промахе - один GROUP BY по месячным агрегатам"""
+    key = _checkpoints_key(user_id, version, references)
+    checkpoints = cache.get(key)
+    if checkpoints is None:
+        checkpoints = Checkpoints(_checkpoints_queryset(user_id, references))
+        cache.set(key, checkpoints, CACHE_TIMEOUT)
+    return checkpoints
+
+
+async def aget_checkpoints(user_id, version, references):
+    """Асинхронный вариант get_checkpoints"""
+    key = _checkpoints_key(user_id, version, references)
+    checkpoints = await cache.aget(key)
+    if checkpoints is None:
+        rows = [row async for row in _checkpoints_queryset(user_id, references)]
+        checkpoints = Checkpoints(rows)
+        await cache.aset(key, checkpoints, CACHE_TIMEOUT)
+    return checkpoints
+
+
+def first_month(rows):
+    """Самый ранний месяц среди записей страницы (None, если дат нет)"""
+    dates = [row.custom_date for row in rows if row.custom_date is not None]
+    return min(dates).replace(day=1) if dates else None
+
+
+def running_queryset(model, user_id, rows, references):
+    """
+    Накопленная сумма внутри месяца для записей страницы. Читаются только записи
+    от начала каждого месяца страницы до её последней даты в этом месяце, поэтому
+    объём не зависит ни от глубины страницы, ни от длины истории
+    """
+    last_dates = {}
+    for row in rows:
+        if row.custom_date is not None:
+            month = row.custom_date.replace(day=1)
+            last_dates[month] = max(
+                last_dates.get(month, row.custom_date), row.custom_date
+            )
+    if not last_dates:
+        return model.objects.none().values_list("pk", "id")
+    condition = Q()
+    for month, last_date in last_dates.items():
+        condition |= Q(custom_date__gte=month, custom_date__lte=last_date)
+    return (
+        model.objects.filter(condition, user_id=user_id)
+        .annotate(
+            running=Window(
+                Sum(signed_amount("amount", inflow_types(references))),
+                partition_by=[TruncMonth("custom_date")],
+                order_by=[F("custom_date").asc(), F("id").asc()],
+            )
+        )
+        .values_list("pk", "running")
+    )
+
+
+def attach_balances(rows, checkpoints, running):
+    """Проставляем записям страницы атрибут balance (None для записей без даты)"""
+    for row in rows:
+        if row.custom_date is None or row.pk not in running:
+            row.balance = None
+        else:
+            opening = checkpoints.opening(row.custom_date.replace(day=1))
+            row.balance = opening + Decimal(running[row.pk]).quantize(CENTS)
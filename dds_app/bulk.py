@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import DateField, ExpressionWrapper, F, Value
+
+from . import rollups
+from .models import CashFlowStatement
+from .signals import mute_statement_signals
+from .versions import STATEMENTS, bump_version
+
+# Массовые действия над выбранными записями пользователя. Каждое - один UPDATE или
+# DELETE по id в одной транзакции; обработчики сигналов записей при этом отключены,
+# а агрегаты пересчитываются по старым и новым значениям строк сразу для всей порции
+DELETE = "delete"
+SET_STATUS = "status"
+MOVE = "move"
+SHIFT_DATES = "shift"
+
+ACTION_CHOICES = (
+    (DELETE, "Удалить"),
+    (SET_STATUS, "Сменить статус"),
+    (MOVE, "Перенести в подкатегорию"),
+    (SHIFT_DATES, "Сдвинуть даты"),
+)
+
+
+def _shifted(values, days):
+    if values["custom_date"] is None:
+        return values
+    return {**values, "custom_date": values["custom_date"] + timedelta(days=days)}
+
+
+def bulk_change(
+    user, ids, action, status=None, subcategory=None, category=None, days=0
+):
+    """
+    Применяем действие к записям пользователя из ids (чужие и архивные id
+    игнорируются). Для переноса передаются подкатегория и её категория, уже
+    проверенные формой; тип берётся из категории. Возвращаем число изменённых записей
+    """
+    with transaction.atomic():
+        queryset = CashFlowStatement.objects.filter(user=user, pk__in=ids)
+        old = list(queryset.select_for_update().values("pk", *rollups.ROLLUP_FIELDS))
+        if not old:
+            return 0
+        queryset = CashFlowStatement.objects.filter(pk__in=[row["pk"] for row in old])
+
+        if action == DELETE:
+            with mute_statement_signals():
+                queryset.delete()
+            new = []
+        elif action == SET_STATUS:
+            queryset.update(status=status)
+            new = [{**row, "status_id": status.pk} for row in old]
+        elif action == MOVE:
+            changes = {
+                "type_id": category.type_id,
+                "category_id": category.pk,
+                "subcategory_id": subcategory.pk,
+            }
+            queryset.update(**changes)
+            new = [{**row, **changes} for row in old]
+        elif action == SHIFT_DATES:
+            queryset.update(
+                custom_date=ExpressionWrapper(
+                    F("custom_date") + Value(timedelta(days=days)),
+                    output_field=DateField(),
+                )
+            )
+            new = [_shifted(row, days) for row in old]
+        else:
+            raise ValueError(f"Неизвестное действие {action}")
+
+        rollups.apply_changes(old, new)
+        bump_version(STATEMENTS, user.pk)
+    return len(old)
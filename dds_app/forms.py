@@ -1,7 +1,146 @@
 from dal import autocomplete
+from dal.widgets import WidgetMixin
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils.http import urlencode
 
-from .models import CashFlowStatement, Category, Status, Subcategory, Type
+from .bulk import ACTION_CHOICES, MOVE, SET_STATUS, SHIFT_DATES
+from .models import (
+    CashFlowStatement,
+    Category,
+    FilterPreset,
+    StatementWithArchive,
+    Status,
+    Subcategory,
+    Type,
+)
+from .reference_cache import REFERENCE_MODELS, REFERENCE_PARENTS, get_references
+from .reports import GROUP_CHOICES, MEASURE_CHOICES
+from .search import SEARCH_CONTAINS, SEARCH_MODE_CHOICES
+
+# Смена родителя справочника, который используется в записях (основных или архивных)
+PARENT_IN_USE_ERRORS = {
+    "category": "Нельзя сменить тип: категория используется в записях с текущим типом",
+    "subcategory": (
+        "Нельзя сменить категорию: подкатегория используется в записях "
+        "с текущей категорией"
+    ),
+}
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField, который после use_cache() берёт варианты и проверку значения
+    из кэша справочников пользователя, а не из запросов к БД
+    """
+
+    cached = None
+
+    def use_cache(self, objects):
+        self.cached = {str(obj.pk): obj for obj in objects}
+        self.widget.choices = self.choices
+
+    def _get_choices(self):
+        if self.cached is None:
+            return super()._get_choices()
+        choices = [("", self.empty_label)] if self.empty_label is not None else []
+        return choices + [
+            (pk, self.label_from_instance(obj)) for pk, obj in self.cached.items()
+        ]
+
+    choices = property(_get_choices, forms.ChoiceField.choices.fset)
+
+    def to_python(self, value):
+        if self.cached is None:
+            return super().to_python(value)
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        try:
+            return self.cached[str(value)]
+        except KeyError:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+
+class ReferenceSelect2(autocomplete.ModelSelect2):
+    """
+    ModelSelect2, который умеет рендерить варианты из кэша справочников.
+    С версией справочников (use_reference_cache) в URL автодополнения добавляется ?v=,
+    а в режиме DDS_AUTOCOMPLETE_PRELOAD варианты фильтруются на клиенте по дереву
+    справочников.
+    """
+
+    reference = None
+    version = None
+
+    @property
+    def preload(self):
+        return settings.DDS_AUTOCOMPLETE_PRELOAD and self.version is not None
+
+    @property
+    def media(self):
+        media = super().media
+        if settings.DDS_AUTOCOMPLETE_PRELOAD:
+            media += forms.Media(js=("js/reference_tree.js",))
+        return media
+
+    def build_attrs(self, *args, **kwargs):
+        attrs = super().build_attrs(*args, **kwargs)
+        if self.version is None:
+            return attrs
+        query = urlencode({"v": self.version})
+        attrs["data-autocomplete-light-url"] = f"{self.url}?{query}"
+        if self.preload:
+            attrs["data-autocomplete-light-function"] = "dds-reference-tree"
+            attrs["data-reference"] = self.reference
+            attrs["data-reference-parent"] = REFERENCE_PARENTS[self.reference]
+            attrs["data-reference-tree-url"] = f"{reverse('reference-tree')}?{query}"
+        return attrs
+
+    def filter_choices_to_render(self, selected_choices):
+        if isinstance(self.choices, list):
+            WidgetMixin.filter_choices_to_render(self, selected_choices)
+        else:
+            super().filter_choices_to_render(selected_choices)
+
+
+def use_reference_cache(form, user, references=None):
+    """
+    Подключаем справочные поля формы к кэшу справочников пользователя.
+    references можно передать заранее загруженными (например, асинхронно)
+    """
+    if references is None:
+        references = get_references(user)
+    for name in REFERENCE_MODELS:
+        field = form.fields.get(name)
+        if isinstance(field, ReferenceChoiceField):
+            field.use_cache(references[name])
+            if isinstance(field.widget, ReferenceSelect2):
+                field.widget.reference = name
+                field.widget.version = references.version
+
+
+class ReferenceCacheFormMixin:
+    """ModelForm со справочными полями из кэша"""
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        # Значения справочных полей уже проверены по кэшу справочников пользователя,
+        # повторная проверка существования в ForeignKey.validate стоила бы запрос
+        # на каждое поле
+        exclude.update(
+            name
+            for name, field in self.fields.items()
+            if isinstance(field, ReferenceChoiceField) and field.cached is not None
+        )
+        return exclude
 
 
 def get_reference_form(model_name):
@@ -14,22 +153,27 @@ def get_reference_form(model_name):
     }
     model_class = models_map[model_name]
 
-    class ReferenceForm(forms.ModelForm):
+    class ReferenceForm(ReferenceCacheFormMixin, forms.ModelForm):
         """Динамическая форма для справочников"""
 
         class Meta:
             model = model_class
             fields = "__all__"
+            field_classes = {
+                "type": ReferenceChoiceField,
+                "category": ReferenceChoiceField,
+            }
 
         def __init__(self, *args, **kwargs):
             super().__init__(*args, **kwargs)
 
-            # Фильтруем связанные объекты
+            # Фильтруем связанные объекты: варианты берём из кэша справочников
+            # пользователя
             user = self.initial.get("user") or kwargs.get("initial", {}).get("user")
-            if model_class == Category and "type" in self.fields:
-                self.fields["type"].queryset = Type.objects.filter(user=user)
-            if model_class == Subcategory and "category" in self.fields:
-                self.fields["category"].queryset = Category.objects.filter(user=user)
+            if user is not None:
+                use_reference_cache(self, user)
+                if self.instance.user_id is None:
+                    self.instance.user = user
 
             # Пользователь задаётся в представлении
             if "user" in self.fields:
@@ -39,6 +183,39 @@ def get_reference_form(model_name):
             for field in self.fields.values():
                 field.widget.attrs.update({"class": "form-gold"})
 
+        def clean(self):
+            cleaned_data = super().clean()
+            # Триггеры БД (миграция 0006) не дадут сменить родителя справочника, который
+            # используют записи с прежним родителем: сообщаем об этом до сохранения
+            parent = REFERENCE_PARENTS.get(model_name)
+            if (
+                parent is not None
+                and self.instance.pk is not None
+                and parent in self.changed_data
+                and cleaned_data.get(parent) is not None
+                and StatementWithArchive.objects.filter(
+                    user=self.instance.user_id, **{model_name: self.instance}
+                )
+                .exclude(**{parent: cleaned_data[parent]})
+                .exists()
+            ):
+                self.add_error(parent, PARENT_IN_USE_ERRORS[model_name])
+            return cleaned_data
+
+        def validate_unique(self):
+            # Поля user нет в форме, а справочные поля исключены из проверок модели
+            # (ReferenceCacheFormMixin), поэтому ModelForm пропустил бы unique_together
+            # и дубль дошёл бы до IntegrityError. Проверяем ключ целиком
+            exclude = {
+                name
+                for name in self._get_validation_exclusions()
+                if name != "user" and (name not in self.fields or name in self.errors)
+            }
+            try:
+                self.instance.validate_unique(exclude=exclude)
+            except ValidationError as e:
+                self._update_errors(e)
+
     return ReferenceForm
 
 
@@ -59,17 +236,17 @@ class CashFlowStatementFilterForm(forms.Form):
             attrs={"type": "date", "placeholder": "ДД.ММ.ГГГГ", "class": "form-gold"}
         ),
     )
-    type = forms.ModelChoiceField(
+    type = ReferenceChoiceField(
         queryset=Type.objects.all(),
         required=False,
         label="Тип",
         widget=forms.Select(attrs={"class": "form-gold"}),
     )
-    category = forms.ModelChoiceField(
+    category = ReferenceChoiceField(
         label="Категория",
         queryset=Category.objects.all(),
         required=False,
-        widget=autocomplete.ModelSelect2(
+        widget=ReferenceSelect2(
             url="category-autocomplete",
             forward=["type"],
             attrs={
@@ -79,11 +256,11 @@ class CashFlowStatementFilterForm(forms.Form):
             },
         ),
     )
-    subcategory = forms.ModelChoiceField(
+    subcategory = ReferenceChoiceField(
         label="Подкатегория",
         queryset=Subcategory.objects.all(),
         required=False,
-        widget=autocomplete.ModelSelect2(
+        widget=ReferenceSelect2(
             url="subcategory-autocomplete",
             forward=["category"],
             attrs={
@@ -93,7 +270,7 @@ class CashFlowStatementFilterForm(forms.Form):
             },
         ),
     )
-    status = forms.ModelChoiceField(
+    status = ReferenceChoiceField(
         queryset=Status.objects.none(),
         required=False,
         label="Статус",
@@ -120,20 +297,170 @@ class CashFlowStatementFilterForm(forms.Form):
         label="Комментарий содержит",
         widget=forms.TextInput(attrs={"class": "form-gold", "placeholder": "..."}),
     )
+    comment_mode = forms.ChoiceField(
+        required=False,
+        label="Поиск по комментарию",
+        choices=SEARCH_MODE_CHOICES,
+        initial=SEARCH_CONTAINS,
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
 
     def __init__(self, *args, **kwargs):
         user = kwargs.pop("user", None)
+        references = kwargs.pop("references", None)
         super().__init__(*args, **kwargs)
 
         # После создания полей отфильтруем некоторые их них по пользователю
         if user is not None:
-            self.fields["type"].queryset = Type.objects.filter(user=user)
-            self.fields["category"].queryset = Category.objects.filter(user=user)
-            self.fields["subcategory"].queryset = Subcategory.objects.filter(user=user)
-            self.fields["status"].queryset = Status.objects.filter(user=user)
+            use_reference_cache(self, user, references)
+
+
+class CashFlowReportForm(forms.Form):
+    """Параметры месячного отчёта"""
+
+    # Не больше 20 лет в одном отчёте
+    max_months = 240
+
+    month_from = forms.DateField(
+        label="С месяца",
+        input_formats=["%Y-%m"],
+        widget=forms.DateInput(
+            format="%Y-%m", attrs={"type": "month", "class": "form-gold"}
+        ),
+    )
+    month_to = forms.DateField(
+        label="По месяц",
+        input_formats=["%Y-%m"],
+        widget=forms.DateInput(
+            format="%Y-%m", attrs={"type": "month", "class": "form-gold"}
+        ),
+    )
+    group = forms.ChoiceField(
+        label="Столбцы",
+        choices=GROUP_CHOICES,
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+    measure = forms.ChoiceField(
+        label="Показатель",
+        choices=MEASURE_CHOICES,
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        month_from = cleaned_data.get("month_from")
+        month_to = cleaned_data.get("month_to")
+        if month_from and month_to:
+            if month_from > month_to:
+                raise ValidationError("Начальный месяц позже конечного")
+            months = (month_to.year - month_from.year) * 12 + (
+                month_to.month - month_from.month
+            )
+            if months >= self.max_months:
+                raise ValidationError(
+                    f"Период отчёта - не больше {self.max_months} месяцев"
+                )
+        return cleaned_data
+
+
+class IdListField(forms.Field):
+    """Список id из повторяющегося параметра запроса"""
+
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return sorted({int(item) for item in value})
+        except (TypeError, ValueError):
+            raise ValidationError("Некорректный список записей", code="invalid")
+
+
+class CashFlowStatementBulkForm(forms.Form):
+    """Массовое действие над выбранными на главной странице записями"""
+
+    # На странице уже есть форма фильтра с теми же справочными полями
+    prefix = "bulk"
+    # Не больше записей за одно действие
+    max_records = 1000
+
+    ids = IdListField(error_messages={"required": "Не выбрано ни одной записи"})
+    action = forms.ChoiceField(
+        label="Действие",
+        choices=ACTION_CHOICES,
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+    status = ReferenceChoiceField(
+        queryset=Status.objects.all(),
+        required=False,
+        label="Статус",
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+    subcategory = ReferenceChoiceField(
+        queryset=Subcategory.objects.all(),
+        required=False,
+        label="Подкатегория",
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+    days = forms.IntegerField(
+        required=False,
+        min_value=-3650,
+        max_value=3650,
+        label="Сдвиг, дней",
+        widget=forms.NumberInput(attrs={"class": "form-gold", "placeholder": "дней"}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop("user")
+        references = kwargs.pop("references", None) or get_references(user)
+        super().__init__(*args, **kwargs)
+        use_reference_cache(self, user, references)
 
+        # Названия подкатегорий в разных категориях могут совпадать - показываем обе
+        self.categories = {category.pk: category for category in references.categories}
+        field = self.fields["subcategory"]
+        field.label_from_instance = (
+            lambda obj: f"{self.categories[obj.category_id].name} / {obj.name}"
+        )
+        field.widget.choices = field.choices
 
-class CashFlowStatementForm(forms.ModelForm):
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get("action")
+        if len(cleaned_data.get("ids", [])) > self.max_records:
+            raise ValidationError(
+                f"За одно действие можно изменить не больше {self.max_records} записей"
+            )
+        if action == SET_STATUS and not cleaned_data.get("status"):
+            self.add_error("status", "Выберите статус")
+        if action == MOVE:
+            subcategory = cleaned_data.get("subcategory")
+            if subcategory is None:
+                self.add_error("subcategory", "Выберите подкатегорию")
+            else:
+                # Иерархия проверяется один раз на всю порцию: категория и тип
+                # берутся от выбранной подкатегории
+                cleaned_data["category"] = self.categories[subcategory.category_id]
+        if action == SHIFT_DATES and not cleaned_data.get("days"):
+            self.add_error("days", "Укажите сдвиг в днях")
+        return cleaned_data
+
+
+class FilterPresetForm(forms.ModelForm):
+    """Название для сохранения текущего фильтра"""
+
+    class Meta:
+        model = FilterPreset
+        fields = ("name",)
+        widgets = {
+            "name": forms.TextInput(
+                attrs={"class": "form-gold", "placeholder": "Название фильтра"}
+            ),
+        }
+
+
+class CashFlowStatementForm(ReferenceCacheFormMixin, forms.ModelForm):
     """Форма для создания новой ДДС записи"""
 
     custom_date = forms.DateField(
@@ -141,10 +468,10 @@ class CashFlowStatementForm(forms.ModelForm):
         label="Дата",
         widget=forms.DateInput(attrs={"type": "date", "class": "form-gold"}),
     )
-    category = forms.ModelChoiceField(
+    category = ReferenceChoiceField(
         label="Категория",
         queryset=Category.objects.all(),
-        widget=autocomplete.ModelSelect2(
+        widget=ReferenceSelect2(
             url="category-autocomplete",
             forward=["type"],
             attrs={
@@ -154,10 +481,10 @@ class CashFlowStatementForm(forms.ModelForm):
             },
         ),
     )
-    subcategory = forms.ModelChoiceField(
+    subcategory = ReferenceChoiceField(
         label="Подкатегория",
         queryset=Subcategory.objects.all(),
-        widget=autocomplete.ModelSelect2(
+        widget=ReferenceSelect2(
             url="subcategory-autocomplete",
             forward=["category"],
             attrs={
@@ -167,12 +494,12 @@ class CashFlowStatementForm(forms.ModelForm):
             },
         ),
     )
-    type = forms.ModelChoiceField(
+    type = ReferenceChoiceField(
         queryset=Type.objects.all(),
         label="Тип",
         widget=forms.Select(attrs={"class": "form-gold"}),
     )
-    status = forms.ModelChoiceField(
+    status = ReferenceChoiceField(
         queryset=Status.objects.none(),
         label="Статус",
         widget=forms.Select(attrs={"class": "form-gold"}),
@@ -202,12 +529,80 @@ class CashFlowStatementForm(forms.ModelForm):
             "comment",
         ]
 
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop("user", None)
+        references = kwargs.pop("references", None)
+        super().__init__(*args, **kwargs)
+
+        if user is not None:
+            use_reference_cache(self, user, references)
+
+
+class CashFlowStatementImportForm(forms.Form):
+    """Форма пакетного импорта ДДС-записей из CSV или OFX"""
+
+    FORMAT_CHOICES = (
+        ("", "По расширению файла"),
+        ("csv", "CSV"),
+        ("ofx", "OFX"),
+    )
+
+    file = forms.FileField(
+        label="Файл",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-gold", "accept": ".csv,.ofx,.qfx"}
+        ),
+    )
+    file_format = forms.ChoiceField(
+        required=False,
+        label="Формат",
+        choices=FORMAT_CHOICES,
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+    type = ReferenceChoiceField(
+        queryset=Type.objects.none(),
+        required=False,
+        label="Тип по умолчанию",
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+    category = ReferenceChoiceField(
+        label="Категория по умолчанию",
+        queryset=Category.objects.none(),
+        required=False,
+        widget=ReferenceSelect2(
+            url="category-autocomplete",
+            forward=["type"],
+            attrs={
+                "data-theme": "bootstrap5",
+                "data-placeholder": "--------",
+                "class": "form-gold",
+            },
+        ),
+    )
+    subcategory = ReferenceChoiceField(
+        label="Подкатегория по умолчанию",
+        queryset=Subcategory.objects.none(),
+        required=False,
+        widget=ReferenceSelect2(
+            url="subcategory-autocomplete",
+            forward=["category"],
+            attrs={
+                "data-theme": "bootstrap5",
+                "data-placeholder": "--------",
+                "class": "form-gold",
+            },
+        ),
+    )
+    status = ReferenceChoiceField(
+        queryset=Status.objects.none(),
+        required=False,
+        label="Статус по умолчанию",
+        widget=forms.Select(attrs={"class": "form-gold"}),
+    )
+
     def __init__(self, *args, **kwargs):
         user = kwargs.pop("user", None)
         super().__init__(*args, **kwargs)
 
         if user is not None:
-            self.fields["type"].queryset = Type.objects.filter(user=user)
-            self.fields["category"].queryset = Category.objects.filter(user=user)
-            self.fields["subcategory"].queryset = Subcategory.objects.filter(user=user)
-            self.fields["status"].queryset = Status.objects.filter(user=user)
+            use_reference_cache(self, user)
@@ -0,0 +1,326 @@
+import codecs
+import csv
+import io
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import CashFlowStatement, Category, Status, Subcategory, Type
+from .versions import STATEMENTS, bump_version
+
+# Колонки CSV: заголовки выгрузки в CSV и ключи выгрузки в JSONL
+CSV_COLUMNS = {
+    "дата": "custom_date",
+    "custom_date": "custom_date",
+    "статус": "status",
+    "status": "status",
+    "тип": "type",
+    "type": "type",
+    "категория": "category",
+    "category": "category",
+    "подкатегория": "subcategory",
+    "subcategory": "subcategory",
+    "сумма": "amount",
+    "amount": "amount",
+    "комментарий": "comment",
+    "comment": "comment",
+}
+
+
+class RowError(ValueError):
+    """Ошибка в строке импортируемого файла"""
+
+
+def _key(name):
+    return (name or "").strip().casefold()
+
+
+def parse_date(value):
+    value = (value or "").strip()
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f"Некорректная дата «{value}»")
+
+
+def parse_amount(value):
+    value = re.sub(r"[\s ]", "", value or "").replace(",", ".")
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f"Некорректная сумма «{value}»")
+    if not amount.is_finite() or abs(amount) >= Decimal("1e10"):
+        raise RowError(f"Некорректная сумма «{value}»")
+    return amount.quantize(Decimal("0.01"))
+
+
+def read_csv(stream):
+    """Построчно читаем CSV с заголовком, отдаём (номер строки, словарь полей)"""
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(stream, dialect)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [CSV_COLUMNS.get(_key(title)) for title in header]
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        values = {
+            column: cell for column, cell in zip(columns, row) if column is not None
+        }
+        yield reader.line_num, values
+
+
+def _ofx_tokens(stream, chunk_size=65536):
+    """Разбиваем OFX (SGML или XML) на теги, не загружая файл целиком"""
+    buffer = ""
+    for chunk in iter(lambda: stream.read(chunk_size), ""):
+        buffer += chunk
+        *tokens, buffer = buffer.split("<")
+        yield from tokens
+    if buffer:
+        yield buffer
+
+
+def read_ofx(stream):
+    """Транзакции банковской выписки OFX: дата, сумма и описание"""
+    current = None
+    number = 0
+    for token in _ofx_tokens(stream):
+        tag, _, value = token.partition(">")
+        tag = tag.strip().upper()
+        value = value.strip()
+        if tag == "STMTTRN":
+            current = {}
+        elif tag == "/STMTTRN" and current is not None:
+            number += 1
+            comment = " ".join(
+                part for part in (current.get("NAME"), current.get("MEMO")) if part
+            )
+            # Знак TRNAMT - направление операции (списания отрицательные), а в записи
+            # направление задаёт тип, поэтому сумма хранится без знака
+            amount = current.get("TRNAMT", "").strip()
+            yield number, {
+                "custom_date": current.get("DTPOSTED", "")[:8],
+                "amount": amount.lstrip("+-"),
+                "direction": Type.OUTFLOW if amount.startswith("-") else Type.INFLOW,
+                "comment": comment,
+            }
+            current = None
+        elif current is not None and not tag.startswith("/"):
+            current[tag] = value
+
+
+def is_utf8(upload, chunk_size=65536):
+    """Читается ли файл целиком как UTF-8 (порциями, с возвратом в начало)"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for chunk in iter(lambda: upload.read(chunk_size), b""):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        upload.seek(0)
+    return True
+
+
+def open_upload(upload):
+    """
+    Текстовый поток загруженного файла: кодировка из OFX-заголовка, иначе UTF-8,
+    а если файл в UTF-8 не читается - cp1251 (CSV из Excel в русской локали)
+    """
+    head = upload.read(1024)
+    upload.seek(0)
+    encoding = "utf-8-sig"
+    if b"CHARSET:1251" in head.upper() or b'ENCODING="WINDOWS-1251"' in head.upper():
+        encoding = "cp1251"
+    elif not is_utf8(upload):
+        encoding = "cp1251"
+    return io.TextIOWrapper(upload, encoding=encoding, newline="")
+
+
+class ReferenceMap:
+    """
+    Справочники пользователя, загруженные в память одним набором запросов.
+    Иерархия тип → категория → подкатегория проверяется без обращений к БД.
+    """
+
+    def __init__(self, user):
+        self.types = {_key(t.name): t for t in Type.objects.filter(user=user)}
+        self.statuses = {_key(s.name): s for s in Status.objects.filter(user=user)}
+        self.categories = {}
+        for category in Category.objects.filter(user=user):
+            self.categories.setdefault(_key(category.name), []).append(category)
+        self.subcategories = {}
+        for subcategory in Subcategory.objects.filter(user=user):
+            self.subcategories.setdefault(_key(subcategory.name), []).append(
+                subcategory
+            )
+
+    def _get(self, mapping, name, message):
+        try:
+            return mapping[_key(name)]
+        except KeyError:
+            raise RowError(message.format(name=name))
+
+    def type(self, name):
+        return self._get(self.types, name, "Тип «{name}» не найден")
+
+    def status(self, name):
+        return self._get(self.statuses, name, "Статус «{name}» не найден")
+
+    def category(self, name, type):
+        for category in self._get(
+            self.categories, name, "Категория «{name}» не найдена"
+        ):
+            if category.type_id == type.pk:
+                return category
+        raise RowError(f"Категория «{name}» не принадлежит типу «{type}»")
+
+    def subcategory(self, name, category):
+        for subcategory in self._get(
+            self.subcategories, name, "Подкатегория «{name}» не найдена"
+        ):
+            if subcategory.category_id == category.pk:
+                return subcategory
+        raise RowError(f"Подкатегория «{name}» не принадлежит категории «{category}»")
+
+
+class ImportReport:
+    """Итог импорта: сколько записей создано, ошибки по строкам и ошибка файла"""
+
+    max_errors = 500
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        # Файл не удалось дочитать: строки до ошибки импортированы
+        self.file_error = None
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+
+class StatementImporter:
+    """
+    Пакетный импорт ДДС-записей: строки читаются потоком, справочники
+    разрешаются по ReferenceMap, записи вставляются bulk_create порциями,
+    каждая порция - в своей транзакции вместе с обновлением агрегатов.
+    """
+
+    batch_size = 1000
+
+    def __init__(self, user, defaults=None, batch_size=None):
+        self.user = user
+        self.defaults = defaults or {}
+        self.refs = ReferenceMap(user)
+        if batch_size:
+            self.batch_size = batch_size
+
+    def build(self, values):
+        """Собираем запись из строки файла; недостающие справочники берём из defaults"""
+        type = (
+            self.refs.type(values["type"])
+            if values.get("type")
+            else self.defaults.get("type")
+        )
+        status = (
+            self.refs.status(values["status"])
+            if values.get("status")
+            else self.defaults.get("status")
+        )
+        if type is None or status is None:
+            raise RowError("Не указан тип или статус")
+        direction = values.get("direction")
+        if direction is not None and type.direction != direction:
+            operation = "Списание" if direction == Type.OUTFLOW else "Поступление"
+            raise RowError(
+                f"{operation} не подходит к типу «{type}» "
+                f"({type.get_direction_display().lower()}): укажите тип с нужным "
+                "направлением в файле или по умолчанию"
+            )
+
+        category = self.defaults.get("category")
+        if values.get("category"):
+            category = self.refs.category(values["category"], type)
+        if category is None:
+            raise RowError("Не указана категория")
+        if category.type_id != type.pk:
+            raise RowError(f"Категория «{category}» не принадлежит типу «{type}»")
+
+        subcategory = self.defaults.get("subcategory")
+        if values.get("subcategory"):
+            subcategory = self.refs.subcategory(values["subcategory"], category)
+        if subcategory is None:
+            raise RowError("Не указана подкатегория")
+        if subcategory.category_id != category.pk:
+            raise RowError(
+                f"Подкатегория «{subcategory}» не принадлежит категории «{category}»"
+            )
+
+        return CashFlowStatement(
+            user=self.user,
+            custom_date=parse_date(values.get("custom_date")) or self.today,
+            type=type,
+            category=category,
+            subcategory=subcategory,
+            status=status,
+            amount=parse_amount(values.get("amount")),
+            comment=(values.get("comment") or "").strip(),
+        )
+
+    def flush(self, batch, report):
+        if not batch:
+            return
+        with transaction.atomic():
+            CashFlowStatement.objects.bulk_create(batch)
+            # bulk_create не вызывает сигналы - агрегаты обновляем сами
+            rollups.apply_rows(rollups.statement_values(obj) for obj in batch)
+            bump_version(STATEMENTS, self.user.pk)
+        report.created += len(batch)
+
+    def run(self, rows):
+        """rows - итератор пар (номер строки, словарь полей)"""
+        self.today = timezone.localdate()
+        report = ImportReport()
+        batch = []
+        try:
+            for line, values in rows:
+                try:
+                    batch.append(self.build(values))
+                except RowError as e:
+                    report.add_error(line, str(e))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.flush(batch, report)
+                    batch = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            report.file_error = f"Файл прочитан не до конца: {e}"
+        self.flush(batch, report)
+        return report
+
+
+def import_file(upload, user, file_format=None, defaults=None):
+    """Импортируем загруженный CSV или OFX файл"""
+    if file_format is None:
+        file_format = "ofx" if upload.name.lower().endswith((".ofx", ".qfx")) else "csv"
+    stream = open_upload(upload)
+    rows = read_ofx(stream) if file_format == "ofx" else read_csv(stream)
+    return StatementImporter(user, defaults).run(rows)
@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dds_app.archive import archive_statements, restore_statements
+
+
+class Command(BaseCommand):
+    """Перенос старых записей ДДС в архив и обратно"""
+
+    help = (
+        "Переносит записи с датой раньше --before (по умолчанию - старше "
+        "DDS_ARCHIVE_AFTER_DAYS дней) в архивную таблицу. Архивные записи видны в "
+        "списке и выгрузке, когда фильтр по дате до них дотягивается, но не "
+        "редактируются. С --restore возвращает записи из архива (с датой не раньше "
+        "--since, если указана)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            type=date.fromisoformat,
+            help="Архивировать записи раньше этой даты (ГГГГ-ММ-ДД)",
+        )
+        parser.add_argument("--user", help="Только записи этого пользователя")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--restore", action="store_true", help="Вернуть записи из архива"
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Для --restore: записи с этой даты (ГГГГ-ММ-ДД)",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size должно быть больше нуля")
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        if options["restore"]:
+            moved, users = restore_statements(
+                options["since"], user, options["batch_size"]
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Возвращено из архива записей: {moved}, пользователей: {users}"
+                )
+            )
+            return
+
+        before = options["before"] or timezone.localdate() - timedelta(
+            days=settings.DDS_ARCHIVE_AFTER_DAYS
+        )
+        moved, users = archive_statements(before, user, options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Перенесено в архив записей раньше {before}: {moved}, "
+                f"пользователей: {users}"
+            )
+        )
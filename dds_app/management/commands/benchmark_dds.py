@@ -0,0 +1,263 @@
+import json
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from dds_app.models import CashFlowStatement
+from dds_app.reference_cache import get_references
+from dds_app.views import SORT_ORDERINGS
+
+# Доли сценариев в нагрузке по умолчанию
+DEFAULT_MIX = "list=40,filter=25,autocomplete=20,create=8,update=7"
+# Метка комментария записей, созданных бенчмарком; по ней они удаляются в конце прогона
+BENCHMARK_COMMENT = "benchmark"
+
+
+def percentile(values, p):
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class QueryCounter:
+    """Обёртка выполнения SQL, считающая запросы (без накладных расходов DEBUG)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class UserSession:
+    """Клиенты и данные одного пользователя для генерации запросов"""
+
+    def __init__(self, user):
+        self.user = user
+        # Фильтр сохраняется в сессии, поэтому поиск идёт отдельным клиентом,
+        # чтобы просмотр списка оставался без фильтра
+        self.browser = Client()
+        self.browser.force_login(user)
+        self.searcher = Client()
+        self.searcher.force_login(user)
+        self.references = get_references(user)
+        # Последние записи пользователя - кандидаты на редактирование
+        fields = ("pk", "custom_date", "status", "type", "category", "subcategory")
+        self.statements = list(
+            CashFlowStatement.objects.filter(user=user)
+            .order_by("-custom_date", "-id")
+            .values(*fields)[:500]
+        )
+        if not self.references.subcategories or not self.references.statuses:
+            raise CommandError(f"У пользователя {user} не заполнены справочники")
+
+    def statement_data(self, rnd, comment):
+        subcategory = rnd.choice(self.references.subcategories)
+        category = next(
+            c for c in self.references.categories if c.pk == subcategory.category_id
+        )
+        return {
+            "custom_date": timezone.localdate() - timedelta(days=rnd.randint(0, 60)),
+            "status": rnd.choice(self.references.statuses).pk,
+            "type": category.type_id,
+            "category": category.pk,
+            "subcategory": subcategory.pk,
+            "amount": f"{rnd.lognormvariate(6.8, 1.2):.2f}",
+            "comment": comment,
+        }
+
+
+class Command(BaseCommand):
+    """Нагрузочный бенчмарк основных страниц через тестовый клиент Django"""
+
+    help = (
+        "Воспроизводит смесь запросов (список, фильтры, автодополнение, создание и "
+        "редактирование записей) от имени пользователей и выводит p50/p95/p99 времени "
+        "ответа и число SQL-запросов на запрос по каждому сценарию. Результат можно "
+        "сохранить (--save) и сравнить с базовым прогоном (--baseline)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            default=[],
+            help="Пользователь (можно повторять); по умолчанию - все PREFIX_*",
+        )
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=20,
+            help="Запросы для прогрева кэшей, в статистику не входят",
+        )
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="сценарий=вес,...")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--save", help="Сохранить результат в JSON-файл")
+        parser.add_argument("--baseline", help="JSON-файл базового прогона")
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Не удалять записи, созданные бенчмарком",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            users = list(User.objects.filter(username__in=options["user"]))
+        else:
+            users = list(
+                User.objects.filter(username__startswith=f"{options['prefix']}_")
+            )
+        if not users:
+            raise CommandError("Нет пользователей для бенчмарка, см. generate_dds_data")
+        mix = self.parse_mix(options["mix"])
+
+        rnd = random.Random(options["seed"])
+        self.run_id = f"{BENCHMARK_COMMENT} {int(time.time())}"
+        # Тестовый клиент обращается к хосту testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            sessions = [UserSession(user) for user in users]
+            for _ in range(options["warmup"]):
+                self.run_request(rnd, sessions, mix)
+            results = {name: {"times": [], "queries": [], "errors": 0} for name in mix}
+            for _ in range(options["requests"]):
+                name, elapsed, queries, ok = self.run_request(rnd, sessions, mix)
+                results[name]["times"].append(elapsed)
+                results[name]["queries"].append(queries)
+                results[name]["errors"] += not ok
+
+        if not options["keep"]:
+            CashFlowStatement.objects.filter(
+                user__in=users, comment=self.run_id
+            ).delete()
+
+        summary = self.summarize(results)
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+        self.report(summary, baseline)
+        if options["save"]:
+            with open(options["save"], "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    def parse_mix(self, value):
+        mix = {}
+        for item in value.split(","):
+            name, _, weight = item.partition("=")
+            name = name.strip()
+            if not hasattr(self, f"scenario_{name}"):
+                raise CommandError(f"Неизвестный сценарий «{name}»")
+            mix[name] = float(weight or 1)
+        return mix
+
+    def run_request(self, rnd, sessions, mix):
+        name = rnd.choices(list(mix), list(mix.values()))[0]
+        session = rnd.choice(sessions)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = getattr(self, f"scenario_{name}")(session, rnd)
+        elapsed = time.perf_counter() - started
+        return name, elapsed, counter.count, response.status_code < 400
+
+    def scenario_list(self, session, rnd):
+        sort = rnd.choice(list(SORT_ORDERINGS))
+        params = {"sort": rnd.choice([sort, f"-{sort}"])}
+        # Большинство открывает первые страницы
+        page = min(int(rnd.paretovariate(1.5)), 50)
+        if page > 1:
+            params["page"] = page
+        return session.browser.get(reverse("dds-list"), params)
+
+    def scenario_filter(self, session, rnd):
+        refs = session.references
+        today = timezone.localdate()
+        params = rnd.choice(
+            [
+                {"type": rnd.choice(refs.types).pk},
+                {"category": rnd.choice(refs.categories).pk},
+                {"subcategory": rnd.choice(refs.subcategories).pk},
+                {"status": rnd.choice(refs.statuses).pk},
+                {
+                    "custom_date_from": today - timedelta(days=rnd.randint(7, 365)),
+                    "custom_date_to": today,
+                },
+                {"amount_min": rnd.randint(100, 5000)},
+                {"comment": rnd.choice(["кофе", "такси", "аренда", "оплата заказ"])},
+            ]
+        )
+        return session.searcher.get(reverse("dds-list"), params)
+
+    def scenario_autocomplete(self, session, rnd):
+        refs = session.references
+        if rnd.random() < 0.5:
+            url = reverse("category-autocomplete")
+            forward = {"type": str(rnd.choice(refs.types).pk)}
+        else:
+            url = reverse("subcategory-autocomplete")
+            forward = {"category": str(rnd.choice(refs.categories).pk)}
+        params = {"forward": json.dumps(forward), "q": rnd.choice(["", "а", "о", "к"])}
+        return session.browser.get(url, params)
+
+    def scenario_create(self, session, rnd):
+        return session.browser.post(
+            reverse("create-dds"), session.statement_data(rnd, self.run_id)
+        )
+
+    def scenario_update(self, session, rnd):
+        if not session.statements:
+            return self.scenario_create(session, rnd)
+        data = session.statement_data(rnd, "")
+        # Меняем сумму и убираем комментарий, справочники оставляем прежними
+        data.update(rnd.choice(session.statements))
+        pk = data.pop("pk")
+        return session.browser.post(reverse("update-dds", args=[pk]), data)
+
+    def summarize(self, results):
+        summary = {}
+        for name, result in results.items():
+            times = [t * 1000 for t in result["times"]]
+            if not times:
+                continue
+            summary[name] = {
+                "requests": len(times),
+                "errors": result["errors"],
+                "p50_ms": round(percentile(times, 50), 2),
+                "p95_ms": round(percentile(times, 95), 2),
+                "p99_ms": round(percentile(times, 99), 2),
+                "queries_avg": round(sum(result["queries"]) / len(times), 2),
+                "queries_max": max(result["queries"]),
+            }
+        return summary
+
+    def report(self, summary, baseline=None):
+        columns = ("p50_ms", "p95_ms", "p99_ms", "queries_avg", "queries_max")
+        self.stdout.write(
+            f"{'сценарий':<14}{'запросов':>9}{'ошибок':>8}"
+            + "".join(f"{column:>14}" for column in columns)
+        )
+        for name, row in summary.items():
+            cells = []
+            for column in columns:
+                cell = f"{row[column]:g}"
+                if baseline and name in baseline:
+                    old = baseline[name][column]
+                    if old:
+                        cell += f" {(row[column] - old) / old * 100:+.0f}%"
+                cells.append(f"{cell:>14}")
+            line = f"{name:<14}{row['requests']:>9}{row['errors']:>8}" + "".join(cells)
+            self.stdout.write(self.style.ERROR(line) if row["errors"] else line)
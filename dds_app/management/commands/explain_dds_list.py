@@ -0,0 +1,154 @@
+import re
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from dds_app.models import Category, Status, Subcategory, Type
+from dds_app.views import SORT_ORDERINGS, CashFlowStatementFilterListView
+
+STATEMENT_TABLE = "dds_app_cashflowstatement"
+# Таблицы, которые читает список: основная и архив (если фильтр дотягивается до архива)
+LIST_TABLES = (STATEMENT_TABLE, "dds_app_archivedcashflowstatement")
+
+
+class Command(BaseCommand):
+    """Проверка планов запросов главной таблицы"""
+
+    help = (
+        "Строит запрос главной таблицы через "
+        "CashFlowStatementFilterListView.get_queryset для типовых фильтров "
+        "пользователя и показывает EXPLAIN. Сценарии с полным сканированием "
+        "таблицы записей считаются ошибкой."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "username", help="Пользователь, от имени которого строится запрос"
+        )
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            metavar="KEY=VALUE",
+            help="Проверить только указанный фильтр (можно повторять)",
+        )
+        parser.add_argument("--per-page", type=int, default=10)
+        parser.add_argument(
+            "--analyze", action="store_true", help="EXPLAIN ANALYZE (только PostgreSQL)"
+        )
+        parser.add_argument(
+            "--force-index",
+            action="store_true",
+            help="Запретить планировщику seq scan, чтобы проверить применимость "
+            "индексов на маленькой базе (только PostgreSQL)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['username']} не найден")
+
+        if options["filter"]:
+            params = dict(item.split("=", 1) for item in options["filter"])
+            scenarios = [("пользовательский фильтр", params)]
+        else:
+            scenarios = self.default_scenarios(user)
+
+        failed = 0
+        for title, params in scenarios:
+            plan = self.explain(user, params, options)
+            seq_scan, sort = self.inspect(plan)
+            if seq_scan:
+                failed += 1
+                verdict = self.style.ERROR("SEQ SCAN")
+            elif sort:
+                verdict = self.style.WARNING("INDEX + SORT")
+            else:
+                verdict = self.style.SUCCESS("INDEX")
+            scanned = self.scanned_partitions(plan)
+            if scanned:
+                title = f"{title} (секций в плане: {scanned})"
+            self.stdout.write(f"[{verdict}] {title}: {params or '{}'}")
+            if options["verbosity"] > 1 or seq_scan:
+                self.stdout.write(plan)
+
+        if failed:
+            raise CommandError(f"Сценариев с полным сканированием таблицы: {failed}")
+
+    def default_scenarios(self, user):
+        """Набор фильтров, повторяющий типовые запросы главной страницы"""
+        scenarios = [("без фильтров", {})]
+        today = timezone.now().date()
+        scenarios.append(
+            (
+                "диапазон дат",
+                {
+                    "custom_date_from": (today - timedelta(days=90)).isoformat(),
+                    "custom_date_to": today.isoformat(),
+                },
+            )
+        )
+        for field, model in (
+            ("type", Type),
+            ("category", Category),
+            ("subcategory", Subcategory),
+            ("status", Status),
+        ):
+            obj = model.objects.filter(user=user).first()
+            if obj is not None:
+                scenarios.append((f"фильтр {field}", {field: str(obj.pk)}))
+        scenarios.append(
+            ("диапазон суммы", {"amount_min": "1000", "amount_max": "5000"})
+        )
+        scenarios.append(("комментарий", {"comment": "a"}))
+        for sort in SORT_ORDERINGS:
+            for key in (sort, f"-{sort}"):
+                scenarios.append((f"сортировка {key}", {"sort": key}))
+        return scenarios
+
+    def list_queryset(self, user, params):
+        """Запрос ровно в том виде, в каком его строит представление"""
+        request = RequestFactory().get("/", params)
+        request.user = user
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        view = CashFlowStatementFilterListView()
+        view.setup(request)
+        return view.get_queryset()
+
+    def explain(self, user, params, options):
+        qs = self.list_queryset(user, params)[: options["per_page"]]
+        explain_options = {}
+        if connection.vendor == "postgresql" and options["analyze"]:
+            explain_options["analyze"] = True
+        with transaction.atomic():
+            if connection.vendor == "postgresql" and options["force_index"]:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            return qs.explain(**explain_options)
+
+    def scanned_partitions(self, plan):
+        """Число секций таблицы записей, оставшихся в плане после отсечения"""
+        pattern = rf" on ({STATEMENT_TABLE}_(?:p\d+(?:_\d+)?|default))\b"
+        return len(set(re.findall(pattern, plan)))
+
+    def inspect(self, plan):
+        """Ищем в плане полное сканирование таблицы записей и отдельную сортировку"""
+        if connection.vendor == "postgresql":
+            seq_scan = any(f"Seq Scan on {table}" in plan for table in LIST_TABLES)
+            # Узел Sort, а не строка "Sort Key" у Merge Append по секциям
+            sort = re.search(r"^\s*(->)?\s*Sort\s+\(", plan, re.MULTILINE) is not None
+        else:
+            seq_scan = any(
+                f"SCAN {table}" in line and "INDEX" not in line
+                for line in plan.splitlines()
+                for table in LIST_TABLES
+            )
+            sort = "TEMP B-TREE" in plan
+        return seq_scan, sort
@@ -0,0 +1,230 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from dds_app import rollups
+from dds_app.models import (
+    ArchivedCashFlowStatement,
+    CashFlowStatement,
+    Category,
+    Status,
+    Subcategory,
+    Type,
+)
+from dds_app.signals import mute_statement_signals
+from dds_app.versions import STATEMENTS, bump_version
+
+# Дерево справочников: тип → категория → подкатегории. Вес категории задаёт
+# её долю в записях типа, вес типа - долю типа; параметры логнормального
+# распределения суммы (mu, sigma) подобраны под типичные суммы в рублях
+REFERENCE_TREE = {
+    "Приход": {
+        "direction": Type.INFLOW,
+        "weight": 1,
+        "amount": (10.5, 0.6),
+        "categories": {
+            "Зарплата": (8, ["Аванс", "Оклад", "Премия"]),
+            "Фриланс": (3, ["Разработка", "Консультации"]),
+            "Инвестиции": (1, ["Дивиденды", "Купоны", "Проценты по вкладу"]),
+            "Возвраты": (1, ["Кэшбэк", "Возврат покупки"]),
+        },
+    },
+    "Расход": {
+        "direction": Type.OUTFLOW,
+        "weight": 9,
+        "amount": (6.8, 1.2),
+        "categories": {
+            "Еда": (10, ["Продукты", "Кафе", "Доставка", "Обеды"]),
+            "Транспорт": (6, ["Такси", "Метро", "Топливо", "Парковка"]),
+            "Дом": (4, ["Аренда", "Коммунальные услуги", "Интернет", "Ремонт"]),
+            "Маркетинг": (3, ["Avito", "Farpost", "Контекстная реклама"]),
+            "Инфраструктура": (2, ["VPS", "Proxy", "Домены"]),
+            "Здоровье": (2, ["Аптека", "Врачи", "Спорт"]),
+            "Развлечения": (2, ["Кино", "Подписки", "Путешествия"]),
+            "Налоги": (1, ["НДФЛ", "Страховые взносы"]),
+        },
+    },
+}
+STATUSES = {"Личное": 6, "Бизнес": 3, "Налог": 1}
+COMMENT_WORDS = (
+    "оплата заказ кофе аренда офиса такси аэропорт перевод возврат подписка "
+    "счёт продукты обед клиент проект ремонт бензин интернет реклама"
+).split()
+
+
+def weighted(choices):
+    """Пары (значение, вес) в виде списков для random.choices"""
+    choices = list(choices)
+    return [value for value, _ in choices], [weight for _, weight in choices]
+
+
+class UserTree:
+    """Справочники одного пользователя и веса для выборки записей"""
+
+    def __init__(self, user, rnd):
+        self.user = user
+        self.statuses = weighted(
+            # Название статуса уникально во всей таблице, поэтому добавляем
+            # имя пользователя
+            (
+                Status.objects.create(user=user, name=f"{name} ({user.username})"),
+                weight,
+            )
+            for name, weight in STATUSES.items()
+        )
+        self.types = []
+        self.leaves = {}
+        for type_name, spec in REFERENCE_TREE.items():
+            type = Type.objects.create(
+                user=user, name=type_name, direction=spec["direction"]
+            )
+            self.types.append((type, spec["weight"]))
+            leaves = []
+            categories = list(spec["categories"].items())
+            rnd.shuffle(categories)
+            # Ранг категории у каждого пользователя свой: популярность
+            # распределена по Ципфу
+            for rank, (name, (weight, subnames)) in enumerate(categories, 1):
+                category = Category.objects.create(user=user, name=name, type=type)
+                for subrank, subname in enumerate(subnames, 1):
+                    subcategory = Subcategory.objects.create(
+                        user=user, name=subname, category=category
+                    )
+                    leaves.append(((category, subcategory), weight / rank / subrank))
+            self.leaves[type.pk] = (weighted(leaves), spec["amount"])
+        self.types = weighted(self.types)
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных ДДС для нагрузочного тестирования"""
+
+    help = (
+        "Создаёт пользователей PREFIX_0001..., дерево справочников каждого "
+        "и записи ДДС "
+        "с неравномерным распределением дат (свежие даты чаще), сумм (логнормальное) "
+        "и объёма по пользователям. Записи вставляются bulk_create порциями, агрегаты "
+        "пересобираются по каждому пользователю в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument(
+            "--statements",
+            type=int,
+            default=100000,
+            help="Общее число записей, делится между пользователями неравномерно",
+        )
+        parser.add_argument("--years", type=int, default=3, help="Глубина истории")
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--password", default="bench")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Удалить ранее сгенерированных пользователей с тем же префиксом",
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        existing = User.objects.filter(username__startswith=f"{prefix}_")
+        if options["clear"]:
+            deleted = self.clear(existing)
+            self.stdout.write(f"Удалено пользователей: {deleted}")
+        elif existing.exists():
+            raise CommandError(
+                f"Пользователи с префиксом {prefix}_ уже есть, используйте --clear"
+            )
+        if options["users"] < 1:
+            raise CommandError("--users должно быть больше нуля")
+
+        rnd = random.Random(options["seed"])
+        users = self.create_users(prefix, options["users"], options["password"])
+        # Объём записей по пользователям тоже неравномерный: у немногих - большая часть
+        shares = [rnd.paretovariate(1.2) for _ in users]
+        total_share = sum(shares)
+        started = time.monotonic()
+        created = 0
+        for user, share in zip(users, shares):
+            count = round(options["statements"] * share / total_share)
+            with transaction.atomic():
+                tree = UserTree(user, rnd)
+            created += self.create_statements(tree, count, rnd, options)
+            rollups.rebuild(user)
+            bump_version(STATEMENTS, user.pk)
+            self.stdout.write(f"{user.username}: {count} записей")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано пользователей: {len(users)}, записей: {created} "
+                f"за {elapsed:.1f} с ({created / max(elapsed, 0.001):.0f} записей/с). "
+                f"Пароль: {options['password']}"
+            )
+        )
+
+    def clear(self, users):
+        """Удаляем сгенерированных пользователей вместе со всеми их данными"""
+        with transaction.atomic():
+            # Обработчики записей не нужны: агрегаты удаляются каскадно вместе
+            # с пользователем, а его версии больше никто не читает. Записи удаляем
+            # по пользователю, чтобы не держать в памяти все строки сразу
+            with mute_statement_signals():
+                for user in users:
+                    CashFlowStatement.objects.filter(user=user).delete()
+            ArchivedCashFlowStatement.objects.filter(user__in=users).delete()
+            return users.delete()[1].get("auth.User", 0)
+
+    def create_users(self, prefix, count, password):
+        # Хэш пароля считается один раз: PBKDF2 на каждого пользователя занял бы минуты
+        password = make_password(password)
+        return User.objects.bulk_create(
+            User(username=f"{prefix}_{i:04d}", password=password)
+            for i in range(1, count + 1)
+        )
+
+    def create_statements(self, tree, count, rnd, options):
+        today = timezone.localdate()
+        days = options["years"] * 365
+        batch = []
+        created = 0
+        for _ in range(count):
+            type = rnd.choices(*tree.types)[0]
+            (leaves, weights), (mu, sigma) = tree.leaves[type.pk]
+            category, subcategory = rnd.choices(leaves, weights)[0]
+            # Бета(1, 3): плотность записей растёт к сегодняшнему дню
+            date = today - timedelta(days=int(days * rnd.betavariate(1, 3)))
+            amount = Decimal(round(rnd.lognormvariate(mu, sigma), 2)).quantize(
+                Decimal("0.01")
+            )
+            comment = ""
+            if rnd.random() < 0.3:
+                comment = " ".join(rnd.sample(COMMENT_WORDS, rnd.randint(1, 4)))
+            batch.append(
+                CashFlowStatement(
+                    user=tree.user,
+                    custom_date=date,
+                    type=type,
+                    category=category,
+                    subcategory=subcategory,
+                    status=rnd.choices(*tree.statuses)[0],
+                    amount=min(amount, Decimal("9999999999.99")),
+                    comment=comment,
+                )
+            )
+            if len(batch) >= options["batch_size"]:
+                created += self.flush(batch)
+                batch = []
+        return created + self.flush(batch)
+
+    def flush(self, batch):
+        if batch:
+            CashFlowStatement.objects.bulk_create(batch)
+        return len(batch)
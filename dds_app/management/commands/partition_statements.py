@@ -0,0 +1,96 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dds_app import partitions
+
+
+class Command(BaseCommand):
+    """Секционирование таблицы записей по дате (PostgreSQL)"""
+
+    help = (
+        "convert - перевести таблицу записей в секционированную по custom_date; "
+        "create - заранее создать секции на --ahead периодов вперёд; "
+        "detach - отсоединить (или удалить с --drop) секции раньше --before; "
+        "list - показать секции и оценку числа строк."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=("convert", "create", "detach", "list"))
+        parser.add_argument(
+            "--interval",
+            choices=partitions.INTERVALS,
+            default=settings.DDS_STATEMENT_PARTITION_INTERVAL,
+            help="Размер секции (по умолчанию DDS_STATEMENT_PARTITION_INTERVAL)",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=3,
+            help="Сколько будущих периодов подготовить заранее",
+        )
+        parser.add_argument(
+            "--before",
+            type=date.fromisoformat,
+            help="Для detach: секции, целиком лежащие раньше этой даты (ГГГГ-ММ-ДД)",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Для detach: удалить отсоединённые секции вместе с данными",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, options["action"])(options)
+        except partitions.PartitionError as e:
+            raise CommandError(str(e))
+
+    def convert(self, options):
+        result = partitions.convert_table(options["interval"], options["ahead"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Таблица секционирована, секций: {len(result)}")
+        )
+
+    def create(self, options):
+        first = timezone.localdate()
+        last = first
+        for _ in range(options["ahead"]):
+            last = partitions.next_period(
+                partitions.period_start(last, options["interval"]), options["interval"]
+            )
+        created = partitions.create_partitions(first, last, options["interval"])
+        for name in created:
+            self.stdout.write(f"Создана секция {name}")
+        self.stdout.write(self.style.SUCCESS(f"Создано секций: {len(created)}"))
+
+    def detach(self, options):
+        if options["before"] is None:
+            raise CommandError("Для detach укажите --before")
+        detached = partitions.detach_partitions(options["before"], options["drop"])
+        action = "Удалена" if options["drop"] else "Отсоединена"
+        for partition in detached:
+            self.stdout.write(
+                f"{action} секция {partition.name} (~{partition.rows} строк)"
+            )
+        if detached and not options["drop"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Отсоединённые секции остались отдельными таблицами "
+                    "и больше не видны приложению"
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(f"Секций: {len(detached)}"))
+
+    def list(self, options):
+        if not partitions.is_partitioned():
+            raise CommandError("Таблица записей не секционирована")
+        for partition in partitions.list_partitions():
+            bounds = (
+                "по умолчанию"
+                if partition.is_default
+                else f"{partition.start} — {partition.end}"
+            )
+            self.stdout.write(f"{partition.name:<40} {bounds:<26} ~{partition.rows}")
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from dds_app import rollups
+
+
+class Command(BaseCommand):
+    """Пересборка и проверка агрегатов ДДС"""
+
+    help = (
+        "Пересобирает таблицу агрегатов ДДС с нуля по таблице записей и проверяет, "
+        "что она совпадает с пересчётом. С --verify-only только проверяет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="Имя пользователя (по умолчанию - все пользователи)"
+        )
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Не пересобирать, только сверить агрегаты с записями",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(username=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        if not options["verify_only"]:
+            created = rollups.rebuild(user)
+            self.stdout.write(f"Создано строк агрегатов: {created}")
+
+        mismatches = rollups.verify(user)
+        for key, stored, expected in mismatches[:20]:
+            self.stdout.write(
+                self.style.WARNING(f"{key}: сохранено {stored}, ожидается {expected}")
+            )
+        if mismatches:
+            raise CommandError(f"Расхождений в агрегатах: {len(mismatches)}")
+        self.stdout.write(self.style.SUCCESS("Агрегаты совпадают с записями"))
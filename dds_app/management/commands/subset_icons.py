@@ -0,0 +1,132 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.utils import get_app_template_dirs
+
+ICONS_DIR = Path(settings.BASE_DIR) / "static" / "icons" / "bootstrap-icons"
+# Полный набор Bootstrap Icons - исходник подмножества
+SOURCE_CSS = ICONS_DIR / "bootstrap-icons.css"
+SOURCE_FONT = ICONS_DIR / "fonts" / "bootstrap-icons.woff2"
+# Подмножество, которое подключают шаблоны
+SUBSET_CSS = ICONS_DIR / "bootstrap-icons.subset.css"
+SUBSET_FONT = "fonts/bootstrap-icons.subset"
+FLAVORS = ("woff2", "woff")
+
+ICON_CLASS = re.compile(r"\bbi-([a-z0-9]+(?:-[a-z0-9]+)*)")
+GLYPH_RULE = re.compile(
+    r'^\.bi-([a-z0-9-]+)::before \{ content: "\\([0-9a-f]+)"; \}$', re.M
+)
+BASE_RULE = re.compile(r"^\.bi::before,.*?^\}$", re.M | re.S)
+LICENSE = re.compile(r"^/\*!.*?\*/", re.S)
+
+
+def template_sources():
+    """Шаблоны и JS проекта, в которых могут встречаться классы иконок"""
+    base = Path(settings.BASE_DIR)
+    roots = [Path(d) for config in settings.TEMPLATES for d in config.get("DIRS", [])]
+    roots += [Path(d) for d in get_app_template_dirs("templates")]
+    roots += [Path(d) for d in settings.STATICFILES_DIRS]
+    for root in roots:
+        if not root.resolve().is_relative_to(base):
+            continue
+        for path in root.rglob("*"):
+            if path.suffix in (".html", ".js") and ICONS_DIR not in path.parents:
+                yield path
+
+
+def used_icons():
+    names = set()
+    for path in template_sources():
+        names.update(ICON_CLASS.findall(path.read_text(encoding="utf-8")))
+    return names
+
+
+class Command(BaseCommand):
+    """Подмножество шрифта Bootstrap Icons только с иконками из шаблонов"""
+
+    help = (
+        "Ищет классы bi-* в шаблонах и JS проекта и собирает из полного шрифта "
+        "Bootstrap Icons подмножество (woff2 и woff) и CSS только с этими иконками. "
+        "Запускать после добавления иконки в шаблон; с --check только проверяет, "
+        "что подмножество актуально. Нужны пакеты fonttools и brotli."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Не собирать, а проверить, что в подмножестве есть все иконки "
+            "шаблонов",
+        )
+
+    def handle(self, *args, **options):
+        source_css = SOURCE_CSS.read_text(encoding="utf-8")
+        glyphs = dict(GLYPH_RULE.findall(source_css))
+        used = used_icons()
+        unknown = used - set(glyphs)
+        if unknown:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Нет в Bootstrap Icons: {', '.join(sorted(unknown))}"
+                )
+            )
+        used &= set(glyphs)
+
+        if options["check"]:
+            current = set()
+            if SUBSET_CSS.exists():
+                current = {
+                    name
+                    for name, _ in GLYPH_RULE.findall(
+                        SUBSET_CSS.read_text(encoding="utf-8")
+                    )
+                }
+            if current != used:
+                raise CommandError(
+                    "Подмножество иконок устарело, выполните subset_icons "
+                    f"(добавить: {', '.join(sorted(used - current)) or '-'}; "
+                    f"убрать: {', '.join(sorted(current - used)) or '-'})"
+                )
+            self.stdout.write(self.style.SUCCESS("Подмножество иконок актуально"))
+            return
+
+        try:
+            from fontTools import subset
+        except ImportError:
+            raise CommandError("Для сборки подмножества установите fonttools и brotli")
+
+        for flavor in FLAVORS:
+            font_options = subset.Options(flavor=flavor)
+            font = subset.load_font(str(SOURCE_FONT), font_options)
+            subsetter = subset.Subsetter(font_options)
+            subsetter.populate(unicodes=[int(glyphs[name], 16) for name in used])
+            subsetter.subset(font)
+            subset.save_font(
+                font, str(ICONS_DIR / f"{SUBSET_FONT}.{flavor}"), font_options
+            )
+
+        sources = ",\n".join(
+            f'url("./{SUBSET_FONT}.{flavor}") format("{flavor}")' for flavor in FLAVORS
+        )
+        rules = "\n".join(
+            f'.bi-{name}::before {{ content: "\\{glyphs[name]}"; }}'
+            for name in sorted(used)
+        )
+        SUBSET_CSS.write_text(
+            f"{LICENSE.search(source_css).group()}\n\n"
+            "/* Подмножество: только иконки из шаблонов. "
+            "Собирается командой subset_icons */\n\n"
+            "@font-face {\n"
+            "  font-display: block;\n"
+            '  font-family: "bootstrap-icons";\n'
+            f"  src: {sources};\n"
+            "}\n\n"
+            f"{BASE_RULE.search(source_css).group()}\n\n"
+            f"{rules}\n",
+            encoding="utf-8",
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Иконок в подмножестве: {len(used)} из {len(glyphs)}")
+        )
@@ -0,0 +1,173 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Границы корзин гистограмм: время в секундах и число SQL-запросов
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """
+    Гистограмма в формате Prometheus: накопительные корзины, сумма и число
+    наблюдений
+    """
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(
+                labels, {"buckets": [0] * len(self.buckets), "sum": 0, "count": 0}
+            )
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                yield f"{self.name}_bucket{_labels(labels, le=bound)} {count}"
+            yield f'{self.name}_bucket{_labels(labels, le="+Inf")} {series["count"]}'
+            yield f"{self.name}_sum{_labels(labels)} {series['sum']:.6g}"
+            yield f"{self.name}_count{_labels(labels)} {series['count']}"
+
+
+class Counter:
+    """Счётчик в формате Prometheus"""
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.series.items()):
+            yield f"{self.name}{_labels(labels)} {value}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    """labels - кортеж пар (имя, значение)"""
+    pairs = list(labels) + list(extra.items())
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+# Метрики хранятся в памяти процесса: каждый воркер отдаёт свои
+_lock = threading.Lock()
+REQUEST_DURATION = Histogram(
+    "dds_request_duration_seconds", "Полное время обработки запроса", TIME_BUCKETS
+)
+DB_DURATION = Histogram(
+    "dds_db_duration_seconds", "Время SQL-запросов за один запрос", TIME_BUCKETS
+)
+TEMPLATE_DURATION = Histogram(
+    "dds_template_render_seconds", "Время рендеринга шаблона ответа", TIME_BUCKETS
+)
+QUERY_COUNT = Histogram(
+    "dds_db_queries", "Число SQL-запросов за один запрос", QUERY_BUCKETS
+)
+RESPONSES = Counter("dds_responses_total", "Ответы по представлениям и кодам")
+BUDGET_EXCEEDED = Counter(
+    "dds_query_budget_exceeded_total", "Запросы, превысившие бюджет SQL-запросов"
+)
+REPLICA_READS = Counter("dds_replica_reads_total", "Запросы, читавшие данные с реплики")
+METRICS = (
+    REQUEST_DURATION,
+    DB_DURATION,
+    TEMPLATE_DURATION,
+    QUERY_COUNT,
+    RESPONSES,
+    BUDGET_EXCEEDED,
+    REPLICA_READS,
+)
+
+
+class RequestStats:
+    """Статистика одного HTTP-запроса: SQL-запросы, время БД и рендеринга"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+
+    def render_finished(self, response):
+        if self.render_started is not None:
+            self.render_time += time.perf_counter() - self.render_started
+            self.render_started = None
+        return response
+
+
+# Статистика текущего запроса; контекст копируется в sync_to_async,
+# поэтому запросы ORM из асинхронных представлений тоже учитываются
+current_stats = ContextVar("dds_request_stats", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Обёртка выполнения SQL: считает запросы и время БД текущего HTTP-запроса"""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """Подключаем обёртку к каждому соединению с БД (и после переподключения)"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def record(view, status, stats, duration):
+    labels = (("view", view),)
+    with _lock:
+        REQUEST_DURATION.observe(labels, duration)
+        DB_DURATION.observe(labels, stats.db_time)
+        QUERY_COUNT.observe(labels, stats.queries)
+        if stats.render_time:
+            TEMPLATE_DURATION.observe(labels, stats.render_time)
+        RESPONSES.inc(labels + (("status", status),))
+
+
+def record_budget_exceeded(view):
+    with _lock:
+        BUDGET_EXCEEDED.inc((("view", view),))
+
+
+def record_replica_read(view):
+    with _lock:
+        REPLICA_READS.inc((("view", view),))
+
+
+def render_metrics():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    return "\n".join(lines) + "\n"
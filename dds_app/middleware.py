@@ -0,0 +1,144 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+from .routers import (
+    RoutingState,
+    astick_to_primary,
+    current_routing,
+    is_sticky,
+    stick_to_primary,
+)
+
+logger = logging.getLogger("dds_app.metrics")
+
+
+class MetricsMiddleware:
+    """
+    Число SQL-запросов, время БД, рендеринга шаблона и полное время ответа
+    по каждому представлению (имени URL). Если число запросов превышает бюджет
+    из DDS_QUERY_BUDGETS, в лог пишется предупреждение.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, "DDS_QUERY_BUDGETS", {})
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = metrics.current_stats.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+            response.add_post_render_callback(stats.render_finished)
+        return response
+
+    def get_view_name(self, request):
+        match = getattr(request, "resolver_match", None)
+        return match.view_name if match is not None else "<unresolved>"
+
+    def finish(self, request, response, stats):
+        view = self.get_view_name(request)
+        metrics.record(
+            view, response.status_code, stats, time.perf_counter() - stats.started
+        )
+        budget = self.budgets.get(view)
+        if budget is not None and stats.queries > budget:
+            metrics.record_budget_exceeded(view)
+            logger.warning(
+                "Представление %s выполнило %d SQL-запросов при бюджете %d (%s %s)",
+                view,
+                stats.queries,
+                budget,
+                request.method,
+                request.path,
+            )
+
+
+class ReplicaMiddleware:
+    """
+    Чтение с реплики DDS_REPLICA_DB для GET-запросов к представлениям из
+    DDS_REPLICA_VIEWS (маршрутизирует dds_app.routers.ReplicaRouter). Если за запрос
+    была запись в БД, пользователь на DDS_REPLICA_STICKY_SECONDS закрепляется за
+    основной БД и видит свои изменения, даже пока реплика отстаёт
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.replica = settings.DDS_REPLICA_DB
+        self.views = frozenset(settings.DDS_REPLICA_VIEWS)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote and request.user.is_authenticated:
+            stick_to_primary(request.user.pk)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote:
+            user = await request.auser()
+            if user.is_authenticated:
+                await astick_to_primary(user.pk)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = current_routing.get()
+        if (
+            state is None
+            or not self.replica
+            or request.method not in ("GET", "HEAD")
+            or request.resolver_match.view_name not in self.views
+        ):
+            return None
+        # Пользователь и сессия к этому моменту прочитаны из основной БД
+        if request.user.is_authenticated and is_sticky(request.user.pk):
+            return None
+        state.read_db = self.replica
+        metrics.record_replica_read(request.resolver_match.view_name)
+        return None
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0002_alter_cashflowstatement_amount_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "-custom_date", "-id"], name="dds_stmt_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "type", "-custom_date", "-id"],
+                name="dds_stmt_user_type_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "category", "-custom_date", "-id"],
+                name="dds_stmt_user_cat_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "subcategory", "-custom_date", "-id"],
+                name="dds_stmt_user_subcat_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "status", "-custom_date", "-id"],
+                name="dds_stmt_user_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "amount"], name="dds_stmt_user_amount_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                condition=models.Q(("comment", ""), _negated=True),
+                fields=["user", "-custom_date", "-id"],
+                name="dds_stmt_user_comment_idx",
+            ),
+        ),
+    ]
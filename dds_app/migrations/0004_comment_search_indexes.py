@@ -0,0 +1,59 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# Индексы только для PostgreSQL: в SQLite поиск работает без них
+COMMENT_FTS_INDEX = "dds_stmt_comment_fts_idx"
+COMMENT_TRGM_INDEX = "dds_stmt_comment_trgm_idx"
+# Конфигурация зафиксирована в миграции: индекс используется, только пока выражение
+# запроса (settings.DDS_SEARCH_CONFIG) с ним совпадает. Смена настройки требует
+# новой миграции, пересоздающей индекс с другой конфигурацией
+SEARCH_CONFIG = "russian"
+
+
+def comment_indexes(schema_editor):
+    """Индексы поиска по комментарию, доступные на текущем сервере"""
+    indexes = [
+        GinIndex(
+            SearchVector("comment", config=SEARCH_CONFIG),
+            name=COMMENT_FTS_INDEX,
+        )
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone():
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            indexes.append(
+                GinIndex(
+                    OpClass(Upper("comment"), name="gin_trgm_ops"),
+                    name=COMMENT_TRGM_INDEX,
+                )
+            )
+    return indexes
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    model = apps.get_model("dds_app", "CashFlowStatement")
+    for index in comment_indexes(schema_editor):
+        schema_editor.add_index(model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in (COMMENT_FTS_INDEX, COMMENT_TRGM_INDEX):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0003_cashflowstatement_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0004_comment_search_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashFlowRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "День"), ("month", "Месяц")],
+                        max_length=5,
+                        verbose_name="Период",
+                    ),
+                ),
+                ("period_start", models.DateField(verbose_name="Начало периода")),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=18, verbose_name="Сумма"
+                    ),
+                ),
+                (
+                    "count",
+                    models.IntegerField(default=0, verbose_name="Количество записей"),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="dds_app.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="dds_app.status",
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="dds_app.subcategory",
+                        verbose_name="Подкатегория",
+                    ),
+                ),
+                (
+                    "type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="dds_app.type",
+                        verbose_name="Тип",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Агрегат ДДС",
+                "verbose_name_plural": "Агрегаты ДДС",
+                "ordering": ("period", "-period_start"),
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "user",
+                            "period",
+                            "period_start",
+                            "type",
+                            "category",
+                            "subcategory",
+                            "status",
+                        ),
+                        name="dds_rollup_key_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
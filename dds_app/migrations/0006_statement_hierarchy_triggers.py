@@ -0,0 +1,114 @@
+from django.db import migrations
+
+# Согласованность тип → категория → подкатегория проверяется в БД, поэтому её не обойти
+# ни через bulk_create, ни через QuerySet.update, ни через изменение справочника
+SUBCATEGORY_ERROR = "Выбранная подкатегория не принадлежит указанной категории"
+CATEGORY_ERROR = "Выбранная категория не принадлежит указанному типу"
+CATEGORY_TYPE_ERROR = "Категория используется в записях с другим типом"
+SUBCATEGORY_CATEGORY_ERROR = "Подкатегория используется в записях с другой категорией"
+
+# (триггер, таблица, событие, условие нарушения, сообщение)
+CHECKS = [
+    (
+        "dds_stmt_subcategory_check",
+        "dds_app_cashflowstatement",
+        "category_id, subcategory_id",
+        "NOT EXISTS (SELECT 1 FROM dds_app_subcategory s"
+        " WHERE s.id = NEW.subcategory_id AND s.category_id = NEW.category_id)",
+        SUBCATEGORY_ERROR,
+    ),
+    (
+        "dds_stmt_category_check",
+        "dds_app_cashflowstatement",
+        "type_id, category_id",
+        "NOT EXISTS (SELECT 1 FROM dds_app_category c"
+        " WHERE c.id = NEW.category_id AND c.type_id = NEW.type_id)",
+        CATEGORY_ERROR,
+    ),
+    (
+        "dds_category_type_check",
+        "dds_app_category",
+        "type_id",
+        "EXISTS (SELECT 1 FROM dds_app_cashflowstatement r"
+        " WHERE r.category_id = NEW.id AND r.type_id <> NEW.type_id)",
+        CATEGORY_TYPE_ERROR,
+    ),
+    (
+        "dds_subcategory_category_check",
+        "dds_app_subcategory",
+        "category_id",
+        "EXISTS (SELECT 1 FROM dds_app_cashflowstatement r"
+        " WHERE r.subcategory_id = NEW.id AND r.category_id <> NEW.category_id)",
+        SUBCATEGORY_CATEGORY_ERROR,
+    ),
+]
+
+
+def postgresql_sql(name, table, columns, condition, message):
+    # Ошибка с кодом check_violation приходит в Django как IntegrityError
+    events = "INSERT OR " if table == "dds_app_cashflowstatement" else ""
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$
+        BEGIN
+            IF {condition} THEN
+                RAISE EXCEPTION '{message}' USING ERRCODE = 'check_violation';
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE TRIGGER {name} BEFORE {events}UPDATE OF {columns} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {name}()
+        """,
+    ]
+
+
+def sqlite_sql(name, table, columns, condition, message):
+    # RAISE(ABORT) в SQLite - ошибка ограничения, в Django это тоже IntegrityError
+    events = ["UPDATE OF " + columns]
+    if table == "dds_app_cashflowstatement":
+        events.insert(0, "INSERT")
+    return [
+        f"""
+        CREATE TRIGGER {name}_{event.split()[0].lower()} BEFORE {event} ON {table}
+        FOR EACH ROW WHEN {condition}
+        BEGIN
+            SELECT RAISE(ABORT, '{message}');
+        END
+        """
+        for event in events
+    ]
+
+
+def create_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ("postgresql", "sqlite"):
+        return
+    build = postgresql_sql if vendor == "postgresql" else sqlite_sql
+    for check in CHECKS:
+        for sql in build(*check):
+            schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for name, table, *_ in CHECKS:
+        if vendor == "postgresql":
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+            schema_editor.execute(f"DROP FUNCTION IF EXISTS {name}()")
+        elif vendor == "sqlite":
+            for suffix in ("insert", "update"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}_{suffix}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0005_cashflowrollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
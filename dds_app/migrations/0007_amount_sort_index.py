@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0006_statement_hierarchy_triggers"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="cashflowstatement",
+            name="dds_stmt_user_amount_idx",
+        ),
+        migrations.AddIndex(
+            model_name="cashflowstatement",
+            index=models.Index(
+                fields=["user", "amount", "id"], name="dds_stmt_user_amount_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,199 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:42
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+hierarchy = import_module("dds_app.migrations.0006_statement_hierarchy_triggers")
+
+COLUMNS = (
+    "id, user_id, created_at, custom_date, type_id, category_id, subcategory_id, "
+    "status_id, amount, comment"
+)
+# Основные и архивные записи одним набором: фильтры и сортировка списка
+# применяются к обеим таблицам, каждая читается по своему индексу
+CREATE_VIEW = f"""
+    CREATE VIEW dds_app_statement_all AS
+    SELECT {COLUMNS}, FALSE AS archived FROM dds_app_cashflowstatement
+    UNION ALL
+    SELECT {COLUMNS}, TRUE AS archived FROM dds_app_archivedcashflowstatement
+"""
+DROP_VIEW = "DROP VIEW IF EXISTS dds_app_statement_all"
+
+# Смена типа категории и категории подкатегории теперь проверяется и по архиву
+ARCHIVE_CHECKS = [
+    (
+        "dds_category_type_check",
+        "dds_app_category",
+        "type_id",
+        "EXISTS (SELECT 1 FROM dds_app_cashflowstatement r"
+        " WHERE r.category_id = NEW.id AND r.type_id <> NEW.type_id)"
+        " OR EXISTS (SELECT 1 FROM dds_app_archivedcashflowstatement a"
+        " WHERE a.category_id = NEW.id AND a.type_id <> NEW.type_id)",
+        hierarchy.CATEGORY_TYPE_ERROR,
+    ),
+    (
+        "dds_subcategory_category_check",
+        "dds_app_subcategory",
+        "category_id",
+        "EXISTS (SELECT 1 FROM dds_app_cashflowstatement r"
+        " WHERE r.subcategory_id = NEW.id AND r.category_id <> NEW.category_id)"
+        " OR EXISTS (SELECT 1 FROM dds_app_archivedcashflowstatement a"
+        " WHERE a.subcategory_id = NEW.id AND a.category_id <> NEW.category_id)",
+        hierarchy.SUBCATEGORY_CATEGORY_ERROR,
+    ),
+]
+
+
+def replace_triggers(checks):
+    def replace(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for name, table, *_ in checks:
+            if vendor == "postgresql":
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+            elif vendor == "sqlite":
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}_update")
+        if vendor not in ("postgresql", "sqlite"):
+            return
+        build = (
+            hierarchy.postgresql_sql if vendor == "postgresql" else hierarchy.sqlite_sql
+        )
+        for check in checks:
+            for sql in build(*check):
+                schema_editor.execute(sql)
+
+    return replace
+
+
+ORIGINAL_CHECKS = [
+    check
+    for check in hierarchy.CHECKS
+    if check[0] in {name for name, *_ in ARCHIVE_CHECKS}
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0007_amount_sort_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatementWithArchive",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("created_at", models.DateField(verbose_name="Реальная дата создания")),
+                (
+                    "custom_date",
+                    models.DateField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Пользовательское время создания",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=12, verbose_name="Сумма"
+                    ),
+                ),
+                ("comment", models.TextField(blank=True, verbose_name="Комментарий")),
+                ("archived", models.BooleanField(verbose_name="В архиве")),
+            ],
+            options={
+                "verbose_name": "Запись (с архивом)",
+                "verbose_name_plural": "Записи (с архивом)",
+                "db_table": "dds_app_statement_all",
+                "ordering": ("-custom_date",),
+                "abstract": False,
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedCashFlowStatement",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("created_at", models.DateField(verbose_name="Реальная дата создания")),
+                (
+                    "custom_date",
+                    models.DateField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Пользовательское время создания",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=12, verbose_name="Сумма"
+                    ),
+                ),
+                ("comment", models.TextField(blank=True, verbose_name="Комментарий")),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="dds_app.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="dds_app.status",
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="dds_app.subcategory",
+                        verbose_name="Подкатегория",
+                    ),
+                ),
+                (
+                    "type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="dds_app.type",
+                        verbose_name="Тип",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_statements",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивная запись",
+                "verbose_name_plural": "Архивные записи",
+                "ordering": ("-custom_date",),
+                "abstract": False,
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-custom_date", "-id"],
+                        name="dds_archive_user_date_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(CREATE_VIEW, DROP_VIEW),
+        migrations.RunPython(
+            replace_triggers(ARCHIVE_CHECKS), replace_triggers(ORIGINAL_CHECKS)
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+# Существующие типы с такими словами в названии считаем приходом, остальные - расходом
+INFLOW_WORDS = ("приход", "поступлен", "пополнен", "доход")
+
+
+def set_inflow_directions(apps, schema_editor):
+    Type = apps.get_model("dds_app", "Type")
+    for type in Type.objects.all():
+        if any(word in type.name.casefold() for word in INFLOW_WORDS):
+            type.direction = "in"
+            type.save(update_fields=["direction"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dds_app", "0009_filterpreset"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="type",
+            name="direction",
+            field=models.CharField(
+                choices=[("in", "Приход"), ("out", "Расход")],
+                default="out",
+                max_length=3,
+                verbose_name="Направление",
+            ),
+        ),
+        migrations.RunPython(set_inflow_directions, migrations.RunPython.noop),
+    ]
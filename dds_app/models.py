@@ -2,11 +2,16 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
+from django.utils.http import urlencode
 
 
 class Type(models.Model):
     """Модель типа операции"""
 
+    INFLOW = "in"
+    OUTFLOW = "out"
+    DIRECTION_CHOICES = ((INFLOW, "Приход"), (OUTFLOW, "Расход"))
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -14,6 +19,13 @@ class Type(models.Model):
         verbose_name="Пользователь",
     )
     name = models.CharField(max_length=100, verbose_name="Название")
+    # Знак суммы записей этого типа в отчётах и остатке
+    direction = models.CharField(
+        max_length=3,
+        choices=DIRECTION_CHOICES,
+        default=OUTFLOW,
+        verbose_name="Направление",
+    )
 
     class Meta:
         unique_together = ("user", "name")
@@ -127,6 +139,42 @@ class CashFlowStatement(models.Model):
         verbose_name = "Запись"
         verbose_name_plural = "Записи"
         ordering = ("-custom_date",)
+        # Составные индексы под фильтры главной таблицы: все запросы начинаются с user,
+        # затем идёт условие фильтра и сортировка (-custom_date, -id) без отдельного
+        # Sort
+        indexes = [
+            models.Index(
+                fields=["user", "-custom_date", "-id"], name="dds_stmt_user_date_idx"
+            ),
+            models.Index(
+                fields=["user", "type", "-custom_date", "-id"],
+                name="dds_stmt_user_type_idx",
+            ),
+            models.Index(
+                fields=["user", "category", "-custom_date", "-id"],
+                name="dds_stmt_user_cat_idx",
+            ),
+            models.Index(
+                fields=["user", "subcategory", "-custom_date", "-id"],
+                name="dds_stmt_user_subcat_idx",
+            ),
+            models.Index(
+                fields=["user", "status", "-custom_date", "-id"],
+                name="dds_stmt_user_status_idx",
+            ),
+            # Фильтр по диапазону суммы и сортировка по сумме с устойчивым порядком
+            # по id
+            models.Index(
+                fields=["user", "amount", "id"], name="dds_stmt_user_amount_id_idx"
+            ),
+            # Частичный индекс: поиск по комментарию смотрит только записи
+            # с комментарием
+            models.Index(
+                fields=["user", "-custom_date", "-id"],
+                name="dds_stmt_user_comment_idx",
+                condition=~models.Q(comment=""),
+            ),
+        ]
 
     # Заполним кастомное поле при создании записим текущей датой
     def save(self, *args, **kwargs):
@@ -135,14 +183,199 @@ class CashFlowStatement(models.Model):
         super().save(*args, **kwargs)
 
     def clean(self):
-        # Проверка соответсвия категории и подкатегории
-        if self.subcategory and self.subcategory.category != self.category:
+        # Согласованность справочников гарантируют триггеры БД (миграция 0006), даже
+        # для bulk_create и update. Здесь проверяем только уже загруженные объекты
+        # (их подставляет форма), чтобы показать понятную ошибку без лишних запросов
+        cls = type(self)
+        if (
+            cls.subcategory.is_cached(self)
+            and self.subcategory.category_id != self.category_id
+        ):
             raise ValidationError(
                 "Выбранная подкатегория не принадлежит указанной категории"
             )
-        # Проверка соответсвия категории и типа
-        if self.category and self.category.type != self.type:
+        if cls.category.is_cached(self) and self.category.type_id != self.type_id:
             raise ValidationError("Выбранная категория не принадлежит указанному типу")
 
     def __str__(self):
         return f"Дата создания операции: {self.custom_date} | Тип: {self.type} | Категория: {self.category} | Подкатегория: {self.subcategory} | Сумма: {self.amount} ₽"
+
+
+class StatementFields(models.Model):
+    """
+    Поля ДДС-записи для архива и объединённого представления; id совпадает
+    с исходной записью
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateField(verbose_name="Реальная дата создания")
+    custom_date = models.DateField(
+        blank=True, null=True, verbose_name="Пользовательское время создания"
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма")
+    comment = models.TextField(blank=True, verbose_name="Комментарий")
+
+    class Meta:
+        abstract = True
+        ordering = ("-custom_date",)
+
+    def __str__(self):
+        return (
+            f"Дата создания операции: {self.custom_date} | Тип: {self.type} | "
+            f"Категория: {self.category} | Подкатегория: {self.subcategory} | "
+            f"Сумма: {self.amount} ₽"
+        )
+
+
+class ArchivedCashFlowStatement(StatementFields):
+    """Старая ДДС-запись, перенесённая из основной таблицы archive_statements"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="archived_statements",
+        verbose_name="Пользователь",
+    )
+    type = models.ForeignKey(
+        Type, on_delete=models.PROTECT, related_name="+", verbose_name="Тип"
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.PROTECT, related_name="+", verbose_name="Категория"
+    )
+    subcategory = models.ForeignKey(
+        Subcategory,
+        on_delete=models.PROTECT,
+        related_name="+",
+        verbose_name="Подкатегория",
+    )
+    status = models.ForeignKey(
+        Status, on_delete=models.PROTECT, related_name="+", verbose_name="Статус"
+    )
+
+    class Meta(StatementFields.Meta):
+        verbose_name = "Архивная запись"
+        verbose_name_plural = "Архивные записи"
+        indexes = [
+            models.Index(
+                fields=["user", "-custom_date", "-id"], name="dds_archive_user_date_idx"
+            ),
+        ]
+
+
+class StatementWithArchive(StatementFields):
+    """
+    Основные и архивные записи вместе: представление БД с UNION ALL двух таблиц
+    (миграция 0008). Только для чтения; archived отмечает записи из архива
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, related_name="+", verbose_name="Пользователь"
+    )
+    type = models.ForeignKey(
+        Type, on_delete=models.DO_NOTHING, related_name="+", verbose_name="Тип"
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+        verbose_name="Категория",
+    )
+    subcategory = models.ForeignKey(
+        Subcategory,
+        on_delete=models.DO_NOTHING,
+        related_name="+",
+        verbose_name="Подкатегория",
+    )
+    status = models.ForeignKey(
+        Status, on_delete=models.DO_NOTHING, related_name="+", verbose_name="Статус"
+    )
+    archived = models.BooleanField(verbose_name="В архиве")
+
+    class Meta(StatementFields.Meta):
+        managed = False
+        db_table = "dds_app_statement_all"
+        verbose_name = "Запись (с архивом)"
+        verbose_name_plural = "Записи (с архивом)"
+
+
+class FilterPreset(models.Model):
+    """Именованный фильтр главной таблицы, сохранённый пользователем"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="filter_presets",
+        verbose_name="Пользователь",
+    )
+    name = models.CharField(max_length=100, verbose_name="Название")
+    params = models.JSONField(default=dict, verbose_name="Параметры фильтра")
+
+    class Meta:
+        unique_together = ("user", "name")
+        verbose_name = "Сохранённый фильтр"
+        verbose_name_plural = "Сохранённые фильтры"
+        ordering = ("name",)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def query_string(self):
+        """Параметры фильтра для ссылки на главную таблицу"""
+        return urlencode(self.params)
+
+
+class CashFlowRollup(models.Model):
+    """Агрегаты ДДС-записей по дням и месяцам, обновляются при каждом изменении"""
+
+    DAY = "day"
+    MONTH = "month"
+    PERIOD_CHOICES = ((DAY, "День"), (MONTH, "Месяц"))
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="rollups",
+        verbose_name="Пользователь",
+    )
+    period = models.CharField(
+        max_length=5, choices=PERIOD_CHOICES, verbose_name="Период"
+    )
+    period_start = models.DateField(verbose_name="Начало периода")
+    type = models.ForeignKey(Type, on_delete=models.CASCADE, verbose_name="Тип")
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, verbose_name="Категория"
+    )
+    subcategory = models.ForeignKey(
+        Subcategory, on_delete=models.CASCADE, verbose_name="Подкатегория"
+    )
+    status = models.ForeignKey(Status, on_delete=models.CASCADE, verbose_name="Статус")
+    total = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0, verbose_name="Сумма"
+    )
+    count = models.IntegerField(default=0, verbose_name="Количество записей")
+
+    class Meta:
+        verbose_name = "Агрегат ДДС"
+        verbose_name_plural = "Агрегаты ДДС"
+        ordering = ("period", "-period_start")
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "user",
+                    "period",
+                    "period_start",
+                    "type",
+                    "category",
+                    "subcategory",
+                    "status",
+                ],
+                name="dds_rollup_key_uniq",
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.get_period_display()} {self.period_start} | {self.category} | "
+            f"{self.subcategory} | {self.total} ₽"
+        )
@@ -0,0 +1,367 @@
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import (
+    EmptyPage,
+    InvalidPage,
+    Page,
+    PageNotAnInteger,
+    Paginator,
+)
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(InvalidPage):
+    """Курсор повреждён или не соответствует текущей сортировке"""
+
+
+def _resolve_field(queryset, path):
+    """Находим поле модели по пути вида "category__name" или аннотацию запроса"""
+    if path in queryset.query.annotations:
+        return queryset.query.annotations[path].output_field
+    model = queryset.model
+    *relations, name = path.split("__")
+    for part in relations:
+        model = model._meta.get_field(part).related_model
+    return model._meta.get_field(name)
+
+
+def reverse_ordering(ordering):
+    """Обратный порядок: меняем направление каждого поля"""
+    return tuple(name[1:] if name.startswith("-") else f"-{name}" for name in ordering)
+
+
+class KeysetPage:
+    """Страница keyset-пагинации, совместимая по интерфейсу с шаблонами Django"""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Keyset (seek) пагинация: вместо OFFSET/LIMIT и COUNT(*) страница выбирается
+    условием "строго после последней показанной записи" по составному ключу
+    сортировки. Последним полем сортировки обязан быть уникальный id.
+    """
+
+    def __init__(self, queryset, per_page, ordering=("-custom_date", "-id")):
+        if ordering[-1].lstrip("-") != "id":
+            raise ValueError("Последним полем keyset-сортировки должен быть id")
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [
+            (
+                name.lstrip("-"),
+                name.startswith("-"),
+                _resolve_field(queryset, name.lstrip("-")),
+            )
+            for name in self.ordering
+        ]
+
+    def encode_cursor(self, obj, backwards=False):
+        """Кодируем ключ записи в непрозрачную строку для URL"""
+        values = []
+        for path, _, _ in self.fields:
+            value = obj
+            for part in path.split("__"):
+                value = getattr(value, part)
+            values.append(value)
+        payload = {"k": self.ordering, "v": values, "b": backwards}
+        raw = json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":"))
+        raw = raw.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Раскодируем курсор и приводим значения к типам полей"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            if tuple(payload["k"]) != self.ordering:
+                raise InvalidCursor("Курсор относится к другой сортировке")
+            if len(payload["v"]) != len(self.fields):
+                raise InvalidCursor("Курсор относится к другой сортировке")
+            values = [
+                None if value is None else field.to_python(value)
+                for (_, _, field), value in zip(self.fields, payload["v"])
+            ]
+            return values, bool(payload["b"])
+        except (
+            binascii.Error,
+            ValueError,
+            KeyError,
+            TypeError,
+            ValidationError,
+        ) as exc:
+            raise InvalidCursor("Некорректный курсор") from exc
+
+    def _seek_filter(self, values, backwards):
+        """
+        Условие "после ключа" для составной сортировки:
+        (a > va) OR (a = va AND b > vb) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for (path, descending, _), value in zip(self.fields, values):
+            after = descending != backwards
+            lookup = "lt" if after else "gt"
+            condition |= equal & Q(**{f"{path}__{lookup}": value})
+            equal &= Q(**{path: value})
+        return condition
+
+    def _page_queryset(self, cursor):
+        """Запрос страницы после (или перед) записью из курсора"""
+        backwards = False
+        qs = self.queryset
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+            qs = qs.filter(self._seek_filter(values, backwards))
+
+        ordering = reverse_ordering(self.ordering) if backwards else self.ordering
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        return qs.order_by(*ordering)[: self.per_page + 1], backwards
+
+    def _build_page(self, rows, cursor, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self.encode_cursor(rows[-1])
+            if (cursor and not backwards) or (backwards and has_more):
+                previous_cursor = self.encode_cursor(rows[0], backwards=True)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        """Возвращаем страницу после (или перед) записью из курсора"""
+        qs, backwards = self._page_queryset(cursor)
+        return self._build_page(list(qs), cursor, backwards)
+
+    async def apage(self, cursor=None):
+        """Асинхронный вариант page"""
+        qs, backwards = self._page_queryset(cursor)
+        rows = [obj async for obj in qs.aiterator()]
+        return self._build_page(rows, cursor, backwards)
+
+
+class PaginatorSnapshot:
+    """Поля пагинатора, которые нужны шаблону, уже посчитанные"""
+
+    fields = ("per_page", "count", "num_pages", "count_approximate", "count_label")
+
+    def __init__(self, paginator):
+        for name in self.fields:
+            if hasattr(paginator, name):
+                setattr(self, name, getattr(paginator, name))
+
+
+class PageSnapshot:
+    """
+    Снимок страницы для кэша: записи и всё, что шаблон берёт из страницы и
+    пагинатора. Ссылок на queryset нет, поэтому снимок сериализуется без запросов
+    """
+
+    def __init__(self, page):
+        self.object_list = list(page.object_list)
+        self.paginator = PaginatorSnapshot(page.paginator)
+        self.number = getattr(page, "number", None)
+        self.next_cursor = getattr(page, "next_cursor", None)
+        self.previous_cursor = getattr(page, "previous_cursor", None)
+        self._has_next = page.has_next()
+        self._has_previous = page.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def as_paginated(self):
+        """Результат в виде, который возвращает ListView.paginate_queryset"""
+        return (self.paginator, self, self.object_list, self.has_other_pages())
+
+
+def planner_estimate(queryset):
+    """Оценка числа строк планировщиком PostgreSQL (EXPLAIN без выполнения) или None"""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _format_number(number):
+    return f"{number:,}".replace(",", " ")
+
+
+class ApproximatePage(Page):
+    """
+    Страница выборки с приблизительным числом записей: следующая страница есть,
+    если после этой нашлась ещё запись, а не по оценке числа страниц
+    """
+
+    def __init__(self, rows, number, paginator):
+        self.has_more = len(rows) > paginator.per_page
+        super().__init__(rows[: paginator.per_page], number, paginator)
+
+    def has_next(self):
+        return self.has_more
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator без COUNT(*) по всей выборке на каждый запрос. Число записей кэшируется
+    по cache_key (версия данных пользователя и нормализованный фильтр) и считается
+    не дальше count_limit строк. Если записей больше, число приблизительное:
+    оценка планировщика PostgreSQL, а в других БД - "count_limit+". Такая оценка
+    может быть меньше настоящего числа, поэтому страницы за ней не отсекаются
+    """
+
+    def __init__(self, object_list, per_page, cache_key, count_limit=10000, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.count_limit = count_limit
+
+    def _count_result(self, count, estimate):
+        approximate = count > self.count_limit
+        if approximate and estimate is not None:
+            count = max(count, estimate)
+        return (count, approximate, approximate and estimate is not None)
+
+    @cached_property
+    def _count(self):
+        """(число записей, приблизительное ли оно, оценка ли это планировщика)"""
+        result = cache.get(self.cache_key)
+        if result is None:
+            queryset = self.object_list.order_by()
+            count = queryset[: self.count_limit + 1].count()
+            estimate = planner_estimate(queryset) if count > self.count_limit else None
+            result = self._count_result(count, estimate)
+            cache.set(self.cache_key, result)
+        return result
+
+    async def aprefetch_count(self):
+        """Асинхронно получаем число записей, чтобы пагинатор не обращался к БД"""
+        result = await cache.aget(self.cache_key)
+        if result is None:
+            queryset = self.object_list.order_by()
+            count = await queryset[: self.count_limit + 1].acount()
+            estimate = None
+            if count > self.count_limit:
+                estimate = await sync_to_async(planner_estimate)(queryset)
+            result = self._count_result(count, estimate)
+            await cache.aset(self.cache_key, result)
+        self._count = result
+
+    def validate_number(self, number):
+        if not self.count_approximate:
+            return super().validate_number(number)
+        # Номер страницы не сравниваем с оценкой числа страниц
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def _approximate_slice(self, number):
+        """Записи страницы и ещё одна - по ней видно, есть ли следующая страница"""
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page + 1
+        return self.object_list[bottom:top]
+
+    def _approximate_page(self, rows, number):
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return ApproximatePage(rows, number, self)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_approximate:
+            return super().page(number)
+        return self._approximate_page(list(self._approximate_slice(number)), number)
+
+    async def apage(self, number):
+        """Асинхронный вариант page: число записей уже получено aprefetch_count"""
+        number = self.validate_number(number)
+        if not self.count_approximate:
+            page = super().page(number)
+            page.object_list = [obj async for obj in page.object_list.aiterator()]
+            return page
+        rows = [obj async for obj in self._approximate_slice(number).aiterator()]
+        return self._approximate_page(rows, number)
+
+    @property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def count_approximate(self):
+        return self._count[1]
+
+    @property
+    def count_label(self):
+        count, approximate, estimated = self._count
+        if not approximate:
+            return _format_number(count)
+        if estimated:
+            return f"≈{_format_number(count)}"
+        return f"{_format_number(self.count_limit)}+"
@@ -0,0 +1,305 @@
+import re
+from datetime import date
+from importlib import import_module
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import CashFlowStatement
+from .versions import STATEMENTS, bump_version
+
+# Секционирование таблицы записей по custom_date (только PostgreSQL). Записи без даты
+# и с датами вне созданных секций попадают в секцию по умолчанию
+STATEMENT_TABLE = CashFlowStatement._meta.db_table
+DEFAULT_PARTITION = f"{STATEMENT_TABLE}_default"
+INTERVALS = ("month", "year")
+
+BOUND_RE = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+class PartitionError(Exception):
+    """Операция с секциями невозможна в текущем состоянии таблицы"""
+
+
+class Partition:
+    """Секция таблицы записей: имя, границы [start, end) и оценка числа строк"""
+
+    def __init__(self, name, start, end, rows):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.rows = rows
+
+    @property
+    def is_default(self):
+        return self.start is None
+
+
+def period_start(day, interval):
+    return day.replace(day=1) if interval == "month" else day.replace(month=1, day=1)
+
+
+def next_period(start, interval):
+    if interval == "year":
+        return start.replace(year=start.year + 1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start, interval):
+    suffix = f"{start:%Y_%m}" if interval == "month" else f"{start:%Y}"
+    return f"{STATEMENT_TABLE}_p{suffix}"
+
+
+def _check_vendor():
+    if connection.vendor != "postgresql":
+        raise PartitionError("Секционирование поддерживается только в PostgreSQL")
+
+
+def is_partitioned():
+    """Таблица записей уже секционирована"""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+            [STATEMENT_TABLE],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def list_partitions():
+    """Секции таблицы записей по возрастанию границ, секция по умолчанию - последней"""
+    _check_vendor()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            [STATEMENT_TABLE],
+        )
+        result = cursor.fetchall()
+    partitions = []
+    for name, bound, rows in result:
+        match = BOUND_RE.search(bound)
+        start, end = (
+            (date.fromisoformat(match[1]), date.fromisoformat(match[2]))
+            if match
+            else (None, None)
+        )
+        partitions.append(Partition(name, start, end, max(int(rows), 0)))
+    partitions.sort(key=lambda p: (p.is_default, p.start or date.min))
+    return partitions
+
+
+def _create_partition(cursor, start, end, name):
+    """
+    Создаём секцию [start, end). Если такие даты уже лежат в секции по умолчанию,
+    переносим их: PostgreSQL не даёт создать секцию, пересекающуюся со строками default
+    """
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION}"
+        " WHERE custom_date >= %s AND custom_date < %s)",
+        [start, end],
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {STATEMENT_TABLE}"
+            " FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+        return
+    cursor.execute(f"CREATE TABLE {name} (LIKE {STATEMENT_TABLE} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION}"
+        " WHERE custom_date >= %s AND custom_date < %s RETURNING *)"
+        f" INSERT INTO {name} SELECT * FROM moved",
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {STATEMENT_TABLE} ATTACH PARTITION {name}"
+        " FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+
+
+def create_partitions(first, last, interval):
+    """
+    Создаём недостающие секции для периодов с first по last включительно.
+    Периоды, пересекающиеся с существующими секциями, пропускаются
+    """
+    _check_vendor()
+    if not is_partitioned():
+        raise PartitionError("Таблица записей не секционирована")
+    existing = [p for p in list_partitions() if not p.is_default]
+    created = []
+    start = period_start(first, interval)
+    with transaction.atomic(), connection.cursor() as cursor:
+        while start <= last:
+            end = next_period(start, interval)
+            if not any(p.start < end and start < p.end for p in existing):
+                name = partition_name(start, interval)
+                _create_partition(cursor, start, end, name)
+                created.append(name)
+            start = end
+    return created
+
+
+def detach_partitions(before, drop=False):
+    """
+    Отсоединяем секции, целиком лежащие раньше даты before. Отсоединённая секция
+    остаётся отдельной таблицей без внешних ключей (её можно выгрузить или удалить,
+    а справочники - менять), приложение её больше не видит; с drop=True она
+    удаляется. Вклад отсоединённых записей вычитается из агрегатов в той же
+    транзакции (архивные записи тех же периодов в агрегатах остаются), а версия
+    записей затронутых пользователей меняется после её фиксации
+    """
+    _check_vendor()
+    detached = []
+    user_ids = set()
+    columns = ", ".join(rollups.KEY_FIELDS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for partition in list_partitions():
+            if partition.is_default or partition.end > before:
+                continue
+            cursor.execute(
+                f"SELECT {columns}, SUM(amount), COUNT(*) FROM {partition.name}"
+                f" GROUP BY {columns}"
+            )
+            groups = [
+                dict(zip(rollups.KEY_FIELDS + ("total", "count"), row))
+                for row in cursor.fetchall()
+            ]
+            rollups.subtract_groups(groups)
+            user_ids.update(group["user_id"] for group in groups)
+            cursor.execute(
+                f"ALTER TABLE {STATEMENT_TABLE} DETACH PARTITION {partition.name}"
+            )
+            if drop:
+                cursor.execute(f"DROP TABLE {partition.name}")
+            else:
+                cursor.execute(
+                    "SELECT conname FROM pg_constraint"
+                    " WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+                    [partition.name],
+                )
+                for (name,) in cursor.fetchall():
+                    cursor.execute(
+                        f"ALTER TABLE {partition.name} DROP CONSTRAINT {name}"
+                    )
+            detached.append(partition)
+        # Кэш числа записей, страниц, отчётов и остатков не должен показывать
+        # отсоединённые записи
+        for user_id in user_ids:
+            bump_version(STATEMENTS, user_id)
+    return detached
+
+
+def _statement_triggers():
+    """SQL триггеров согласованности справочников записи (миграция 0006)"""
+    migration = import_module("dds_app.migrations.0006_statement_hierarchy_triggers")
+    return [
+        sql
+        for check in migration.CHECKS
+        if check[1] == STATEMENT_TABLE
+        for sql in migration.postgresql_sql(*check)
+    ]
+
+
+def _archive_view():
+    """SQL представления записей вместе с архивом (миграция 0008)"""
+    migration = import_module("dds_app.migrations.0008_statement_archive")
+    return migration.CREATE_VIEW, migration.DROP_VIEW
+
+
+def convert_table(interval, ahead=3):
+    """
+    Переводим обычную таблицу записей в секционированную по custom_date.
+    Выполняется в одной транзакции под эксклюзивной блокировкой: создаётся новая
+    таблица с секциями на весь диапазон дат, данные копируются, старая таблица
+    удаляется, а индексы, внешние ключи, последовательность id и триггеры
+    создаются заново под прежними именами. Первичный ключ секционированной
+    таблицы должен включать ключ секционирования, поэтому вместо него - уникальный
+    индекс (id, custom_date); уникальность id обеспечивает последовательность.
+    Представление с архивом зависит от таблицы и пересоздаётся вместе с ней
+    """
+    _check_vendor()
+    if interval not in INTERVALS:
+        raise PartitionError(f"Интервал должен быть одним из: {', '.join(INTERVALS)}")
+    if is_partitioned():
+        raise PartitionError("Таблица записей уже секционирована")
+    old = f"{STATEMENT_TABLE}_unpartitioned"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {STATEMENT_TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [STATEMENT_TABLE, f"{STATEMENT_TABLE}_pkey"],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = to_regclass(%s) AND contype IN ('f', 'c')",
+            [STATEMENT_TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            f"SELECT min(custom_date), max(custom_date), coalesce(max(id), 0)"
+            f" FROM {STATEMENT_TABLE}"
+        )
+        first, last, max_id = cursor.fetchone()
+
+        create_view, drop_view = _archive_view()
+        cursor.execute(drop_view)
+        cursor.execute(f"ALTER TABLE {STATEMENT_TABLE} RENAME TO {old}")
+        cursor.execute(
+            f"CREATE TABLE {STATEMENT_TABLE} (LIKE {old} INCLUDING DEFAULTS)"
+            " PARTITION BY RANGE (custom_date)"
+        )
+        cursor.execute(
+            f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {STATEMENT_TABLE} DEFAULT"
+        )
+        today = timezone.localdate()
+        start = period_start(min(first or today, today), interval)
+        last = max(last or today, today)
+        for _ in range(ahead):
+            last = next_period(period_start(last, interval), interval)
+        while start <= last:
+            end = next_period(start, interval)
+            cursor.execute(
+                f"CREATE TABLE {partition_name(start, interval)} PARTITION OF"
+                f" {STATEMENT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+            start = end
+
+        cursor.execute(f"INSERT INTO {STATEMENT_TABLE} SELECT * FROM {old}")
+        cursor.execute(f"DROP TABLE {old}")
+
+        sequence = f"{STATEMENT_TABLE}_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {STATEMENT_TABLE}.id")
+        cursor.execute(
+            "SELECT setval(%s, %s, %s)", [sequence, max(max_id, 1), max_id > 0]
+        )
+        cursor.execute(
+            f"ALTER TABLE {STATEMENT_TABLE} ALTER COLUMN id"
+            f" SET DEFAULT nextval('{sequence}')"
+        )
+        cursor.execute(
+            f"CREATE UNIQUE INDEX {STATEMENT_TABLE}_pkey"
+            f" ON {STATEMENT_TABLE} (id, custom_date)"
+        )
+        for sql in indexes:
+            cursor.execute(sql)
+        for name, definition in constraints:
+            cursor.execute(
+                f"ALTER TABLE {STATEMENT_TABLE} ADD CONSTRAINT {name} {definition}"
+            )
+        for sql in _statement_triggers():
+            cursor.execute(sql)
+        cursor.execute(create_view)
+    return list_partitions()
@@ -0,0 +1,124 @@
+from django.core.cache import cache
+
+from .models import Category, Status, Subcategory, Type
+from .versions import REFERENCES, aget_version, bump_version, get_version
+
+REFERENCE_MODELS = {
+    "type": Type,
+    "category": Category,
+    "subcategory": Subcategory,
+    "status": Status,
+}
+# Справочник и его родитель в иерархии тип → категория → подкатегория
+REFERENCE_PARENTS = {"category": "type", "subcategory": "category"}
+# Данные версии живут сутки; при любом изменении справочника версия меняется сразу
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_reference_version(user_id):
+    """Текущая версия справочников пользователя"""
+    return get_version(REFERENCES, user_id)
+
+
+async def aget_reference_version(user_id):
+    return await aget_version(REFERENCES, user_id)
+
+
+def bump_reference_version(user_id):
+    """Инвалидируем кэш справочников пользователя после фиксации транзакции"""
+    bump_version(REFERENCES, user_id)
+
+
+class ReferenceSet:
+    """Все справочники пользователя одной версии"""
+
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    @property
+    def types(self):
+        return self.data["type"]
+
+    @property
+    def categories(self):
+        return self.data["category"]
+
+    @property
+    def subcategories(self):
+        return self.data["subcategory"]
+
+    @property
+    def statuses(self):
+        return self.data["status"]
+
+
+def _references_key(user_id, version):
+    return f"dds:refs:{user_id}:{version}"
+
+
+def get_references(user):
+    """Справочники пользователя из кэша; при промахе - четыре запроса к БД"""
+    version = get_reference_version(user.pk)
+    key = _references_key(user.pk, version)
+    references = cache.get(key)
+    if references is None:
+        references = ReferenceSet(
+            version,
+            {
+                name: list(model.objects.filter(user_id=user.pk))
+                for name, model in REFERENCE_MODELS.items()
+            },
+        )
+        cache.set(key, references, CACHE_TIMEOUT)
+    return references
+
+
+async def aget_references(user):
+    """Асинхронный вариант get_references"""
+    version = await aget_reference_version(user.pk)
+    key = _references_key(user.pk, version)
+    references = await cache.aget(key)
+    if references is None:
+        data = {}
+        for name, model in REFERENCE_MODELS.items():
+            data[name] = [
+                obj async for obj in model.objects.filter(user_id=user.pk).aiterator()
+            ]
+        references = ReferenceSet(version, data)
+        await cache.aset(key, references, CACHE_TIMEOUT)
+    return references
+
+
+def filter_by_name(objects, query):
+    """Поиск по вхождению в название, как icontains"""
+    query = (query or "").strip().casefold()
+    if not query:
+        return list(objects)
+    return [obj for obj in objects if query in obj.name.casefold()]
+
+
+def filter_by_parent(objects, name, parent_id):
+    """Оставляем элементы справочника name, принадлежащие родителю parent_id"""
+    if not parent_id:
+        return list(objects)
+    attname = f"{REFERENCE_PARENTS[name]}_id"
+    return [obj for obj in objects if str(getattr(obj, attname)) == str(parent_id)]
+
+
+def reference_tree(references):
+    """
+    Компактное дерево тип → категория → подкатегория для фильтрации на клиенте:
+    списки [id, название] и [id, название, id родителя]
+    """
+    tree = {"version": references.version}
+    for name in ("type", "category", "subcategory"):
+        parent = REFERENCE_PARENTS.get(name)
+        tree[name] = [
+            [obj.pk, obj.name] + ([getattr(obj, f"{parent}_id")] if parent else [])
+            for obj in references[name]
+        ]
+    return tree
@@ -0,0 +1,173 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+
+from .models import CashFlowRollup, Type
+from .reference_cache import get_references
+from .versions import STATEMENTS, get_version
+
+# Справочник, по которому разбиваются столбцы отчёта
+GROUP_CHOICES = (
+    ("category", "Категория"),
+    ("subcategory", "Подкатегория"),
+    ("type", "Тип"),
+    ("status", "Статус"),
+)
+# Показатель в ячейках: поступления, списания или их разница
+MEASURE_CHOICES = (
+    ("net", "Итого"),
+    ("inflow", "Приход"),
+    ("outflow", "Расход"),
+)
+CACHE_TIMEOUT = 24 * 60 * 60
+# SQLite возвращает суммы без дробной части ("54"), PostgreSQL - с двумя знаками
+CENTS = Decimal("0.01")
+
+
+def month_range(first, last):
+    """Первые числа месяцев с first по last включительно"""
+    months = []
+    month = first.replace(day=1)
+    while month <= last:
+        months.append(month)
+        month = month.replace(
+            year=month.year + month.month // 12, month=month.month % 12 + 1
+        )
+    return months
+
+
+def _flows():
+    return {"inflow": Decimal("0.00"), "outflow": Decimal("0.00")}
+
+
+def _value(flows, measure):
+    if measure == "net":
+        return flows["inflow"] - flows["outflow"]
+    return flows[measure]
+
+
+class MonthlyReport:
+    """
+    Сводная таблица месяц × элемент справочника: поступления и списания в каждой
+    ячейке. Хранит только посчитанные суммы, поэтому целиком кладётся в кэш
+    """
+
+    def __init__(self, months, columns, cells):
+        self.months = months
+        # [(id, название)] элементов справочника, встретившихся в периоде
+        self.columns = columns
+        # {(месяц, id): {"inflow": ..., "outflow": ...}}
+        self.cells = cells
+
+    def month_flows(self, month):
+        flows = _flows()
+        for column_id, _ in self.columns:
+            cell = self.cells.get((month, column_id))
+            if cell:
+                flows["inflow"] += cell["inflow"]
+                flows["outflow"] += cell["outflow"]
+        return flows
+
+    def rows(self, measure):
+        """Строки таблицы: месяц, значения по столбцам, приход, расход и итог месяца"""
+        rows = []
+        for month in self.months:
+            values = [
+                _value(self.cells.get((month, column_id), _flows()), measure)
+                for column_id, _ in self.columns
+            ]
+            flows = self.month_flows(month)
+            rows.append(
+                (month, values, flows["inflow"], flows["outflow"], _value(flows, "net"))
+            )
+        return rows
+
+    def totals(self, measure):
+        """Итоговая строка за весь период"""
+        column_totals = []
+        for column_id, _ in self.columns:
+            flows = _flows()
+            for month in self.months:
+                cell = self.cells.get((month, column_id))
+                if cell:
+                    flows["inflow"] += cell["inflow"]
+                    flows["outflow"] += cell["outflow"]
+            column_totals.append(_value(flows, measure))
+        flows = _flows()
+        for month in self.months:
+            month_flows = self.month_flows(month)
+            flows["inflow"] += month_flows["inflow"]
+            flows["outflow"] += month_flows["outflow"]
+        return column_totals, flows["inflow"], flows["outflow"], _value(flows, "net")
+
+
+def build_monthly_report(user, first, last, group="category", references=None):
+    """
+    Отчёт одним запросом GROUP BY к месячным агрегатам CashFlowRollup: их строки уже
+    разбиты по месяцам, поэтому объём чтения зависит от числа месяцев и справочников,
+    а не от числа записей. Приход и расход считаются условной агрегацией по
+    направлению типа; названия столбцов берутся из кэша справочников
+    """
+    references = references or get_references(user)
+    inflow_types = [t.pk for t in references.types if t.direction == Type.INFLOW]
+    amount = DecimalField(max_digits=18, decimal_places=2)
+    months = month_range(first, last)
+    rows = (
+        CashFlowRollup.objects.filter(
+            user=user,
+            period=CashFlowRollup.MONTH,
+            period_start__gte=months[0],
+            period_start__lte=months[-1],
+        )
+        .values("period_start", f"{group}_id")
+        .annotate(
+            inflow=Sum(
+                Case(
+                    When(type_id__in=inflow_types, then=F("total")),
+                    default=Value(0),
+                    output_field=amount,
+                )
+            ),
+            outflow=Sum(
+                Case(
+                    When(type_id__in=inflow_types, then=Value(0)),
+                    default=F("total"),
+                    output_field=amount,
+                )
+            ),
+        )
+        .order_by("period_start", f"{group}_id")
+    )
+    cells = {}
+    used = set()
+    for row in rows:
+        column_id = row[f"{group}_id"]
+        used.add(column_id)
+        cells[(row["period_start"], column_id)] = {
+            "inflow": Decimal(row["inflow"] or 0).quantize(CENTS),
+            "outflow": Decimal(row["outflow"] or 0).quantize(CENTS),
+        }
+    columns = [(obj.pk, obj.name) for obj in references[group] if obj.pk in used]
+    columns.sort(key=lambda column: column[1].casefold())
+    return MonthlyReport(months, columns, cells)
+
+
+def get_monthly_report(user, first, last, group="category"):
+    """
+    Отчёт из кэша. Ключ включает версии записей и справочников пользователя,
+    поэтому после любого их изменения отчёт считается заново
+    """
+    references = get_references(user)
+    params = json.dumps([str(first), str(last), group])
+    key = (
+        f"dds:report:{user.pk}:{get_version(STATEMENTS, user.pk)}:"
+        f"{references.version}:{hashlib.md5(params.encode()).hexdigest()}"
+    )
+    report = cache.get(key)
+    if report is None:
+        report = build_monthly_report(user, first, last, group, references)
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
@@ -0,0 +1,174 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import CashFlowRollup, StatementWithArchive
+
+# Поля записи, от которых зависит её вклад в агрегаты
+ROLLUP_FIELDS = (
+    "user_id",
+    "custom_date",
+    "type_id",
+    "category_id",
+    "subcategory_id",
+    "status_id",
+    "amount",
+)
+KEY_FIELDS = ROLLUP_FIELDS[:-1]
+
+
+def statement_values(statement):
+    """Значения полей агрегата из объекта записи"""
+    return {field: getattr(statement, field) for field in ROLLUP_FIELDS}
+
+
+def _period_keys(values):
+    """Ключи строк агрегата (день и месяц), в которые попадает запись"""
+    date = values["custom_date"]
+    base = {field: values[field] for field in KEY_FIELDS if field != "custom_date"}
+    return [
+        {**base, "period": CashFlowRollup.DAY, "period_start": date},
+        {**base, "period": CashFlowRollup.MONTH, "period_start": date.replace(day=1)},
+    ]
+
+
+def _apply(key, total, count):
+    """Прибавляем дельту к одной строке агрегата, создавая её при необходимости"""
+    rows = CashFlowRollup.objects.filter(**key)
+    if not rows.update(total=F("total") + total, count=F("count") + count):
+        try:
+            with transaction.atomic():
+                CashFlowRollup.objects.create(**key, total=total, count=count)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            rows.update(total=F("total") + total, count=F("count") + count)
+    if count < 0:
+        rows.filter(count__lte=0).delete()
+
+
+def _add(deltas, values, total, count):
+    """Копим дельту записи в строках агрегата за день и за месяц"""
+    if values["custom_date"] is None:
+        return
+    for key in _period_keys(values):
+        delta = deltas[tuple(sorted(key.items()))]
+        delta[0] += total
+        delta[1] += count
+
+
+def _flush(deltas):
+    with transaction.atomic():
+        # Сортировка ключей задаёт одинаковый порядок блокировок у параллельных запросов
+        for key, (total, count) in sorted(deltas.items()):
+            if total or count:
+                _apply(dict(key), total, count)
+
+
+def apply_rows(rows, sign=1):
+    """
+    Применяем к агрегатам набор записей (словарей statement_values).
+    sign=1 добавляет записи, sign=-1 вычитает. Дельты предварительно
+    суммируются, поэтому пакет из тысяч записей даёт по запросу на строку агрегата.
+    """
+    deltas = defaultdict(lambda: [Decimal(0), 0])
+    for values in rows:
+        _add(deltas, values, values["amount"] * sign, sign)
+    _flush(deltas)
+
+
+def apply_changes(old_rows, new_rows):
+    """
+    Переносим вклад записей из старых состояний в новые (наборы словарей
+    statement_values). Дельты совпадающих ключей сокращаются до разницы сумм.
+    """
+    deltas = defaultdict(lambda: [Decimal(0), 0])
+    for old in old_rows:
+        _add(deltas, old, -old["amount"], -1)
+    for new in new_rows:
+        _add(deltas, new, new["amount"], 1)
+    _flush(deltas)
+
+
+def subtract_groups(groups):
+    """
+    Вычитаем из агрегатов записи, уже сгруппированные в SQL по полям ключа
+    (словари KEY_FIELDS с суммой total и числом записей count)
+    """
+    deltas = defaultdict(lambda: [Decimal(0), 0])
+    for group in groups:
+        _add(deltas, group, -group["total"], -group["count"])
+    _flush(deltas)
+
+
+def apply_change(old, new):
+    """Переносим вклад одной записи из старого состояния в новое (или None)"""
+    apply_changes([old] if old is not None else [], [new] if new is not None else [])
+
+
+def expected_rollups(user=None):
+    """Агрегаты, посчитанные заново по записям, включая архивные"""
+    qs = StatementWithArchive.objects.exclude(custom_date=None)
+    if user is not None:
+        qs = qs.filter(user=user)
+    group = ("user_id", "type_id", "category_id", "subcategory_id", "status_id")
+    for period, start in (
+        (CashFlowRollup.DAY, F("custom_date")),
+        (CashFlowRollup.MONTH, TruncMonth("custom_date")),
+    ):
+        rows = (
+            qs.annotate(period_start=start)
+            .values("period_start", *group)
+            .annotate(total=Sum("amount"), count=Count("id"))
+            .order_by()
+        )
+        for row in rows.iterator(chunk_size=2000):
+            yield CashFlowRollup(period=period, **row)
+
+
+def rebuild(user=None, batch_size=2000):
+    """Полностью пересобираем агрегаты пользователя (или всех пользователей)"""
+    existing = CashFlowRollup.objects.all()
+    if user is not None:
+        existing = existing.filter(user=user)
+    with transaction.atomic():
+        existing.delete()
+        batch = []
+        created = 0
+        for rollup in expected_rollups(user):
+            batch.append(rollup)
+            if len(batch) >= batch_size:
+                CashFlowRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        CashFlowRollup.objects.bulk_create(batch)
+        return created + len(batch)
+
+
+def verify(user=None):
+    """Сравниваем сохранённые агрегаты с пересчитанными, возвращаем расхождения"""
+
+    def key(row):
+        return (
+            row.user_id,
+            row.period,
+            row.period_start,
+            row.type_id,
+            row.category_id,
+            row.subcategory_id,
+            row.status_id,
+        )
+
+    stored = CashFlowRollup.objects.all()
+    if user is not None:
+        stored = stored.filter(user=user)
+    actual = {key(row): (row.total, row.count) for row in stored.iterator()}
+    mismatches = []
+    for row in expected_rollups(user):
+        value = actual.pop(key(row), None)
+        if value != (row.total, row.count):
+            mismatches.append((key(row), value, (row.total, row.count)))
+    mismatches.extend((k, v, None) for k, v in actual.items())
+    return mismatches
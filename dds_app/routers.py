@@ -0,0 +1,60 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Основная БД: все записи и чтения вне HTTP-запросов (команды, сигналы, миграции)
+PRIMARY = "default"
+
+
+class RoutingState:
+    """Маршрутизация одного HTTP-запроса: откуда читать и была ли запись в БД"""
+
+    def __init__(self):
+        self.read_db = PRIMARY
+        self.wrote = False
+
+
+# Состояние текущего запроса; контекст копируется в sync_to_async,
+# поэтому ORM-запросы асинхронных представлений маршрутизируются так же
+current_routing = ContextVar("dds_db_routing", default=None)
+
+
+def _sticky_key(user_id):
+    return f"dds:primary:{user_id}"
+
+
+def stick_to_primary(user_id):
+    """После записи пользователь DDS_REPLICA_STICKY_SECONDS секунд читает основную БД"""
+    cache.set(_sticky_key(user_id), True, settings.DDS_REPLICA_STICKY_SECONDS)
+
+
+async def astick_to_primary(user_id):
+    await cache.aset(_sticky_key(user_id), True, settings.DDS_REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return cache.get(_sticky_key(user_id), False)
+
+
+class ReplicaRouter:
+    """
+    Чтения идут в БД, выбранную для запроса ReplicaMiddleware (реплика или основная),
+    все записи - в основную. После первой записи в запросе и его чтения переходят
+    на основную БД, чтобы видеть только что записанное
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        return state.read_db if state is not None else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+            state.read_db = PRIMARY
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На реплике те же данные, что и в основной БД
+        return True
@@ -0,0 +1,108 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.functions import Cast, Upper
+
+# Режимы поиска по комментарию
+SEARCH_CONTAINS = "contains"
+SEARCH_FULLTEXT = "fulltext"
+SEARCH_SIMILAR = "similar"
+
+SEARCH_MODE_CHOICES = (
+    (SEARCH_CONTAINS, "Содержит"),
+    (SEARCH_FULLTEXT, "По словам"),
+    (SEARCH_SIMILAR, "Похожие слова"),
+)
+
+
+def comment_vector():
+    """tsvector комментария; выражение совпадает с GIN-индексом из миграции"""
+    return SearchVector("comment", config=settings.DDS_SEARCH_CONFIG)
+
+
+def comment_upper():
+    """Выражение под триграммный индекс: так же Django строит icontains в PostgreSQL"""
+    return Upper("comment")
+
+
+def supports_search(queryset):
+    return connections[queryset.db].vendor == "postgresql"
+
+
+# Установлено ли pg_trgm, по алиасу БД
+_trigram_support = {}
+
+
+def supports_trigram(queryset):
+    """Установлено ли расширение pg_trgm (проверяем один раз на процесс)"""
+    if queryset.db not in _trigram_support:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_support[queryset.db] = cursor.fetchone() is not None
+    return _trigram_support[queryset.db]
+
+
+async def aprepare_search(queryset):
+    """
+    Для async-представлений: проверка pg_trgm - синхронный запрос, выполняем её
+    заранее в потоке, чтобы search_comments дальше не обращался к БД
+    """
+    if supports_search(queryset):
+        await sync_to_async(supports_trigram)(queryset)
+
+
+def rank(expression):
+    """
+    Ранг приводим к double precision: real из PostgreSQL не переживает
+    round-trip через курсор keyset-пагинации без потери точности
+    """
+    return Cast(expression, output_field=FloatField())
+
+
+def search_comments(queryset, text, mode=SEARCH_CONTAINS):
+    """
+    Фильтрует записи по комментарию. Возвращает queryset и признак того,
+    что в нём есть аннотация search_rank для сортировки по релевантности.
+    Без PostgreSQL (или без pg_trgm для похожих слов) режимы сводятся к вхождению
+    всех слов.
+    """
+    # Пустые комментарии отсекаем явно, чтобы подошёл частичный индекс
+    queryset = queryset.exclude(comment="")
+
+    if mode == SEARCH_CONTAINS:
+        return queryset.filter(comment__icontains=text), False
+
+    if not supports_search(queryset) or (
+        mode == SEARCH_SIMILAR and not supports_trigram(queryset)
+    ):
+        for word in text.split():
+            queryset = queryset.filter(comment__icontains=word)
+        return queryset, False
+
+    if mode == SEARCH_FULLTEXT:
+        query = SearchQuery(
+            text, config=settings.DDS_SEARCH_CONFIG, search_type="websearch"
+        )
+        queryset = (
+            queryset.alias(comment_vector=comment_vector())
+            .filter(comment_vector=query)
+            .annotate(search_rank=rank(SearchRank(comment_vector(), query)))
+        )
+        return queryset, True
+
+    # SEARCH_SIMILAR: нечёткое совпадение по триграммам (оператор %> из pg_trgm)
+    queryset = (
+        queryset.alias(comment_upper=comment_upper())
+        .filter(comment_upper__trigram_word_similar=text.upper())
+        .annotate(
+            search_rank=rank(TrigramWordSimilarity(text.upper(), comment_upper()))
+        )
+    )
+    return queryset, True
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import CashFlowStatement
+from .reference_cache import REFERENCE_MODELS, bump_reference_version
+from .rollups import ROLLUP_FIELDS, apply_change, statement_values
+from .versions import STATEMENTS, bump_version
+
+# Пакетные операции (массовые действия, архив) сами обновляют агрегаты и версию
+# записей один раз на порцию; на это время обработчики записей ниже отключаются
+statement_signals_muted = ContextVar("dds_statement_signals_muted", default=False)
+
+
+@contextmanager
+def mute_statement_signals():
+    """Сохранения и удаления записей внутри блока не трогают агрегаты и версию"""
+    token = statement_signals_muted.set(True)
+    try:
+        yield
+    finally:
+        statement_signals_muted.reset(token)
+
+
+@receiver(pre_save, sender=CashFlowStatement)
+def remember_statement_state(sender, instance, **kwargs):
+    """Запоминаем сохранённое состояние записи, чтобы вычесть его из агрегатов"""
+    instance._rollup_old = None
+    if instance.pk is not None and not statement_signals_muted.get():
+        instance._rollup_old = (
+            sender.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=CashFlowStatement)
+def update_rollups_on_save(sender, instance, **kwargs):
+    if statement_signals_muted.get():
+        return
+    apply_change(getattr(instance, "_rollup_old", None), statement_values(instance))
+    instance._rollup_old = None
+
+
+@receiver(post_delete, sender=CashFlowStatement)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    if statement_signals_muted.get():
+        return
+    apply_change(statement_values(instance), None)
+
+
+@receiver(post_save, sender=CashFlowStatement)
+@receiver(post_delete, sender=CashFlowStatement)
+def invalidate_statements(sender, instance, **kwargs):
+    """Изменение записи меняет версию данных пользователя (кэш числа записей и т.п.)"""
+    if statement_signals_muted.get():
+        return
+    bump_version(STATEMENTS, instance.user_id)
+
+
+def invalidate_references(sender, instance, **kwargs):
+    """Любое изменение справочника меняет версию кэша справочников пользователя"""
+    bump_reference_version(instance.user_id)
+
+
+for model in REFERENCE_MODELS.values():
+    post_save.connect(
+        invalidate_references, sender=model, dispatch_uid=f"dds_refs_save_{model}"
+    )
+    post_delete.connect(
+        invalidate_references, sender=model, dispatch_uid=f"dds_refs_delete_{model}"
+    )
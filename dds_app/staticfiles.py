@@ -0,0 +1,127 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage,
+    staticfiles_storage,
+)
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # Без пакета Brotli готовятся только .gz-копии
+    brotli = None
+
+# Файлы, которые имеет смысл сжимать: woff2 и картинки уже сжаты
+COMPRESSIBLE = (".css", ".js", ".map", ".svg", ".json", ".txt", ".ttf", ".eot")
+# Сжатые копии лежат рядом с файлом: name.br, name.gz (в порядке предпочтения)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# Файлы с хэшем в имени не меняются никогда
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хэш содержимого в именах файлов (staticfiles.json) и заранее сжатые копии
+    .gz и .br рядом с каждым хэшированным файлом, подготовленные при collectstatic
+    """
+
+    # Маленькие файлы сжатие почти не уменьшает
+    min_size = 512
+    # Без collectstatic (тесты, запуск из исходников с DEBUG=False) манифеста нет:
+    # ссылки ведут на исходные имена вместо ValueError при рендеринге шаблона
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < self.min_size:
+            return
+        variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(content, mode=brotli.MODE_TEXT)
+        for suffix, data in variants.items():
+            if len(data) >= len(content):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+
+
+@lru_cache(maxsize=None)
+def immutable_names():
+    """Хэшированные имена из манифеста: их можно кэшировать в браузере навсегда"""
+    return frozenset(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+
+def accepted_encodings(request):
+    return {
+        token.split(";")[0].strip()
+        for token in request.headers.get("Accept-Encoding", "").split(",")
+    }
+
+
+def serve(request, path):
+    """
+    Собранная статика из STATIC_ROOT, если перед приложением нет веб-сервера:
+    сжатая копия по Accept-Encoding, файлы с хэшем в имени - с immutable на год
+    """
+    name = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.headers.get("If-Modified-Since"), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(fullpath)
+        encoding, variant = None, fullpath
+        if name.endswith(COMPRESSIBLE):
+            accepted = accepted_encodings(request)
+            for candidate, suffix in ENCODINGS:
+                if candidate in accepted and os.path.isfile(fullpath + suffix):
+                    encoding, variant = candidate, fullpath + suffix
+                    break
+        response = FileResponse(
+            open(variant, "rb"), content_type=content_type or "application/octet-stream"
+        )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if name.endswith(COMPRESSIBLE):
+            patch_vary_headers(response, ("Accept-Encoding",))
+    response.headers["Last-Modified"] = http_date(stat.st_mtime)
+    if name in immutable_names():
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -6,4 +6,19 @@ register = template.Library()
 # Кастомный фильтр, чтобы получать имя поля в шаблоне
 @register.filter
 def get_field_display(obj, field_name):
-    return getattr(obj, field_name)
+    # Для полей с choices - подпись выбранного значения
+    display = getattr(obj, f"get_{field_name}_display", None)
+    return display() if display else getattr(obj, field_name)
+
+
+# Текущий querystring с заменёнными параметрами, чтобы ссылки пагинации
+# не теряли фильтры
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    query = context["request"].GET.copy()
+    for key, value in kwargs.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
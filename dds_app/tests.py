@@ -0,0 +1,1177 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.paginator import EmptyPage
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import rollups
+from .archive import archive_statements, restore_statements
+from .forms import PARENT_IN_USE_ERRORS
+from .importers import StatementImporter, read_csv
+from .models import (
+    ArchivedCashFlowStatement,
+    CashFlowStatement,
+    Category,
+    FilterPreset,
+    Status,
+    Subcategory,
+    Type,
+)
+from .pagination import CachedCountPaginator, InvalidCursor, KeysetPaginator
+from .partitions import convert_table, detach_partitions
+from .reports import build_monthly_report
+from .routers import PRIMARY, ReplicaRouter, RoutingState, current_routing
+from .versions import STATEMENTS, get_version
+from .views import DEFAULT_SORT, SORT_ORDERINGS, sort_ordering
+
+# Кэш в памяти процесса: версии данных и страницы тестов не смешиваются с файловым
+# кэшем запущенного приложения
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StatementTestCase(TestCase):
+    """
+    Справочники и записи пользователя с повторяющимися датами, суммами и
+    справочниками: порядок страниц держится только на id в конце ключа сортировки
+    """
+
+    statement_count = 23
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("user", password="password")
+        cls.other = User.objects.create_user("other", password="password")
+
+        cls.income = Type.objects.create(
+            user=cls.user, name="Приход", direction=Type.INFLOW
+        )
+        cls.expense = Type.objects.create(
+            user=cls.user, name="Расход", direction=Type.OUTFLOW
+        )
+        cls.salary = Category.objects.create(
+            user=cls.user, name="Зарплата", type=cls.income
+        )
+        cls.food = Category.objects.create(user=cls.user, name="Еда", type=cls.expense)
+        cls.advance = Subcategory.objects.create(
+            user=cls.user, name="Аванс", category=cls.salary
+        )
+        cls.cafe = Subcategory.objects.create(
+            user=cls.user, name="Кафе", category=cls.food
+        )
+        cls.business = Status.objects.create(user=cls.user, name="Бизнес")
+        cls.personal = Status.objects.create(user=cls.user, name="Личное")
+
+        statements = []
+        for i in range(cls.statement_count):
+            subcategory = cls.advance if i % 3 else cls.cafe
+            statements.append(
+                CashFlowStatement(
+                    user=cls.user,
+                    custom_date=date(2024, 1, 1) + timedelta(days=i * 5 % 8),
+                    type=subcategory.category.type,
+                    category=subcategory.category,
+                    subcategory=subcategory,
+                    status=cls.business if i % 2 else cls.personal,
+                    amount=100 + i % 4,
+                    comment=f"запись {i}",
+                )
+            )
+        CashFlowStatement.objects.bulk_create(statements)
+
+        other_type = Type.objects.create(user=cls.other, name="Расход")
+        other_category = Category.objects.create(
+            user=cls.other, name="Еда", type=other_type
+        )
+        cls.other_statement = CashFlowStatement.objects.create(
+            user=cls.other,
+            custom_date=date(2024, 1, 1),
+            type=other_type,
+            category=other_category,
+            subcategory=Subcategory.objects.create(
+                user=cls.other, name="Кафе", category=other_category
+            ),
+            status=Status.objects.create(user=cls.other, name="Личное чужое"),
+            amount=1,
+        )
+        # bulk_create не вызывает сигналы - агрегаты собираем заново
+        rollups.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def statements(self):
+        return CashFlowStatement.objects.filter(user=self.user)
+
+    def statement_data(self, subcategory, **values):
+        """Поля записи для формы и API"""
+        return {
+            "custom_date": "2024-02-10",
+            "status": self.business.pk,
+            "type": subcategory.category.type_id,
+            "category": subcategory.category_id,
+            "subcategory": subcategory.pk,
+            "amount": "250.00",
+            "comment": "",
+            **values,
+        }
+
+
+class KeysetPaginatorTests(StatementTestCase):
+    def walk(self, paginator):
+        """Все страницы от первой до последней по next_cursor"""
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            self.assertLess(len(pages), self.statement_count, "Курсоры зациклились")
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def assertWalksBothWays(self, ordering):
+        """Вперёд - вся выборка по порядку, назад - те же страницы в обратном порядке"""
+        expected = list(
+            self.statements().order_by(*ordering).values_list("pk", flat=True)
+        )
+        paginator = KeysetPaginator(self.statements(), 4, ordering)
+
+        pages = self.walk(paginator)
+        forward = [[obj.pk for obj in page] for page in pages]
+        self.assertEqual(sum(forward, []), expected)
+        self.assertFalse(pages[0].has_previous())
+
+        backward = [forward[-1]]
+        page = pages[-1]
+        while page.has_previous():
+            self.assertLess(len(backward), len(forward))
+            page = paginator.page(page.previous_cursor)
+            backward.append([obj.pk for obj in page])
+        self.assertEqual(backward, forward[::-1])
+
+    def test_pages_follow_default_ordering_both_ways(self):
+        self.assertWalksBothWays(("-custom_date", "-id"))
+
+    def test_pages_follow_every_ordering_both_ways(self):
+        for key in SORT_ORDERINGS:
+            for sort in (key, f"-{key}"):
+                with self.subTest(sort=sort):
+                    self.assertWalksBothWays(sort_ordering(sort))
+
+    def test_cursor_of_other_ordering_is_rejected(self):
+        page = KeysetPaginator(self.statements(), 4, ("custom_date", "id")).page()
+        paginator = KeysetPaginator(self.statements(), 4, ("-custom_date", "-id"))
+        with self.assertRaises(InvalidCursor):
+            paginator.page(page.next_cursor)
+
+    def test_last_ordering_field_must_be_id(self):
+        with self.assertRaises(ValueError):
+            KeysetPaginator(self.statements(), 4, ("custom_date",))
+
+
+@override_settings(DDS_LIST_PAGINATION="keyset")
+class KeysetListViewTests(StatementTestCase):
+    # Сессия, пользователь, четыре справочника, граница архива, страница, остатки
+    # (контрольные точки и дельты) и сохранённые фильтры - независимо от страницы
+    list_queries = 11
+    # Страница из кэша (сессия тоже уже в кэше): пользователь и сохранённые фильтры
+    cached_list_queries = 2
+
+    def get_list(self, **params):
+        response = self.client.get(reverse("dds-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertListWalksBothWays(self, ordering, **params):
+        """Страницы таблицы по next_cursor, а затем обратно по previous_cursor"""
+        expected = list(
+            self.statements().order_by(*ordering).values_list("pk", flat=True)
+        )
+        pages = []
+        while True:
+            page = self.get_list(**params).context["page_obj"]
+            pages.append([obj.pk for obj in page])
+            if not page.has_next():
+                break
+            self.assertLess(len(pages), self.statement_count)
+            params["cursor"] = page.next_cursor
+        self.assertEqual(sum(pages, []), expected)
+
+        backward = []
+        while True:
+            backward.append([obj.pk for obj in page])
+            if not page.has_previous():
+                break
+            self.assertLess(len(backward), len(pages))
+            params["cursor"] = page.previous_cursor
+            page = self.get_list(**params).context["page_obj"]
+        self.assertEqual(backward, pages[::-1])
+
+    def test_pages_follow_default_ordering(self):
+        self.assertListWalksBothWays(("-custom_date", "-id"), per_page=5)
+
+    def test_pages_follow_every_ordering(self):
+        for key in SORT_ORDERINGS:
+            for sort in (key, f"-{key}"):
+                with self.subTest(sort=sort):
+                    self.assertListWalksBothWays(
+                        sort_ordering(sort), sort=sort, per_page=5
+                    )
+
+    def test_reference_columns_sort_by_name(self):
+        # "Еда" создана позже "Зарплаты", но по названию идёт раньше
+        for sort, first, last in (
+            ("category", self.food, self.salary),
+            ("-category", self.salary, self.food),
+        ):
+            with self.subTest(sort=sort):
+                page = self.get_list(sort=sort, per_page=100).context["page_obj"]
+                categories = [obj.category for obj in page]
+                self.assertEqual((categories[0], categories[-1]), (first, last))
+                names = [category.name for category in categories]
+                self.assertEqual(names, sorted(names, reverse=sort.startswith("-")))
+
+    def test_bad_cursor_is_404(self):
+        url = reverse("dds-list")
+        self.assertEqual(self.client.get(url, {"cursor": "не курсор"}).status_code, 404)
+
+        # Курсор другой сортировки тоже не подходит
+        cursor = self.get_list(sort="amount", per_page=5).context["page_obj"]
+        response = self.client.get(url, {"sort": "-date", "cursor": cursor.next_cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_query_count_does_not_depend_on_page(self):
+        first = self.get_list(per_page=5).context["page_obj"]
+        for params in (
+            {"per_page": 5, "cursor": first.next_cursor},
+            {"per_page": 20, "sort": "category"},
+        ):
+            with self.subTest(params=params):
+                cache.clear()
+                with self.assertNumQueries(self.list_queries):
+                    self.get_list(**params)
+                # Повторный просмотр берёт страницу из кэша
+                with self.assertNumQueries(self.cached_list_queries):
+                    self.get_list(**params)
+
+
+class HierarchyTests(StatementTestCase):
+    def assertRejected(self, action):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            action()
+
+    def archived_category(self):
+        """Категория, которую используют только архивные записи"""
+        bonus = Category.objects.create(user=self.user, name="Премии", type=self.income)
+        statement = CashFlowStatement.objects.create(
+            user=self.user,
+            custom_date=date(2023, 1, 1),
+            type=self.income,
+            category=bonus,
+            subcategory=Subcategory.objects.create(
+                user=self.user, name="Годовая", category=bonus
+            ),
+            status=self.business,
+            amount=1,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_statements(date(2024, 1, 1), user=self.user)
+        self.assertFalse(CashFlowStatement.objects.filter(pk=statement.pk).exists())
+        return bonus
+
+    def test_triggers_reject_mismatched_rows(self):
+        statement = self.statements().filter(subcategory=self.cafe).first()
+        statement.pk = None
+        statement.category = self.salary
+        statement.type = self.income
+        self.assertRejected(lambda: CashFlowStatement.objects.bulk_create([statement]))
+
+        advance = self.statements().filter(subcategory=self.advance)
+        self.assertRejected(lambda: advance.update(category=self.food))
+        self.assertRejected(lambda: advance.update(type=self.expense))
+        self.assertEqual(rollups.verify(), [])
+
+    def test_parent_change_in_use_is_rejected(self):
+        bonus = self.archived_category()
+        for category in (self.salary, bonus):
+            with self.subTest(category=category.name):
+                self.assertRejected(
+                    lambda: Category.objects.filter(pk=category.pk).update(
+                        type=self.expense
+                    )
+                )
+        self.assertRejected(
+            lambda: Subcategory.objects.filter(pk=self.advance.pk).update(
+                category=self.food
+            )
+        )
+
+    def test_reference_form_reports_parent_in_use(self):
+        bonus = self.archived_category()
+        unused = Category.objects.create(
+            user=self.user, name="Подарки", type=self.income
+        )
+        for category, changed in ((self.salary, False), (bonus, False), (unused, True)):
+            with self.subTest(category=category.name):
+                url = reverse("reference-update", args=["category", category.pk])
+                response = self.client.post(
+                    url, {"name": category.name, "type": self.expense.pk}
+                )
+                category.refresh_from_db()
+                self.assertEqual(category.type_id == self.expense.pk, changed)
+                if changed:
+                    self.assertEqual(response.status_code, 302)
+                else:
+                    self.assertFormError(
+                        response.context["form"],
+                        "type",
+                        PARENT_IN_USE_ERRORS["category"],
+                    )
+
+
+class StatementSignalTests(StatementTestCase):
+    def test_rollups_follow_create_update_delete(self):
+        self.assertEqual(rollups.verify(), [])
+
+        response = self.client.post(
+            reverse("create-dds"), self.statement_data(self.cafe)
+        )
+        self.assertRedirects(response, reverse("dds-list"))
+        statement = self.statements().latest("pk")
+        self.assertEqual(rollups.verify(), [])
+
+        # Другой месяц, категория и статус: вклад переносится между агрегатами
+        response = self.client.post(
+            reverse("update-dds", args=[statement.pk]),
+            self.statement_data(
+                self.advance,
+                custom_date="2024-03-01",
+                status=self.personal.pk,
+                amount="75.50",
+            ),
+        )
+        self.assertRedirects(response, reverse("dds-list"))
+        self.assertEqual(rollups.verify(), [])
+
+        response = self.client.post(reverse("delete-dds", args=[statement.pk]))
+        self.assertRedirects(response, reverse("dds-list"))
+        self.assertEqual(rollups.verify(), [])
+
+    def test_verify_reports_stale_rollups(self):
+        CashFlowStatement.objects.filter(pk=self.statements().first().pk).update(
+            amount=1
+        )
+        self.assertNotEqual(rollups.verify(), [])
+        rollups.rebuild(self.user)
+        self.assertEqual(rollups.verify(), [])
+
+
+class ListCacheTests(StatementTestCase):
+    def first_row(self, **params):
+        return self.client.get(reverse("dds-list"), params).context["dds_list"][0]
+
+    @override_settings(DDS_LIST_PAGINATION="cached")
+    def test_count_cache_follows_statement_version(self):
+        def count(page):
+            response = self.client.get(reverse("dds-list"), {"page": page})
+            return response.context["paginator"].count
+
+        self.assertEqual(count(1), self.statement_count)
+
+        # Без сигналов версия не меняется - число записей берётся из кэша
+        CashFlowStatement.objects.bulk_create(
+            [CashFlowStatement(**self.statements().values().first() | {"id": None})]
+        )
+        self.assertEqual(count(2), self.statement_count)
+
+        statement = self.statements().first()
+        with self.captureOnCommitCallbacks(execute=True):
+            statement.save()
+        self.assertEqual(count(2), self.statement_count + 1)
+
+    def test_page_cache_follows_statement_changes(self):
+        row = self.first_row()
+        # UPDATE мимо сигналов не меняет версию - страница берётся из кэша
+        CashFlowStatement.objects.filter(pk=row.pk).update(amount=1)
+        self.assertEqual(self.first_row().amount, row.amount)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CashFlowStatement.objects.get(pk=row.pk).delete()
+        self.assertNotEqual(self.first_row().pk, row.pk)
+
+    def test_page_cache_follows_reference_changes(self):
+        row = self.first_row()
+        category = row.category
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("reference-update", args=["category", category.pk]),
+                {"name": "Новое имя", "type": category.type_id},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.first_row().category.name, "Новое имя")
+
+
+@override_settings(DDS_LIST_PAGINATION="cached", DDS_LIST_COUNT_LIMIT=10)
+class CappedCountTests(StatementTestCase):
+    """Записей больше DDS_LIST_COUNT_LIMIT: число приблизительное, а страницы - нет"""
+
+    def paginator(self):
+        return CachedCountPaginator(
+            self.statements().order_by("pk"), 5, cache_key="count", count_limit=10
+        )
+
+    def test_paginator_goes_past_estimated_pages(self):
+        expected = list(self.statements().order_by("pk"))
+        for page_of in (self.paginator().page, async_to_sync(self.paginator().apage)):
+            with self.subTest(page_of=page_of):
+                pages = [page_of(number) for number in range(1, 6)]
+                self.assertEqual(sum((list(page) for page in pages), []), expected)
+                self.assertEqual(
+                    [page.has_next() for page in pages], [True] * 4 + [False]
+                )
+                with self.assertRaises(EmptyPage):
+                    page_of(6)
+
+    def test_list_pages_go_past_the_count_limit(self):
+        expected = list(
+            self.statements()
+            .order_by(*sort_ordering(DEFAULT_SORT))
+            .values_list("pk", flat=True)
+        )
+        rows = []
+        number = 1
+        while True:
+            response = self.client.get(
+                reverse("dds-list"), {"per_page": 5, "page": number}
+            )
+            self.assertEqual(response.status_code, 200)
+            page = response.context["page_obj"]
+            self.assertTrue(page.paginator.count_approximate)
+            rows += [obj.pk for obj in page]
+            if not page.has_next():
+                break
+            self.assertLess(number, self.statement_count)
+            number += 1
+        self.assertEqual(rows, expected)
+
+        response = self.client.get(
+            reverse("dds-list"), {"per_page": 5, "page": number + 1}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkActionTests(StatementTestCase):
+    def post_action(self, ids, action, **values):
+        data = {"bulk-ids": ids, "bulk-action": action}
+        data.update((f"bulk-{name}", value) for name, value in values.items())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("bulk-dds"), data)
+        self.assertRedirects(response, reverse("dds-list"))
+        return response
+
+    def selected(self, count=6):
+        """id записей пользователя и чужой записи, которую действие должно пропустить"""
+        ids = list(self.statements().values_list("pk", flat=True)[:count])
+        return ids, ids + [self.other_statement.pk]
+
+    def assertOtherUntouched(self):
+        other = CashFlowStatement.objects.get(pk=self.other_statement.pk)
+        self.assertEqual(
+            rollups.statement_values(other),
+            rollups.statement_values(self.other_statement),
+        )
+
+    def test_set_status(self):
+        ids, selected = self.selected()
+        self.post_action(selected, "status", status=self.business.pk)
+        self.assertEqual(
+            set(self.statements().filter(pk__in=ids).values_list("status", flat=True)),
+            {self.business.pk},
+        )
+        self.assertOtherUntouched()
+        self.assertEqual(rollups.verify(), [])
+
+    def test_move_takes_category_and_type_from_subcategory(self):
+        ids, selected = self.selected()
+        self.post_action(selected, "move", subcategory=self.cafe.pk)
+        self.assertEqual(
+            set(
+                self.statements()
+                .filter(pk__in=ids)
+                .values_list("type", "category", "subcategory")
+            ),
+            {(self.expense.pk, self.food.pk, self.cafe.pk)},
+        )
+        self.assertOtherUntouched()
+        self.assertEqual(rollups.verify(), [])
+
+    def test_shift_dates_across_months(self):
+        ids, selected = self.selected()
+        before = dict(
+            self.statements().filter(pk__in=ids).values_list("pk", "custom_date")
+        )
+        self.post_action(selected, "shift", days=-40)
+        after = dict(
+            self.statements().filter(pk__in=ids).values_list("pk", "custom_date")
+        )
+        self.assertEqual(
+            after, {pk: value - timedelta(days=40) for pk, value in before.items()}
+        )
+        self.assertOtherUntouched()
+        self.assertEqual(rollups.verify(), [])
+
+    def test_delete(self):
+        ids, selected = self.selected()
+        self.post_action(selected, "delete")
+        self.assertFalse(self.statements().filter(pk__in=ids).exists())
+        self.assertEqual(self.statements().count(), self.statement_count - len(ids))
+        self.assertOtherUntouched()
+        self.assertEqual(rollups.verify(), [])
+
+    def test_action_bumps_statement_version(self):
+        version = get_version(STATEMENTS, self.user.pk)
+        self.post_action(self.selected()[0], "status", status=self.business.pk)
+        self.assertNotEqual(get_version(STATEMENTS, self.user.pk), version)
+
+    def test_invalid_action_changes_nothing(self):
+        version = get_version(STATEMENTS, self.user.pk)
+        before = list(self.statements().values())
+        self.post_action(self.selected()[1], "move")
+        self.assertEqual(list(self.statements().values()), before)
+        self.assertEqual(get_version(STATEMENTS, self.user.pk), version)
+
+
+IMPORT_CSV = """Дата;Статус;Тип;Категория;Подкатегория;Сумма;Комментарий
+2024-02-01;Бизнес;Расход;Еда;Кафе;1 250,50;обед
+05.03.2024;личное;приход;Зарплата;Аванс;3000;
+2024-02-02;Бизнес;Приход;Еда;Кафе;10;чужая категория
+31.02.2024;Бизнес;Расход;Еда;Кафе;10;нет такой даты
+2024-02-03;Бизнес;Расход;Еда;Кафе;много;не сумма
+"""
+
+IMPORT_OFX = """OFXHEADER:100
+DATA:OFXSGML
+CHARSET:1251
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240305120000<TRNAMT>-150.25<NAME>Кофейня<MEMO>карта
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240306<TRNAMT>99.00<NAME>Возврат</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+class ImportTests(StatementTestCase):
+    def import_file(self, name, content, **defaults):
+        data = {"file": SimpleUploadedFile(name, content)}
+        data.update((field, value.pk) for field, value in defaults.items())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("import-dds"), data)
+        self.assertEqual(response.status_code, 200)
+        return response.context["report"]
+
+    def test_csv_rows_and_errors(self):
+        version = get_version(STATEMENTS, self.user.pk)
+        report = self.import_file("выписка.csv", IMPORT_CSV.encode("utf-8-sig"))
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6])
+        imported = self.statements().filter(custom_date__gte=date(2024, 2, 1))
+        self.assertEqual(
+            sorted(imported.values_list("amount", "subcategory", "status")),
+            [
+                (Decimal("1250.50"), self.cafe.pk, self.business.pk),
+                (Decimal("3000.00"), self.advance.pk, self.personal.pk),
+            ],
+        )
+        self.assertEqual(rollups.verify(), [])
+        self.assertNotEqual(get_version(STATEMENTS, self.user.pk), version)
+
+    def test_csv_in_several_batches(self):
+        rows = "\n".join(
+            f"2024-02-{day:02d};Бизнес;Расход;Еда;Кафе;{day};" for day in range(1, 8)
+        )
+        stream = io.StringIO(IMPORT_CSV.splitlines()[0] + "\n" + rows)
+        report = StatementImporter(self.user, batch_size=3).run(read_csv(stream))
+        self.assertEqual((report.created, report.failed), (7, 0))
+        self.assertEqual(self.statements().count(), self.statement_count + 7)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_csv_saved_in_cp1251(self):
+        report = self.import_file("excel.csv", IMPORT_CSV.encode("cp1251"))
+        self.assertEqual(report.created, 2)
+        self.assertIsNone(report.file_error)
+        self.assertTrue(self.statements().filter(comment="обед").exists())
+
+    def test_unreadable_csv_is_a_file_error(self):
+        # Формат определяется по началу файла, поэтому длинное поле - в конце
+        header, row = IMPORT_CSV.splitlines()[:2]
+        content = [header] + [row] * 100
+        content.append(f'2024-02-04;Бизнес;Расход;Еда;Кафе;1;"{"x" * 200000}"')
+        report = self.import_file("big.csv", "\n".join(content).encode())
+        self.assertIn("не до конца", report.file_error)
+        # Строки до ошибки импортированы
+        self.assertEqual(report.created, 100)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_ofx_amounts_are_unsigned_and_checked_against_type(self):
+        report = self.import_file(
+            "выписка.ofx",
+            IMPORT_OFX.encode("cp1251"),
+            type=self.expense,
+            category=self.food,
+            subcategory=self.cafe,
+            status=self.business,
+        )
+        # Поступление не подходит к типу-расходу по умолчанию
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, _ in report.errors], [2])
+        statement = self.statements().get(custom_date=date(2024, 3, 5))
+        self.assertEqual(statement.amount, Decimal("150.25"))
+        self.assertEqual(statement.comment, "Кофейня карта")
+        self.assertEqual(rollups.verify(), [])
+
+
+class ApiBatchTests(StatementTestCase):
+    def post_batch(self, url, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                url, json.dumps(body), content_type="application/json"
+            )
+
+    def test_statement_batch_keeps_rollups(self):
+        version = get_version(STATEMENTS, self.user.pk)
+        first, second, *rest = self.statements().values_list("pk", flat=True)[:4]
+        response = self.post_batch(
+            reverse("api-statements-batch"),
+            {
+                "create": [
+                    self.statement_data(self.cafe),
+                    self.statement_data(self.advance, custom_date=None),
+                ],
+                "update": [
+                    {"id": first, "amount": "999.99"},
+                    {
+                        "id": second,
+                        "custom_date": "2023-05-05",
+                        "type": self.expense.pk,
+                        "category": self.food.pk,
+                        "subcategory": self.cafe.pk,
+                    },
+                ],
+                "delete": rest + [self.other_statement.pk],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(len(result["created"]), 2)
+        self.assertEqual(result["updated"], [first, second])
+        self.assertEqual(result["deleted"], 2)
+
+        self.assertEqual(self.statements().count(), self.statement_count)
+        self.assertFalse(self.statements().filter(pk__in=rest).exists())
+        self.assertTrue(
+            CashFlowStatement.objects.filter(pk=self.other_statement.pk).exists()
+        )
+        self.assertEqual(self.statements().get(pk=first).amount, Decimal("999.99"))
+        moved = self.statements().get(pk=second)
+        self.assertEqual(
+            (moved.custom_date, moved.subcategory_id),
+            (date(2023, 5, 5), self.cafe.pk),
+        )
+        self.assertEqual(rollups.verify(), [])
+        self.assertNotEqual(get_version(STATEMENTS, self.user.pk), version)
+
+    def test_statement_batch_with_errors_changes_nothing(self):
+        before = list(self.statements().values())
+        response = self.post_batch(
+            reverse("api-statements-batch"),
+            {
+                "create": [
+                    self.statement_data(self.cafe),
+                    {**self.statement_data(self.cafe), "subcategory": self.advance.pk},
+                ],
+                "update": [{"id": self.other_statement.pk, "amount": "1"}],
+                "delete": [before[0]["id"]],
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error["op"], error["index"]) for error in response.json()["errors"]],
+            [("create", 1), ("update", 0)],
+        )
+        self.assertEqual(list(self.statements().values()), before)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_boolean_ids_are_rejected(self):
+        for body in ({"delete": [True]}, {"update": [{"id": True, "amount": "1"}]}):
+            with self.subTest(body=body):
+                response = self.post_batch(reverse("api-statements-batch"), body)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statements().count(), self.statement_count)
+
+    def test_reference_batch_rejects_duplicates_within_batch(self):
+        response = self.post_batch(
+            reverse("api-references-batch", args=["category"]),
+            {
+                "create": [
+                    {"name": "Транспорт", "type": self.expense.pk},
+                    {"name": "Транспорт", "type": self.expense.pk},
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(error["op"], error["index"]) for error in response.json()["errors"]],
+            [("create", 1)],
+        )
+        self.assertFalse(Category.objects.filter(name="Транспорт").exists())
+
+    def test_reference_batch_rejects_parent_change_of_used_category(self):
+        response = self.post_batch(
+            reverse("api-references-batch", args=["category"]),
+            {"update": [{"id": self.food.pk, "type": self.income.pk}]},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.type_id, self.expense.pk)
+
+
+class ArchiveTests(StatementTestCase):
+    def list_ids(self):
+        response = self.client.get(reverse("dds-list"), {"per_page": 100})
+        return {obj.pk for obj in response.context["dds_list"]}
+
+    def test_archive_and_restore_keep_rows(self):
+        created_at = date(2023, 6, 1)
+        self.statements().update(created_at=created_at)
+        ids = self.list_ids()
+        old = set(
+            self.statements()
+            .filter(custom_date__lt=date(2024, 1, 4))
+            .values_list("pk", flat=True)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = archive_statements(date(2024, 1, 4), user=self.user, batch_size=4)
+        self.assertEqual(moved, (len(old), 1))
+        archived = ArchivedCashFlowStatement.objects.filter(user=self.user)
+        self.assertEqual(set(archived.values_list("pk", flat=True)), old)
+        self.assertEqual(
+            set(archived.values_list("created_at", flat=True)), {created_at}
+        )
+        # Список читает архив прозрачно, агрегаты считаются по обеим таблицам
+        self.assertEqual(self.list_ids(), ids)
+        self.assertEqual(rollups.verify(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restore_statements(user=self.user)
+        self.assertFalse(archived.exists())
+        self.assertEqual(
+            set(self.statements().values_list("created_at", flat=True)), {created_at}
+        )
+        self.assertEqual(self.list_ids(), ids)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_reference_usage_counts_archived_rows(self):
+        url = reverse("reference-list", args=["subcategory"])
+        usage = {
+            obj.pk: obj.usage_count for obj in self.client.get(url).context["ref_list"]
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_statements(date(2025, 1, 1), user=self.user)
+        self.assertFalse(self.statements().exists())
+
+        response = self.client.get(url)
+        self.assertEqual(
+            {obj.pk: obj.usage_count for obj in response.context["ref_list"]}, usage
+        )
+        self.assertEqual(usage[self.cafe.pk], 8)
+
+    @skipUnless(
+        connection.vendor == "postgresql", "секционирование - только PostgreSQL"
+    )
+    def test_detached_partition_keeps_archived_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_statements(date(2024, 1, 4), user=self.user)
+            CashFlowStatement.objects.create(
+                user=self.user,
+                custom_date=date(2024, 2, 1),
+                type=self.income,
+                category=self.salary,
+                subcategory=self.advance,
+                status=self.business,
+                amount=250,
+            )
+            # Тест идёт в одной транзакции: отложенные проверки внешних ключей
+            # должны сработать до того, как convert_table удалит старую таблицу
+            with connection.cursor() as cursor:
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            convert_table("month")
+        version = get_version(STATEMENTS, self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            detached = detach_partitions(date(2024, 2, 1))
+        self.assertEqual(
+            [partition.start for partition in detached], [date(2024, 1, 1)]
+        )
+        self.assertEqual(
+            list(self.statements().values_list("custom_date", flat=True)),
+            [date(2024, 2, 1)],
+        )
+        # Вычитаются только отсоединённые записи, архивные остаются в агрегатах
+        self.assertEqual(rollups.verify(), [])
+        self.assertNotEqual(get_version(STATEMENTS, self.user.pk), version)
+
+
+class CommandTests(StatementTestCase):
+    def generate(self, **options):
+        out = io.StringIO()
+        call_command(
+            "generate_dds_data", users=2, statements=60, years=1, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_generate_dds_data(self):
+        self.generate()
+        users = User.objects.filter(username__startswith="bench_")
+        self.assertEqual(users.count(), 2)
+        statements = CashFlowStatement.objects.filter(user__in=users)
+        self.assertAlmostEqual(statements.count(), 60, delta=2)
+        self.assertEqual(rollups.verify(), [])
+
+        # Повторный запуск требует --clear и пересоздаёт пользователей
+        with self.assertRaises(CommandError):
+            self.generate()
+        self.assertIn("Удалено пользователей: 2", self.generate(clear=True))
+        self.assertEqual(users.count(), 2)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_benchmark_dds(self):
+        self.generate()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.json")
+            call_command(
+                "benchmark_dds", requests=30, warmup=5, save=path, stdout=io.StringIO()
+            )
+            with open(path, encoding="utf-8") as f:
+                summary = json.load(f)
+        self.assertEqual(sum(row["requests"] for row in summary.values()), 30)
+        # Список может запросить страницу за концом маленькой выборки (404),
+        # остальные сценарии должны проходить без ошибок
+        for name, row in summary.items():
+            if name != "list":
+                self.assertEqual(row["errors"], 0, name)
+        # Записи, созданные бенчмарком, удалены
+        self.assertFalse(
+            CashFlowStatement.objects.filter(comment__startswith="benchmark").exists()
+        )
+
+
+class ReportTests(StatementTestCase):
+    def flows(self, subcategory):
+        return sum(
+            self.statements()
+            .filter(subcategory=subcategory)
+            .values_list("amount", flat=True)
+        )
+
+    def get_report(self, **params):
+        params = {"month_from": "2024-01", "month_to": "2024-01", **params}
+        return self.client.get(reverse("cashflow-report"), params)
+
+    def add_statement(self, custom_date, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            CashFlowStatement.objects.create(
+                user=self.user,
+                custom_date=custom_date,
+                type=self.expense,
+                category=self.food,
+                subcategory=self.cafe,
+                status=self.business,
+                amount=amount,
+            )
+
+    def test_flows_follow_type_direction(self):
+        january = date(2024, 1, 1)
+        report = build_monthly_report(self.user, january, date(2024, 1, 31))
+        self.assertEqual(
+            report.columns, [(self.food.pk, "Еда"), (self.salary.pk, "Зарплата")]
+        )
+        food, salary = self.flows(self.cafe), self.flows(self.advance)
+        self.assertEqual(
+            report.cells[(january, self.food.pk)], {"inflow": 0, "outflow": food}
+        )
+        self.assertEqual(
+            report.cells[(january, self.salary.pk)], {"inflow": salary, "outflow": 0}
+        )
+        self.assertEqual(
+            report.totals("net"), ([-food, salary], salary, food, salary - food)
+        )
+        self.assertEqual(report.totals("outflow")[0], [food, 0])
+
+    def test_months_include_both_bounds(self):
+        january = self.flows(self.cafe)
+        self.add_statement(date(2023, 12, 31), 7)
+        self.add_statement(date(2024, 2, 29), 11)
+        report = build_monthly_report(
+            self.user, date(2024, 1, 15), date(2024, 2, 15), group="status"
+        )
+        self.assertEqual(report.months, [date(2024, 1, 1), date(2024, 2, 1)])
+        rows = report.rows("outflow")
+        # Записи 31 декабря и 29 февраля: декабрь за границей периода, февраль - нет
+        self.assertEqual([row[3] for row in rows], [january, 11])
+        self.assertEqual(report.totals("outflow")[2], january + 11)
+
+    def test_csv(self):
+        response = self.get_report(format="csv", measure="inflow")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        content = response.content.decode("utf-8")
+        self.assertTrue(content.startswith("\ufeff"))
+        rows = list(csv.reader(io.StringIO(content[1:])))
+        food, salary = self.flows(self.cafe), self.flows(self.advance)
+        self.assertEqual(
+            rows,
+            [
+                ["Месяц", "Еда", "Зарплата", "Приход", "Расход", "Итого"],
+                [
+                    "2024-01",
+                    "0.00",
+                    str(salary),
+                    str(salary),
+                    str(food),
+                    str(salary - food),
+                ],
+                [
+                    "Всего",
+                    "0.00",
+                    str(salary),
+                    str(salary),
+                    str(food),
+                    str(salary - food),
+                ],
+            ],
+        )
+
+    def test_cached_report_follows_statement_writes(self):
+        net = self.get_report().context["totals"][-1]
+        self.add_statement(date(2024, 1, 20), 250)
+        self.assertEqual(self.get_report().context["totals"][-1], net - 250)
+
+    def test_form_validation(self):
+        for month_from, month_to, valid in (
+            ("2024-02", "2024-01", False),
+            ("2000-01", "2019-12", True),
+            ("2000-01", "2020-01", False),
+        ):
+            with self.subTest(month_from=month_from, month_to=month_to):
+                response = self.get_report(month_from=month_from, month_to=month_to)
+                self.assertEqual(response.context["form"].is_valid(), valid)
+                self.assertEqual("report" in response.context, valid)
+
+
+class BalanceTests(StatementTestCase):
+    def setUp(self):
+        super().setUp()
+        # Дробные суммы в соседних месяцах: в SQLite они складываются во float
+        for i, (custom_date, amount) in enumerate(
+            [
+                (date(2023, 12, 31), "0.10"),
+                (date(2024, 1, 3), "0.20"),
+                (date(2024, 1, 3), "0.70"),
+                (date(2024, 2, 1), "1234.56"),
+                (date(2024, 2, 1), "0.01"),
+            ]
+        ):
+            subcategory = self.advance if i % 2 else self.cafe
+            with self.captureOnCommitCallbacks(execute=True):
+                CashFlowStatement.objects.create(
+                    user=self.user,
+                    custom_date=custom_date,
+                    type=subcategory.category.type,
+                    category=subcategory.category,
+                    subcategory=subcategory,
+                    status=self.business,
+                    amount=Decimal(amount),
+                )
+
+    def expected_balances(self):
+        """Остатки перебором: накопленная сумма в порядке (custom_date, id)"""
+        balances = {}
+        balance = Decimal("0.00")
+        for statement in self.statements().order_by("custom_date", "id"):
+            if statement.type_id == self.income.pk:
+                balance += statement.amount
+            else:
+                balance -= statement.amount
+            balances[statement.pk] = balance
+        return balances
+
+    def list_balances(self, mode, **params):
+        params["per_page"] = 4
+        balances = {}
+        with override_settings(DDS_LIST_PAGINATION=mode):
+            while True:
+                response = self.client.get(reverse("dds-list"), params)
+                for obj in response.context["dds_list"]:
+                    balances[obj.pk] = obj.balance
+                page = response.context["page_obj"]
+                if not page.has_next():
+                    return balances
+                self.assertLess(len(balances), self.statement_count + 5)
+                if mode == "keyset":
+                    params["cursor"] = page.next_cursor
+                else:
+                    params["page"] = page.next_page_number()
+
+    def test_balances_match_running_sum(self):
+        expected = self.expected_balances()
+        for mode in ("offset", "keyset", "cached"):
+            for sort in ("-date", "date", "amount", "-category", "status"):
+                with self.subTest(mode=mode, sort=sort):
+                    cache.clear()
+                    balances = self.list_balances(mode, sort=sort)
+                    self.assertEqual(balances, expected)
+                    # Остаток - сумма в копейках, без хвостов float
+                    self.assertEqual(
+                        {balance.as_tuple().exponent for balance in balances.values()},
+                        {-2},
+                    )
+
+    def test_balances_ignore_date_filter(self):
+        expected = self.expected_balances()
+        for mode in ("offset", "keyset", "cached"):
+            with self.subTest(mode=mode):
+                balances = self.list_balances(
+                    mode, custom_date_from="2024-01-03", custom_date_to="2024-01-31"
+                )
+                filtered = self.statements().filter(
+                    custom_date__gte=date(2024, 1, 3),
+                    custom_date__lte=date(2024, 1, 31),
+                )
+                self.assertEqual(
+                    balances,
+                    {pk: expected[pk] for pk in filtered.values_list("pk", flat=True)},
+                )
+
+
+class FilterSessionTests(StatementTestCase):
+    def get_list(self, **params):
+        response = self.client.get(reverse("dds-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_session_saved_only_when_filter_changes(self):
+        response = self.get_list(status=self.business.pk)
+        self.assertTrue(response.wsgi_request.session.modified)
+        self.assertEqual(
+            self.client.session["dds_filter"], {"status": str(self.business.pk)}
+        )
+
+        # Тот же фильтр, переход по страницам и просмотр без параметров (фильтр
+        # из сессии) сессию не перезаписывают
+        for params in (
+            {"status": self.business.pk},
+            {"status": self.business.pk, "page": 2, "per_page": 5},
+            {},
+        ):
+            with self.subTest(params=params):
+                response = self.get_list(**params)
+                self.assertFalse(response.wsgi_request.session.modified)
+
+        response = self.get_list(status=self.personal.pk, comment="запись")
+        self.assertTrue(response.wsgi_request.session.modified)
+        self.assertEqual(
+            self.client.session["dds_filter"]["status"], str(self.personal.pk)
+        )
+
+    def test_presets_belong_to_user(self):
+        self.get_list(status=self.business.pk)
+        other_preset = FilterPreset.objects.create(
+            user=self.other, name="Бизнес", params={"status": "0"}
+        )
+        response = self.client.post(reverse("save-filter-preset"), {"name": "Бизнес"})
+        self.assertRedirects(response, reverse("dds-list"))
+        preset = FilterPreset.objects.get(user=self.user, name="Бизнес")
+        self.assertEqual(preset.params, {"status": str(self.business.pk)})
+        other_preset.refresh_from_db()
+        self.assertEqual(other_preset.params, {"status": "0"})
+        self.assertEqual(list(self.get_list().context["filter_presets"]), [preset])
+
+        # Чужой фильтр удалить нельзя, свой - можно
+        url = reverse("delete-filter-preset", args=[other_preset.pk])
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertTrue(FilterPreset.objects.filter(pk=other_preset.pk).exists())
+        url = reverse("delete-filter-preset", args=[preset.pk])
+        self.assertRedirects(self.client.post(url), reverse("dds-list"))
+        self.assertFalse(FilterPreset.objects.filter(pk=preset.pk).exists())
+
+
+@override_settings(DDS_REPLICA_DB="replica")
+class ReplicaRoutingTests(StatementTestCase):
+    def get_routed(self, name, args=(), **params):
+        """
+        Запрос с перечнем БД, выбранных роутером для чтений. Отдельной реплики в
+        тестах нет, поэтому сами чтения выполняются в основной БД
+        """
+        reads = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record_read(router, model, **hints):
+            reads.append(db_for_read(router, model, **hints))
+            return PRIMARY
+
+        with mock.patch.object(ReplicaRouter, "db_for_read", record_read):
+            response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200)
+        return reads
+
+    def test_replica_views_read_replica(self):
+        self.assertIn("replica", self.get_routed("dds-list"))
+        self.assertIn("replica", self.get_routed("cashflow-report"))
+        # Страница не из DDS_REPLICA_VIEWS читает основную БД
+        statement = self.statements().first()
+        reads = self.get_routed("update-dds", args=[statement.pk])
+        self.assertTrue(reads)
+        self.assertNotIn("replica", reads)
+
+    def test_writes_go_to_primary_and_stick(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("create-dds"),
+                self.statement_data(self.advance, comment="новая"),
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(
+            CashFlowStatement.objects.using(PRIMARY)
+            .filter(user=self.user, comment="новая")
+            .exists()
+        )
+        # После записи пользователь читает основную БД, пока не истечёт закрепление
+        self.assertNotIn("replica", self.get_routed("dds-list"))
+        cache.clear()
+        self.assertIn("replica", self.get_routed("dds-list"))
+
+    def test_reads_after_write_in_request_go_to_primary(self):
+        router = ReplicaRouter()
+        state = RoutingState()
+        state.read_db = "replica"
+        token = current_routing.set(state)
+        try:
+            self.assertEqual(router.db_for_read(CashFlowStatement), "replica")
+            self.assertEqual(router.db_for_write(CashFlowStatement), PRIMARY)
+            self.assertTrue(state.wrote)
+            self.assertEqual(router.db_for_read(CashFlowStatement), PRIMARY)
+        finally:
+            current_routing.reset(token)
@@ -1,28 +1,68 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import (CashFlowStatementFilterListView,
+from .api_views import (ApiReferenceBatchView, ApiReferenceListView,
+                        ApiStatementBatchView, ApiStatementListView)
+from .async_views import (AsyncCashFlowStatementFilterListView,
+                          AsyncCategoryAutocomplete,
+                          AsyncSubcategoryAutocomplete)
+from .views import (CashFlowReportView, CashFlowStatementBulkView,
+                    CashFlowStatementExportView,
+                    CashFlowStatementFilterListView,
                     CashFlowStatementFilterReset, CategoryAutocomplete,
                     CreateCashFlowStatementView, DeleteCashFlowStatementView,
+                    FilterPresetDeleteView, FilterPresetSaveView,
+                    ImportCashFlowStatementView, MetricsView,
                     ReferenceCreateView, ReferenceDeleteView,
-                    ReferenceListView, ReferencesView, ReferenceUpdateView,
-                    SubcategoryAutocomplete, UpdateCashFlowStatementView)
+                    ReferenceListView, ReferencesView, ReferenceTreeView,
+                    ReferenceUpdateView, SubcategoryAutocomplete,
+                    UpdateCashFlowStatementView)
+
+# Под ASGI самые частые запросы обслуживаются асинхронными вариантами представлений
+if settings.DDS_ASYNC_VIEWS:
+    list_view = AsyncCashFlowStatementFilterListView
+    category_autocomplete = AsyncCategoryAutocomplete
+    subcategory_autocomplete = AsyncSubcategoryAutocomplete
+else:
+    list_view = CashFlowStatementFilterListView
+    category_autocomplete = CategoryAutocomplete
+    subcategory_autocomplete = SubcategoryAutocomplete
 
 urlpatterns = [
     path(
         "category-autocomplete/",
-        CategoryAutocomplete.as_view(),
+        category_autocomplete.as_view(),
         name="category-autocomplete",
     ),
     path(
         "subcategory-autocomplete/",
-        SubcategoryAutocomplete.as_view(),
+        subcategory_autocomplete.as_view(),
         name="subcategory-autocomplete",
     ),
-    path("", CashFlowStatementFilterListView.as_view(), name="dds-list"),
+    path(
+        "reference-tree/",
+        ReferenceTreeView.as_view(),
+        name="reference-tree",
+    ),
+    path("", list_view.as_view(), name="dds-list"),
+    path("export-dds/", CashFlowStatementExportView.as_view(), name="export-dds"),
     path(
         "reset-filters/", CashFlowStatementFilterReset.as_view(), name="reset-filters"
     ),
+    path(
+        "filter-presets/save/",
+        FilterPresetSaveView.as_view(),
+        name="save-filter-preset",
+    ),
+    path(
+        "filter-presets/<int:pk>/delete/",
+        FilterPresetDeleteView.as_view(),
+        name="delete-filter-preset",
+    ),
+    path("bulk-dds/", CashFlowStatementBulkView.as_view(), name="bulk-dds"),
+    path("report/", CashFlowReportView.as_view(), name="cashflow-report"),
     path("create-dds/", CreateCashFlowStatementView.as_view(), name="create-dds"),
+    path("import-dds/", ImportCashFlowStatementView.as_view(), name="import-dds"),
     path(
         "update-dds/<int:pk>/", UpdateCashFlowStatementView.as_view(), name="update-dds"
     ),
@@ -46,4 +86,21 @@ urlpatterns = [
         ReferenceDeleteView.as_view(),
         name="reference-delete",
     ),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("api/statements/", ApiStatementListView.as_view(), name="api-statements"),
+    path(
+        "api/statements/batch/",
+        ApiStatementBatchView.as_view(),
+        name="api-statements-batch",
+    ),
+    path(
+        "api/references/<str:model>/",
+        ApiReferenceListView.as_view(),
+        name="api-references",
+    ),
+    path(
+        "api/references/<str:model>/batch/",
+        ApiReferenceBatchView.as_view(),
+        name="api-references-batch",
+    ),
 ]
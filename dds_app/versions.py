@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Области версионирования данных пользователя
+REFERENCES = "refs"
+STATEMENTS = "statements"
+
+
+def _version_key(scope, user_id):
+    return f"dds:{scope}:version:{user_id}"
+
+
+def get_version(scope, user_id):
+    """
+    Текущая версия данных пользователя в области scope. Если счётчик вытеснен из кэша,
+    он начинается с метки времени, чтобы не совпасть со старыми версиями.
+    """
+    key = _version_key(scope, user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(scope, user_id):
+    """Асинхронный вариант get_version"""
+    key = _version_key(scope, user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns() // 1000, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(scope, user_id):
+    """Меняем версию после фиксации транзакции, инвалидируя всё, что от неё зависит"""
+    key = _version_key(scope, user_id)
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns() // 1000, timeout=None)
+
+    transaction.on_commit(bump)
@@ -1,42 +1,121 @@
-from dal import autocomplete
-from django.apps import apps
+import csv
+import hashlib
+import json
+from datetime import timedelta
+
+from dal.views import ViewMixin
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import redirect
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.decorators import method_decorator
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views import View
-from django.views.generic import (CreateView, DeleteView, ListView,
+from django.views.decorators.cache import never_cache
+from django.views.generic import (CreateView, DeleteView, FormView, ListView,
                                   TemplateView, UpdateView)
 
-from .forms import (CashFlowStatementFilterForm, CashFlowStatementForm,
+from .archive import get_archive_bound
+from .balances import (attach_balances, first_month, get_checkpoints,
+                       running_queryset)
+from .bulk import ACTION_CHOICES, bulk_change
+from .forms import (CashFlowReportForm, CashFlowStatementBulkForm,
+                    CashFlowStatementFilterForm, CashFlowStatementForm,
+                    CashFlowStatementImportForm, FilterPresetForm,
                     get_reference_form)
-from .models import CashFlowStatement, Category, Subcategory
-
-
-class ReferenceDeleteView(LoginRequiredMixin, DeleteView):
-    """Универсальное представление удаления справочника"""
-
-    template_name = "dds_app/ref_delete.html"
-    context_object_name = "ref"
+from .importers import import_file
+from .metrics import render_metrics
+from .models import CashFlowStatement, FilterPreset, StatementWithArchive
+from .pagination import (CachedCountPaginator, InvalidCursor, KeysetPaginator,
+                         PageSnapshot, reverse_ordering)
+from .reference_cache import (REFERENCE_MODELS, REFERENCE_PARENTS,
+                              filter_by_name, filter_by_parent,
+                              get_reference_version, get_references,
+                              reference_tree)
+from .reports import get_monthly_report
+from .search import SEARCH_CONTAINS, search_comments
+from .versions import STATEMENTS, get_version
+
+# GET-параметры пагинации, сортировки и выгрузки, не относящиеся к фильтрации
+SERVICE_PARAMS = ("page", "cursor", "per_page", "format", "sort")
+
+# Допустимые ключи сортировки таблицы (по возрастанию, "-ключ" - по убыванию).
+# Каждый порядок заканчивается id, поэтому он устойчив и подходит для
+# keyset-пагинации; дата и сумма совпадают с индексами (user, ...) записей.
+# Справочные колонки сортируются по названию справочника (JOIN уже есть в
+# select_related), id справочника разделяет одинаковые названия
+SORT_ORDERINGS = {
+    "date": ("custom_date", "id"),
+    "amount": ("amount", "id"),
+    "type": ("type__name", "type_id", "-custom_date", "-id"),
+    "category": ("category__name", "category_id", "-custom_date", "-id"),
+    "subcategory": ("subcategory__name", "subcategory_id", "-custom_date", "-id"),
+    "status": ("status__name", "status_id", "-custom_date", "-id"),
+}
+DEFAULT_SORT = "-date"
+
+
+def sort_ordering(sort):
+    """
+    Порядок полей для ключа сортировки: "amount" по возрастанию,
+    "-amount" по убыванию
+    """
+    ordering = SORT_ORDERINGS[sort.lstrip("-")]
+    return reverse_ordering(ordering) if sort.startswith("-") else ordering
+
+
+class ReferenceMixin(LoginRequiredMixin):
+    """
+    Общая часть универсальных представлений справочников: модель из URL,
+    записи только текущего пользователя, связанные справочники - одним JOIN
+    """
+
+    def get_model(self):
+        try:
+            return REFERENCE_MODELS[self.kwargs["model"]]
+        except KeyError:
+            raise Http404
 
     def get_queryset(self):
-        model = apps.get_model("dds_app", self.kwargs["model"])
-        return model.objects.filter(user=self.request.user)
-
-    def get_success_url(self):
-        return reverse_lazy("reference-list", kwargs={"model": self.kwargs["model"]})
+        model = self.get_model()
+        related = [
+            field.name
+            for field in model._meta.fields
+            if field.many_to_one and field.name != "user"
+        ]
+        return model.objects.filter(user=self.request.user).select_related(*related)
 
     def get_context_data(self, **kwargs):
         # Передаём имя модели для отображения
         context = super().get_context_data(**kwargs)
         context["model"] = self.kwargs["model"]
-        context["model_verbose"] = apps.get_model(
-            "dds_app", self.kwargs["model"]
-        )._meta.verbose_name
+        context["model_verbose"] = self.get_model()._meta.verbose_name
         return context
 
+    def get_success_url(self):
+        return reverse_lazy("reference-list", kwargs={"model": self.kwargs["model"]})
+
 
-class ReferenceUpdateView(LoginRequiredMixin, UpdateView):
+class ReferenceDeleteView(ReferenceMixin, DeleteView):
+    """Универсальное представление удаления справочника"""
+
+    template_name = "dds_app/ref_delete.html"
+    context_object_name = "ref"
+
+
+class ReferenceUpdateView(ReferenceMixin, UpdateView):
     """Универсальное представление редактирования справочника"""
 
     template_name = "dds_app/ref_form.html"
@@ -44,10 +123,6 @@ class ReferenceUpdateView(LoginRequiredMixin, UpdateView):
     def get_form_class(self):
         return get_reference_form(self.kwargs["model"])
 
-    def get_object(self, queryset=None):
-        model = apps.get_model("dds_app", self.kwargs["model"])
-        return get_object_or_404(model, pk=self.kwargs["pk"])
-
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         # Безопасно подаём user в форму
@@ -55,20 +130,8 @@ class ReferenceUpdateView(LoginRequiredMixin, UpdateView):
         kwargs["initial"]["user"] = self.request.user
         return kwargs
 
-    def get_context_data(self, **kwargs):
-        # Передаём имя модели для отображения
-        context = super().get_context_data(**kwargs)
-        context["model"] = self.kwargs["model"]
-        context["model_verbose"] = apps.get_model(
-            "dds_app", self.kwargs["model"]
-        )._meta.verbose_name
-        return context
-
-    def get_success_url(self):
-        return reverse_lazy("reference-list", kwargs={"model": self.kwargs["model"]})
-
 
-class ReferenceCreateView(LoginRequiredMixin, CreateView):
+class ReferenceCreateView(ReferenceMixin, CreateView):
     """Универсальное представление создания справочника"""
 
     template_name = "dds_app/ref_form.html"
@@ -88,37 +151,45 @@ class ReferenceCreateView(LoginRequiredMixin, CreateView):
         kwargs["initial"]["user"] = self.request.user
         return kwargs
 
-    def get_context_data(self, **kwargs):
-        # Передаём имя модели для отображения
-        context = super().get_context_data(**kwargs)
-        context["model"] = self.kwargs["model"]
-        context["model_verbose"] = apps.get_model(
-            "dds_app", self.kwargs["model"]
-        )._meta.verbose_name
-        return context
-
-    def get_success_url(self):
-        return reverse_lazy("reference-list", kwargs={"model": self.kwargs["model"]})
-
 
-class ReferenceListView(LoginRequiredMixin, ListView):
+class ReferenceListView(ReferenceMixin, ListView):
     """Отображение любой из модели справочников"""
 
     template_name = "dds_app/ref_list.html"
     context_object_name = "ref_list"
+    paginate_by = 50
 
     def get_queryset(self):
-        model = apps.get_model("dds_app", self.kwargs["model"])
-        return model.objects.filter(user=self.request.user)
+        model = self.get_model()
+        # Число использующих записей - коррелированным подзапросом по индексу
+        # (user, fk, ...);
+        # он считается только для строк текущей страницы. Архивные записи тоже
+        # держат справочник (PROTECT), поэтому считаем по обеим таблицам
+        field = next(
+            field.name
+            for field in StatementWithArchive._meta.fields
+            if field.related_model is model
+        )
+        usage = (
+            StatementWithArchive.objects.filter(
+                user=OuterRef("user"), **{field: OuterRef("pk")}
+            )
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return (
+            super()
+            .get_queryset()
+            .annotate(usage_count=Coalesce(Subquery(usage), 0))
+            .order_by(*model._meta.ordering, "pk")
+        )
 
     def get_context_data(self, **kwargs):
-        # Передаём имя модели для отображения
         context = super().get_context_data(**kwargs)
-        model = apps.get_model("dds_app", self.kwargs["model"])
-        context["model"] = self.kwargs["model"]
-        context["model_verbose"] = apps.get_model(
-            "dds_app", self.kwargs["model"]
-        )._meta.verbose_name_plural
+        model = self.get_model()
+        context["model_verbose"] = model._meta.verbose_name_plural
         # Убираем лишние поля в отображении
         context["fields"] = [
             field
@@ -151,6 +222,15 @@ class UpdateCashFlowStatementView(LoginRequiredMixin, UpdateView):
     template_name = "dds_app/update_dds.html"
     success_url = reverse_lazy("dds-list")
 
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        # Передаём user для формы: без него справочные поля не получают вариантов
+        kwargs["user"] = self.request.user
+        return kwargs
+
 
 class CreateCashFlowStatementView(LoginRequiredMixin, CreateView):
     """Создание ДДС-записи"""
@@ -172,45 +252,190 @@ class CreateCashFlowStatementView(LoginRequiredMixin, CreateView):
         return kwargs
 
 
+class ImportCashFlowStatementView(LoginRequiredMixin, FormView):
+    """Пакетный импорт ДДС-записей из файла"""
+
+    form_class = CashFlowStatementImportForm
+    template_name = "dds_app/import_dds.html"
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        # Передаём user для формы
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        defaults = {
+            field: form.cleaned_data.get(field)
+            for field in ("type", "category", "subcategory", "status")
+        }
+        report = import_file(
+            form.cleaned_data["file"],
+            self.request.user,
+            file_format=form.cleaned_data.get("file_format") or None,
+            defaults=defaults,
+        )
+        return self.render_to_response(self.get_context_data(form=form, report=report))
+
+
+def normalize_filter(data):
+    """
+    Фильтр без пустых значений (и без режима поиска, если нет комментария):
+    в таком виде он хранится в сессии и сохранённых фильтрах
+    """
+    data = {key: value for key, value in data.items() if value != ""}
+    if "comment" not in data:
+        data.pop("comment_mode", None)
+    return data
+
+
 class CashFlowStatementFilterReset(LoginRequiredMixin, View):
     """Сброс фильтров"""
 
     def get(self, request):
-        # Очищаем сессию и редерикс на главную
-        self.request.session["dds_filter"] = {}
+        # Очищаем сессию (только если в ней есть фильтр) и редерикс на главную
+        if self.request.session.get("dds_filter"):
+            del self.request.session["dds_filter"]
         return redirect("dds-list")
 
 
-class CashFlowStatementFilterListView(LoginRequiredMixin, ListView):
-    """Отображение списка ДДС-записей с фильтрацией"""
+class CashFlowStatementBulkView(LoginRequiredMixin, View):
+    """
+    Массовые действия над выбранными записями: удаление, статус, перенос,
+    сдвиг дат
+    """
 
-    model = CashFlowStatement
-    template_name = "dds_app/dds_list.html"
-    context_object_name = "dds_list"
-    paginate_by = 10  # По умолчанию
+    def post(self, request):
+        form = CashFlowStatementBulkForm(request.POST, user=request.user)
+        if form.is_valid():
+            data = form.cleaned_data
+            count = bulk_change(
+                request.user,
+                data["ids"],
+                data["action"],
+                status=data.get("status"),
+                subcategory=data.get("subcategory"),
+                category=data.get("category"),
+                days=data.get("days") or 0,
+            )
+            messages.success(
+                request, f"{dict(ACTION_CHOICES)[data['action']]}: записей {count}"
+            )
+        else:
+            for errors in form.errors.values():
+                for error in errors:
+                    messages.error(request, error)
+        # Возвращаемся на ту же страницу списка
+        next_url = request.POST.get("next")
+        if not url_has_allowed_host_and_scheme(
+            next_url,
+            allowed_hosts={request.get_host()},
+            require_https=request.is_secure(),
+        ):
+            next_url = reverse("dds-list")
+        return redirect(next_url)
+
+
+class FilterPresetSaveView(LoginRequiredMixin, View):
+    """Сохранение текущего фильтра под названием (одноимённый перезаписывается)"""
+
+    def post(self, request):
+        form = FilterPresetForm(request.POST)
+        if form.is_valid():
+            FilterPreset.objects.update_or_create(
+                user=request.user,
+                name=form.cleaned_data["name"],
+                defaults={"params": request.session.get("dds_filter", {})},
+            )
+        return redirect("dds-list")
 
-    def get_paginate_by(self, queryset):
-        # Считываем пользовательское количество записей на странице
-        try:
-            per_page = int(self.request.GET.get("per_page", self.paginate_by))
-            return max(per_page, 1)  # Минимум 1
-        except ValueError:
-            return self.paginate_by
+
+class FilterPresetDeleteView(LoginRequiredMixin, DeleteView):
+    """Удаление сохранённого фильтра"""
+
+    http_method_names = ["post"]
+    success_url = reverse_lazy("dds-list")
 
     def get_queryset(self):
-        user = self.request.user
-        qs = (
-            CashFlowStatement.objects.filter(user=user)
-            .select_related("status", "category", "type", "subcategory")
-            .order_by("-custom_date")
-        )
+        return FilterPreset.objects.filter(user=self.request.user)
+
+
+class CashFlowStatementFilterMixin:
+    """Общая фильтрация ДДС-записей: для таблицы и для выгрузки"""
+
+    # Заранее загруженные справочники пользователя (async-представления),
+    # иначе - из кэша
+    references = None
+
+    def get_sort(self):
+        """Ключ сортировки из запроса, если он разрешён"""
+        sort = self.request.GET.get("sort", "")
+        return sort if sort.lstrip("-") in SORT_ORDERINGS else None
 
+    def get_filter_data(self):
         # Получим данные фильтрации -> они будут из запроса или из сессии -> или пустой словарь
-        data = self.request.GET or self.request.session.get("dds_filter", {})
+        # Служебные параметры фильтром не считаются, иначе переход по страницам
+        # сбросит фильтры
+        return {
+            key: value
+            for key, value in self.request.GET.items()
+            if key not in SERVICE_PARAMS
+        } or self.get_saved_filter()
+
+    def get_saved_filter(self):
+        """Фильтр, сохранённый в сессии"""
+        return self.request.session.get("dds_filter", {})
+
+    def get_changed_filter(self):
+        """
+        Нормализованный фильтр, если его нужно записать в сессию, иначе None.
+        Сессия меняется только при смене фильтра, а не на каждый просмотр страницы
+        """
+        if not self.filter_form.is_valid():
+            return None
+        filter_data = normalize_filter(self.filter_data)
+        return None if filter_data == self.get_saved_filter() else filter_data
+
+    def get_data_version(self):
+        return get_version(STATEMENTS, self.request.user.pk)
+
+    def get_archive_bound(self):
+        """Последняя дата в архиве пользователя или None, если архив пуст"""
+        return get_archive_bound(self.request.user.pk, self.get_data_version())
+
+    def get_statement_model(self, custom_date_from):
+        """
+        Архив читаем, только если фильтр по дате до него дотягивается;
+        иначе запрос идёт в основную таблицу с её индексами
+        """
+        bound = self.get_archive_bound()
+        if bound is not None and (
+            custom_date_from is None or custom_date_from <= bound
+        ):
+            return StatementWithArchive
+        return CashFlowStatement
+
+    def get_filtered_queryset(self):
+        user = self.request.user
+        self.sort = self.get_sort()
+        ordering = sort_ordering(self.sort or DEFAULT_SORT)
+        self.list_ordering = ordering
+        self.filter_data = self.get_filter_data()
 
         # Получаем из формы данные для фильтрации
-        form = CashFlowStatementFilterForm(data=data, user=user)
-        if form.is_valid():
+        form = CashFlowStatementFilterForm(
+            data=self.filter_data, user=user, references=self.references
+        )
+        valid = form.is_valid()
+        model = self.get_statement_model(
+            form.cleaned_data.get("custom_date_from") if valid else None
+        )
+        qs = (
+            model.objects.filter(user=user)
+            .select_related("status", "category", "type", "subcategory")
+            .order_by(*ordering)
+        )
+        if valid:
             custom_date_from = form.cleaned_data.get("custom_date_from")
             custom_date_to = form.cleaned_data.get("custom_date_to")
             type = form.cleaned_data.get("type")
@@ -220,6 +445,7 @@ class CashFlowStatementFilterListView(LoginRequiredMixin, ListView):
             amount_min = form.cleaned_data.get("amount_min")
             amount_max = form.cleaned_data.get("amount_max")
             comment = form.cleaned_data.get("comment")
+            comment_mode = form.cleaned_data.get("comment_mode") or SEARCH_CONTAINS
 
             # Фильтруем поля
             if custom_date_from:
@@ -239,51 +465,402 @@ class CashFlowStatementFilterListView(LoginRequiredMixin, ListView):
             if amount_max:
                 qs = qs.filter(amount__lte=amount_max)
             if comment:
-                qs = qs.filter(comment__icontains=comment)
-
-            # Сохраняем фильтры в сессию
-            self.request.session["dds_filter"] = self.request.GET.dict()
+                qs, ranked = search_comments(qs, comment, comment_mode)
+                # Найденное по словам показываем в порядке релевантности,
+                # если не выбрана сортировка
+                if ranked and self.sort is None:
+                    self.list_ordering = ("-search_rank",) + ordering
+                    qs = qs.order_by(*self.list_ordering)
 
         self.filter_form = form
         return qs
 
+
+class CashFlowStatementListMixin(CashFlowStatementFilterMixin):
+    """Общая часть синхронного и асинхронного списка ДДС-записей"""
+
+    model = CashFlowStatement
+    template_name = "dds_app/dds_list.html"
+    context_object_name = "dds_list"
+    paginate_by = 10  # По умолчанию
+
+    def get_pagination_mode(self):
+        return settings.DDS_LIST_PAGINATION
+
+    def add_balances(self, rows):
+        """Остаток после каждой записи страницы: контрольная точка месяца и дельта"""
+        month = first_month(rows)
+        if month is None:
+            return
+        user_id = self.request.user.pk
+        references = self.references or get_references(self.request.user)
+        checkpoints = get_checkpoints(user_id, self.get_data_version(), references)
+        running = dict(
+            running_queryset(self.get_statement_model(month), user_id, rows, references)
+        )
+        attach_balances(rows, checkpoints, running)
+
+    def get_filter_presets(self):
+        """Сохранённые фильтры пользователя для панели над таблицей"""
+        return list(self.request.user.filter_presets.all())
+
+    def get_filter_digest(self):
+        """Хэш нормализованного фильтра для ключей кэша"""
+        data = (
+            dict(self.filter_form.cleaned_data) if self.filter_form.is_valid() else {}
+        )
+        if not data.get("comment"):
+            data.pop("comment_mode", None)
+        normalized = sorted(
+            (name, getattr(value, "pk", value))
+            for name, value in data.items()
+            if value not in (None, "")
+        )
+        return hashlib.md5(
+            json.dumps(normalized, cls=DjangoJSONEncoder).encode()
+        ).hexdigest()
+
+    def get_count_cache_key(self):
+        """Ключ кэша числа записей: версия данных пользователя и фильтр"""
+        return (
+            f"dds:count:{self.request.user.pk}:{self.get_data_version()}:"
+            f"{self.get_filter_digest()}"
+        )
+
+    def get_reference_version(self):
+        if self.references is not None:
+            return self.references.version
+        return get_reference_version(self.request.user.pk)
+
+    def get_page_cache_key(self, page_size):
+        """
+        Ключ кэша страницы: версии записей и справочников пользователя (любое их
+        изменение делает старые ключи недостижимыми), фильтр, сортировка и страница
+        """
+        mode = self.get_pagination_mode()
+        position = self.request.GET.get(
+            "cursor" if mode == "keyset" else self.page_kwarg, ""
+        )
+        page = json.dumps([mode, self.list_ordering, page_size, position])
+        return (
+            f"dds:page:{self.request.user.pk}:{self.get_data_version()}:"
+            f"{self.get_reference_version()}:{self.get_filter_digest()}:"
+            f"{hashlib.md5(page.encode()).hexdigest()}"
+        )
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        if self.get_pagination_mode() != "cached":
+            return super().get_paginator(queryset, per_page, **kwargs)
+        # Номера страниц, но без COUNT(*) по всей выборке на каждый запрос
+        return CachedCountPaginator(
+            queryset,
+            per_page,
+            cache_key=self.get_count_cache_key(),
+            count_limit=settings.DDS_LIST_COUNT_LIMIT,
+            **kwargs,
+        )
+
+    def get_paginate_by(self, queryset):
+        # Считываем пользовательское количество записей на странице
+        try:
+            per_page = int(self.request.GET.get("per_page", self.paginate_by))
+            return max(per_page, 1)  # Минимум 1
+        except ValueError:
+            return self.paginate_by
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Передадим в шаблон фильтрационную форму или создадим новую пустую
         context["filter_form"] = getattr(
             self, "filter_form", CashFlowStatementFilterForm(user=self.request.user)
         )
+        context["pagination_mode"] = self.get_pagination_mode()
+        context["filter_presets"] = self.get_filter_presets()
+        context["preset_form"] = FilterPresetForm()
+        context["bulk_form"] = CashFlowStatementBulkForm(
+            user=self.request.user, references=self.references
+        )
+        context["sort"] = self.sort or (
+            DEFAULT_SORT if self.list_ordering[0] != "-search_rank" else None
+        )
         return context
 
 
-# Фильтрует список подкатегорий в зависимости от категории
-class SubcategoryAutocomplete(autocomplete.Select2QuerySetView):
-    """Динамическая подгрузка подкатегорий"""
+class CashFlowStatementFilterListView(
+    LoginRequiredMixin, CashFlowStatementListMixin, ListView
+):
+    """Отображение списка ДДС-записей с фильтрацией"""
 
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Subcategory.objects.none()
+    def paginate_queryset(self, queryset, page_size):
+        # Повторный просмотр неизменившейся страницы не обращается к таблице записей
+        timeout = settings.DDS_PAGE_CACHE_TIMEOUT
+        key = self.get_page_cache_key(page_size) if timeout else None
+        snapshot = cache.get(key) if key else None
+        if snapshot is None:
+            snapshot = PageSnapshot(self.paginate_uncached(queryset, page_size)[1])
+            self.add_balances(snapshot.object_list)
+            if key:
+                cache.set(key, snapshot, timeout)
+        return snapshot.as_paginated()
+
+    def paginate_uncached(self, queryset, page_size):
+        if self.get_pagination_mode() != "keyset":
+            return super().paginate_queryset(queryset, page_size)
+
+        # Keyset-режим: без COUNT(*) и OFFSET, страница ищется по курсору
+        paginator = KeysetPaginator(queryset, page_size, ordering=self.list_ordering)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
 
-        qs = Subcategory.objects.filter(user=self.request.user)
-        category_id = self.forwarded.get("category", None)
-        if category_id:
-            qs = qs.filter(category_id=category_id)
+    def get_queryset(self):
+        qs = self.get_filtered_queryset()
+        # Сохраняем фильтры в сессию
+        filter_data = self.get_changed_filter()
+        if filter_data is not None:
+            self.request.session["dds_filter"] = filter_data
         return qs
 
 
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи в файл"""
+
+    def write(self, value):
+        return value
+
+
+class CashFlowStatementExportView(
+    LoginRequiredMixin, CashFlowStatementFilterMixin, View
+):
+    """Потоковая выгрузка отфильтрованных ДДС-записей в CSV или JSONL"""
+
+    chunk_size = 2000
+    columns = (
+        ("custom_date", "Дата"),
+        ("status__name", "Статус"),
+        ("type__name", "Тип"),
+        ("category__name", "Категория"),
+        ("subcategory__name", "Подкатегория"),
+        ("amount", "Сумма"),
+        ("comment", "Комментарий"),
+    )
+
+    def get(self, request):
+        export_format = request.GET.get("format", "csv")
+        if export_format not in ("csv", "jsonl"):
+            raise Http404("Неизвестный формат выгрузки")
+
+        # Строки читаются уже после выхода из middleware, поэтому БД для чтения
+        # (реплику или основную) фиксируем сейчас
+        queryset = self.get_filtered_queryset()
+        queryset = queryset.using(router.db_for_read(queryset.model))
+        # Только нужные колонки; iterator() читает порциями (в PostgreSQL -
+        # серверным курсором),
+        # поэтому память не растёт с объёмом выгрузки
+        rows = queryset.values_list(*(field for field, _ in self.columns)).iterator(
+            chunk_size=self.chunk_size
+        )
+        if export_format == "csv":
+            content = self.csv_rows(rows)
+            content_type = "text/csv; charset=utf-8"
+        else:
+            content = self.jsonl_rows(rows)
+            content_type = "application/jsonl; charset=utf-8"
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f"dds_{timezone.localdate().isoformat()}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def csv_rows(self, rows):
+        writer = csv.writer(Echo())
+        # BOM, чтобы Excel сразу открыл файл в UTF-8
+        yield "\ufeff" + writer.writerow([title for _, title in self.columns])
+        for row in rows:
+            yield writer.writerow(row)
+
+    def jsonl_rows(self, rows):
+        keys = [field.replace("__name", "") for field, _ in self.columns]
+        for row in rows:
+            yield (
+                json.dumps(
+                    dict(zip(keys, row)), cls=DjangoJSONEncoder, ensure_ascii=False
+                )
+                + "\n"
+            )
+
+
+class CashFlowReportView(LoginRequiredMixin, TemplateView):
+    """Месячный отчёт: сводная таблица по месяцам и справочнику, в HTML или CSV"""
+
+    template_name = "dds_app/report.html"
+    # По умолчанию - последние 12 месяцев по категориям
+    default_months = 12
+
+    def get_form_data(self):
+        today = timezone.localdate()
+        first = today.replace(day=1)
+        for _ in range(self.default_months - 1):
+            first = (first - timedelta(days=1)).replace(day=1)
+        data = {
+            "month_from": f"{first:%Y-%m}",
+            "month_to": f"{today:%Y-%m}",
+            "group": "category",
+            "measure": "net",
+        }
+        data.update(
+            (key, value)
+            for key, value in self.request.GET.items()
+            if key in data and value
+        )
+        return data
+
+    def get(self, request, *args, **kwargs):
+        form = CashFlowReportForm(data=self.get_form_data())
+        context = self.get_context_data(form=form)
+        if form.is_valid():
+            report = get_monthly_report(
+                request.user,
+                form.cleaned_data["month_from"],
+                form.cleaned_data["month_to"],
+                form.cleaned_data["group"],
+            )
+            measure = form.cleaned_data["measure"]
+            if request.GET.get("format") == "csv":
+                return self.render_csv(report, measure)
+            context.update(
+                report=report,
+                rows=report.rows(measure),
+                totals=report.totals(measure),
+            )
+        return self.render_to_response(context)
+
+    def render_csv(self, report, measure):
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        filename = f"dds_report_{timezone.localdate().isoformat()}.csv"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        # BOM, чтобы Excel сразу открыл файл в UTF-8
+        response.write("\ufeff")
+        writer = csv.writer(response)
+        writer.writerow(
+            [
+                "Месяц",
+                *(name for _, name in report.columns),
+                "Приход",
+                "Расход",
+                "Итого",
+            ]
+        )
+        for month, values, inflow, outflow, net in report.rows(measure):
+            writer.writerow([f"{month:%Y-%m}", *values, inflow, outflow, net])
+        values, inflow, outflow, net = report.totals(measure)
+        writer.writerow(["Всего", *values, inflow, outflow, net])
+        return response
+
+
+class ReferenceJSONMixin:
+    """
+    JSON из кэша справочников пользователя. ETag - версия справочников, поэтому
+    повторный запрос без изменений получает 304 без обращения к БД. Если в URL
+    передана текущая версия (?v=), ответ можно кэшировать в браузере на max_age.
+    """
+
+    max_age = 60 * 60
+    cache_control = {}
+
+    def get_data(self, references):
+        raise NotImplementedError
+
+    def get_etag(self, version):
+        return f'"{self.request.user.pk}-{version}"'
+
+    def not_modified(self, version):
+        """Ответ 304, если у клиента уже есть эта версия справочников"""
+        return get_conditional_response(self.request, etag=self.get_etag(version))
+
+    def render_json(self, references):
+        return JsonResponse(
+            self.get_data(references),
+            json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+        )
+
+    def patch_response(self, response, version):
+        response.headers["ETag"] = self.get_etag(version)
+        if self.request.GET.get("v") == str(version):
+            patch_cache_control(
+                response, private=True, max_age=self.max_age, **self.cache_control
+            )
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+
+class ReferenceJSONView(LoginRequiredMixin, ReferenceJSONMixin, View):
+    """Синхронный вариант: справочники и версия читаются из кэша по ходу запроса"""
+
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        version = get_reference_version(request.user.pk)
+        response = self.not_modified(version)
+        if response is None:
+            references = get_references(request.user)
+            version = references.version
+            response = self.render_json(references)
+        return self.patch_response(response, version)
+
+
+class ReferenceAutocompleteMixin:
+    """Автодополнение справочника: только id и название, без пагинации"""
+
+    reference = None
+
+    def get_data(self, references):
+        items = filter_by_parent(
+            references[self.reference],
+            self.reference,
+            self.forwarded.get(REFERENCE_PARENTS[self.reference]),
+        )
+        return {
+            "results": [
+                {"id": obj.pk, "text": obj.name}
+                for obj in filter_by_name(items, self.q)
+            ]
+        }
+
+
+class ReferenceAutocomplete(ViewMixin, ReferenceAutocompleteMixin, ReferenceJSONView):
+    """Автодополнение справочника из кэша; forward и q разбирает dal"""
+
+
+# Фильтрует список подкатегорий в зависимости от категории
+class SubcategoryAutocomplete(ReferenceAutocomplete):
+    """Динамическая подгрузка подкатегорий"""
+
+    reference = "subcategory"
+
+
 # Фильтрует список категорий в зависимости от типа
-class CategoryAutocomplete(autocomplete.Select2QuerySetView):
+class CategoryAutocomplete(ReferenceAutocomplete):
     """Динамическая подгрузка категорий"""
 
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return Category.objects.none()
+    reference = "category"
 
-        qs = Category.objects.filter(user=self.request.user)
-        type_id = self.forwarded.get("type", None)
-        if type_id:
-            qs = qs.filter(type_id=type_id)
-        return qs
+
+class ReferenceTreeView(ReferenceJSONView):
+    """
+    Всё дерево справочников одним ответом для фильтрации списков на клиенте.
+    URL содержит версию, поэтому ответ неизменяем и кэшируется браузером надолго.
+    """
+
+    max_age = 365 * 24 * 60 * 60
+    cache_control = {"immutable": True}
+
+    def get_data(self, references):
+        return reference_tree(references)
 
 
 class RegisterView(CreateView):
@@ -292,3 +869,18 @@ class RegisterView(CreateView):
     form_class = UserCreationForm
     template_name = "registration/register.html"
     success_url = reverse_lazy("login")
+
+
+@method_decorator(never_cache, name="dispatch")
+class MetricsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Метрики запросов процесса в текстовом формате Prometheus, только для персонала"""
+
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "dal",
     "dal_select2",
     "dds_app",
@@ -32,11 +33,13 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    "dds_app.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "dds_app.middleware.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -75,6 +78,43 @@ DATABASES = {
     }
 }
 
+# Реплика для чтения (например, потоковая репликация PostgreSQL): задаётся
+# DB_REPLICA_HOST, остальные параметры по умолчанию как у основной БД. Для проверки
+# на одной машине можно указать вторую локальную БД через DB_REPLICA_NAME
+# и выполнить migrate --database replica
+if os.getenv("DB_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.getenv("DB_REPLICA_NAME", DATABASES["default"]["NAME"]),
+        "USER": os.getenv("DB_REPLICA_USER", DATABASES["default"]["USER"]),
+        "PASSWORD": os.getenv("DB_REPLICA_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        "HOST": os.getenv("DB_REPLICA_HOST"),
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        # В тестах реплика - это та же тестовая БД, что и основная
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["dds_app.routers.ReplicaRouter"]
+
+
+# Кэш (справочники пользователей и пр.). По умолчанию файловый: он общий для всех
+# процессов сервера, поэтому инвалидация по версии видна сразу всем воркерам
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", str(BASE_DIR / ".cache")),
+    }
+}
+
+
+# Сессии читаются из кэша, в БД пишутся только при изменении (вход, смена фильтра).
+# "django.contrib.sessions.backends.cache" совсем убирает сессии из БД, но тогда
+# очистка кэша разлогинивает пользователей
+SESSION_ENGINE = os.getenv(
+    "SESSION_ENGINE", "django.contrib.sessions.backends.cached_db"
+)
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,6 +143,88 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
+# collectstatic кладёт сюда файлы с хэшем содержимого в имени (bootstrap.3f1c….css)
+# и их сжатые копии .gz/.br; веб-сервер отдаёт их с Cache-Control: immutable
+STATIC_ROOT = os.getenv("STATIC_ROOT", BASE_DIR / "staticfiles")
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "dds_app.staticfiles.CompressedManifestStaticFilesStorage"
+    },
+}
 
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Режим пагинации главной таблицы: "offset" (номера страниц), "cached" (номера страниц
+# с кэшированным и ограниченным подсчётом записей) или "keyset" (курсоры)
+DDS_LIST_PAGINATION = os.getenv("DDS_LIST_PAGINATION", "offset")
+# Дальше этого числа записи в режиме "cached" не считаются, выводится оценка
+DDS_LIST_COUNT_LIMIT = int(os.getenv("DDS_LIST_COUNT_LIMIT", 10000))
+
+# Сколько секунд хранить в кэше страницы главной таблицы (0 - не кэшировать). Ключ
+# включает версии записей и справочников пользователя, поэтому изменения видны сразу
+DDS_PAGE_CACHE_TIMEOUT = int(os.getenv("DDS_PAGE_CACHE_TIMEOUT", 300))
+
+# Конфигурация полнотекстового поиска PostgreSQL для комментариев. GIN-индекс создан
+# миграцией 0004 с конфигурацией "russian": при другом значении нужна новая миграция
+# с индексом под него, иначе поиск «По словам» обходится без индекса
+DDS_SEARCH_CONFIG = os.getenv("DDS_SEARCH_CONFIG", "russian")
+
+# Зависимые списки справочников фильтруются на клиенте по дереву, загруженному
+# один раз на страницу
+DDS_AUTOCOMPLETE_PRELOAD = os.getenv("DDS_AUTOCOMPLETE_PRELOAD", "False") == "True"
+
+# Асинхронные представления главной таблицы и автодополнения (для запуска под ASGI)
+DDS_ASYNC_VIEWS = os.getenv("DDS_ASYNC_VIEWS", "False") == "True"
+
+# Бюджет SQL-запросов по имени URL: при превышении MetricsMiddleware пишет
+# предупреждение в лог
+DDS_QUERY_BUDGETS = {
+    "dds-list": 12,
+    "category-autocomplete": 3,
+    "subcategory-autocomplete": 3,
+    "reference-tree": 3,
+    "reference-list": 6,
+    "reference-create": 6,
+    "reference-update": 8,
+    "reference-delete": 8,
+    "login": 8,
+    "cashflow-report": 6,
+    "api-statements": 8,
+    "api-references": 6,
+}
+
+# Размер секции таблицы записей ("month" или "year") для команды
+# partition_statements (PostgreSQL)
+DDS_STATEMENT_PARTITION_INTERVAL = os.getenv(
+    "DDS_STATEMENT_PARTITION_INTERVAL", "month"
+)
+
+# Записи старше этого числа дней команда archive_statements переносит в архив
+DDS_ARCHIVE_AFTER_DAYS = int(os.getenv("DDS_ARCHIVE_AFTER_DAYS", 730))
+
+# Массовое действие передаёт id всех выбранных записей страницы (до 1000) отдельными
+# полями, поэтому стандартного лимита Django в 1000 полей не хватает
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 1100
+
+# Псевдоним реплики для чтения (пусто - читать всё из основной БД) и представления
+# (имена URL), которые только читают данные и могут обслуживаться с реплики
+DDS_REPLICA_DB = os.getenv(
+    "DDS_REPLICA_DB", "replica" if "replica" in DATABASES else ""
+)
+DDS_REPLICA_VIEWS = (
+    "dds-list",
+    "export-dds",
+    "cashflow-report",
+    "category-autocomplete",
+    "subcategory-autocomplete",
+    "reference-tree",
+    "reference-list",
+    "api-statements",
+    "api-references",
+)
+# Сколько секунд после записи пользователь читает основную БД. Должно быть больше
+# отставания реплики: иначе кэши по версии данных могут заполниться старыми строками
+DDS_REPLICA_STICKY_SECONDS = int(os.getenv("DDS_REPLICA_STICKY_SECONDS", 10))
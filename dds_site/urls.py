@@ -1,7 +1,11 @@
+import re
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from django.urls import include, path
+from django.urls import include, path, re_path
 
+from dds_app import staticfiles
 from dds_app.views import RegisterView
 
 urlpatterns = [
@@ -15,3 +19,14 @@ urlpatterns = [
     path("registration/", RegisterView.as_view(), name="register"),
     path("", include("dds_app.urls")),
 ]
+
+if not settings.DEBUG:
+    # Без веб-сервера перед приложением собранную статику отдаёт само приложение:
+    # с DEBUG=True её раздаёт runserver из исходных каталогов
+    urlpatterns.append(
+        re_path(
+            rf"^{re.escape(settings.STATIC_URL.lstrip('/'))}(?P<path>.+)$",
+            staticfiles.serve,
+            name="static",
+        )
+    )
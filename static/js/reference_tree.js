@@ -0,0 +1,56 @@
+/*
+ * Зависимые списки справочников без запросов на каждый ввод:
+ * дерево тип → категория → подкатегория загружается один раз на страницу
+ * (URL с версией справочников кэшируется браузером), а варианты
+ * фильтруются по родителю и названию на клиенте.
+ */
+
+document.addEventListener('dal-init-function', function () {
+
+    var trees = {};
+
+    function loadTree($, url) {
+        if (!trees[url]) {
+            trees[url] = $.ajax({url: url, dataType: 'json', cache: true});
+        }
+        return trees[url];
+    }
+
+    yl.registerFunction('dds-reference-tree', function ($, element) {
+
+        var $element = $(element);
+        var reference = $element.attr('data-reference');
+        var parent = $element.attr('data-reference-parent');
+        var url = $element.attr('data-reference-tree-url');
+
+        function results(tree, params) {
+            var term = (params.term || '').trim().toLowerCase();
+            var forwarded = JSON.parse(yl.getForwards($element) || '{}');
+            var parentId = parent ? forwarded[parent] : null;
+
+            return $.map(tree[reference], function (item) {
+                if (parentId && String(item[2]) !== String(parentId)) {
+                    return null;
+                }
+                if (term && item[1].toLowerCase().indexOf(term) < 0) {
+                    return null;
+                }
+                return {id: item[0], text: item[1]};
+            });
+        }
+
+        $element.select2({
+            placeholder: $element.attr('data-placeholder') || '',
+            language: $element.attr('data-autocomplete-light-language'),
+            allowClear: !$element.is('[required]'),
+            ajax: {
+                transport: function (params, success, failure) {
+                    loadTree($, url).then(function (tree) {
+                        success({results: results(tree, params.data)});
+                    }, failure);
+                    return {abort: function () {}};
+                }
+            }
+        });
+    });
+});